@@ -0,0 +1,180 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Optional
+
+from cache import LruTtlCache, normalize_key
+from similarity import FUNCTION_WORDS, SimilarityIndex, content_words, normalize_tokens
+
+# === КЭШ ОТВЕТОВ НА СВОИ ВОПРОСЫ ===
+#
+# Владельцы похожих бизнесов задают одни и те же вопросы. Ответ, уже
+# сгенерированный для «кофейня у дома» на «как посчитать себестоимость»,
+# отдаётся и «кофейне возле дома» на «Себестоимость как посчитать?» —
+# без classify_question и ask_llm.
+#
+# Ключ — (кластер бизнеса, нормализованный вопрос):
+# - кластер — нормализованное описание первого бизнеса, на который нашёлся
+#   похожий (SimilarityIndex по описаниям, порог business_threshold);
+# - вопрос внутри кластера совпадает, только если совпал набор основ значимых
+#   слов: порядок слов, окончания и предлоги не важны, а любое другое слово —
+#   важно. Мера Жаккара по 3-граммам тут не годится: «снизить налоги законно»
+#   и «… незаконно», «открыть кофейню» и «закрыть кофейню» для неё почти одно.
+# Вопросы, которые опираются на предыдущий разговор («а если дешевле?»,
+# «подробнее про второй пункт»), в кэш не попадают и из него не берутся.
+# Кэш отвечает только на вопросы, уже прошедшие модерацию (handle_custom_question).
+
+_HISTORY_MARKERS_RE = re.compile(
+    r"\b(это|этот|эта|эти|этом|этого|этой|этим|тот|та|те|то же|тоже|такой|такого|таком|так|там|тогда"
+    r"|ещ[её]|подробнее|поподробнее|поясни\w*|уточни\w*|выше|ниже|предыдущ\w*|прошл\w*|ранее|раньше"
+    r"|пункт\w*|шаг\w*|вариант\w*|ты сказал\w*|ты писал\w*|ты ответил\w*|твой|твоем|твоём|твоего)\b",
+    re.UNICODE,
+)
+_LEADING_CONJUNCTION_RE = re.compile(r"^(а|и|но|или|тогда|ну)\b", re.UNICODE)
+
+
+def depends_on_history(question: str) -> bool:
+    """
+    Эвристика: вопрос не самостоятельный, а продолжает разговор —
+    ссылается на прошлый ответ, начинается с «а …»/«и …» или слишком короткий.
+    """
+    text = normalize_key(question)
+    if _LEADING_CONJUNCTION_RE.search(text) or _HISTORY_MARKERS_RE.search(text):
+        return True
+    return len(normalize_tokens(question)) < 2
+
+
+def question_words(question: str) -> FrozenSet[str]:
+    """
+    Основы значимых слов вопроса; «не», «открыть», «хочу» здесь значимы.
+    """
+    return content_words(question, FUNCTION_WORDS)
+
+
+class AnswerCache:
+    """
+    lookup(business, question) -> ответ | None, store(business, question, answer).
+    Сами ответы лежат в LruTtlCache (cache, можно сохранять на диск), индексы
+    кластеров и вопросов пересобираются из его ключей при старте (rebuild_index).
+    """
+
+    def __init__(
+        self,
+        max_size: int = 20000,
+        ttl: float = 3 * 86400,
+        path: Optional[str] = None,
+        business_threshold: float = 0.8,
+        max_per_cluster: int = 500,
+    ) -> None:
+        self.cache = LruTtlCache(max_size=max_size, ttl=ttl, path=path)
+        self.max_per_cluster = max_per_cluster
+        self.clusters = SimilarityIndex(threshold=business_threshold)
+
+        self._lock = threading.Lock()
+        # кластер -> основы слов вопроса -> нормализованный вопрос (в порядке добавления)
+        self._questions: Dict[str, "OrderedDict[FrozenSet[str], str]"] = {}
+        self.counters: Dict[str, int] = {
+            "lookups": 0,
+            "hits": 0,
+            "exact_hits": 0,
+            "similar_hits": 0,
+            "opted_out": 0,
+            "stored": 0,
+        }
+
+    @staticmethod
+    def key(cluster: str, question_key: str) -> str:
+        return f"{cluster}\n{question_key}"
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] += 1
+
+    def _index_question(self, cluster: str, question_key: str) -> None:
+        with self._lock:
+            questions = self._questions.get(cluster)
+            if questions is None:
+                questions = self._questions[cluster] = OrderedDict()
+            words = question_words(question_key)
+            questions[words] = question_key
+            questions.move_to_end(words)
+            while len(questions) > self.max_per_cluster:
+                questions.popitem(last=False)
+
+    def rebuild_index(self) -> None:
+        for key in self.cache.keys():
+            cluster, _, question_key = str(key).partition("\n")
+            if cluster not in self._questions:
+                self.clusters.add(cluster, cluster)
+            self._index_question(cluster, question_key)
+
+    def find_cluster(self, business: str) -> Optional[str]:
+        cluster = normalize_key(business)
+        with self._lock:
+            if cluster in self._questions:
+                return cluster
+        match = self.clusters.query(business)
+        return match[0] if match is not None else None
+
+    def _same_question(self, cluster: str, question_key: str) -> Optional[str]:
+        with self._lock:
+            return (self._questions.get(cluster) or {}).get(question_words(question_key))
+
+    def _forget(self, cluster: str, question_key: str) -> None:
+        words = question_words(question_key)
+        with self._lock:
+            questions = self._questions.get(cluster)
+            if questions is not None and questions.get(words) == question_key:
+                del questions[words]
+
+    def lookup(self, business: Optional[str], question: str) -> Optional[str]:
+        if not business:
+            return None
+        if depends_on_history(question):
+            self._count("opted_out")
+            return None
+        self._count("lookups")
+        cluster = self.find_cluster(business)
+        if cluster is None:
+            return None
+
+        question_key = normalize_key(question)
+        item = self.cache.peek(self.key(cluster, question_key), touch=True)
+        kind = "exact_hits"
+        if item is None:
+            match = self._same_question(cluster, question_key)
+            if match is None:
+                return None
+            item = self.cache.peek(self.key(cluster, match), touch=True)
+            kind = "similar_hits"
+            if item is None:
+                # запись вытеснена или истекла — чистим индекс
+                self._forget(cluster, match)
+                return None
+        with self._lock:
+            self.counters["hits"] += 1
+            self.counters[kind] += 1
+        return item["a"]
+
+    def store(self, business: Optional[str], question: str, answer: str) -> bool:
+        if not business or not answer or depends_on_history(question):
+            return False
+        cluster = self.find_cluster(business)
+        if cluster is None:
+            cluster = normalize_key(business)
+            self.clusters.add(cluster, business)
+        question_key = normalize_key(question)
+        self.cache.set(self.key(cluster, question_key), {"q": question, "a": answer})
+        self._index_question(cluster, question_key)
+        self._count("stored")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            stats["clusters"] = len(self._questions)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["size"] = len(self.cache)
+        stats["expired"] = self.cache.expired
+        stats["evictions"] = self.cache.evictions
+        return stats
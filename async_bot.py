@@ -0,0 +1,1033 @@
+"""
+Asyncio-рантайм бота: AsyncTeleBot + AsyncGroq в одном цикле событий.
+
+Экраны, callback-кнопки, стадии сессии, кэши, префильтр и пакеты — те же,
+что в main.py (оттуда берутся все общие функции). Здесь только асинхронные
+версии функций, которые ходят в сеть, и хендлеры поверх них.
+
+Импорт main не поднимает sync-рантайм (TeleBot, клиент Groq, пулы хендлеров
+и спекуляций) — его создаёт только main.start_sync_runtime(). run() запускает
+общее для обоих рантаймов: main.start_shared_runtime().
+
+Запуск вместо `python main.py`:
+
+    python async_bot.py
+"""
+import html
+import time
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telebot.async_telebot import AsyncTeleBot
+from telebot.types import InlineKeyboardMarkup, InputMediaPhoto
+from groq import AsyncGroq
+
+from faq_stream import FaqStreamParser
+from main import (
+    API_TOKEN,
+    GROQ_API_KEY,
+    BANNER_WELCOME_ID,
+    BANNER_FAQ_ID,
+    BANNER_ANSWER_ID,
+    SPECULATIVE_LLM,
+    LLM_SINGLEFLIGHT,
+    LLM_UNAVAILABLE_TEXT,
+    LlmUnavailable,
+    llm_flights,
+    llm_gateway,
+    llm_router,
+    record_llm_usage,
+    stream_chunk_usage,
+    flight_key,
+    STREAM_ANSWERS,
+    STREAM_FAQS,
+    STREAM_EDIT_INTERVAL_SEC,
+    STREAM_MIN_DELTA_CHARS,
+    CAPTION_LIMIT,
+    packet_writer,
+    plan_screen,
+    remember_screen,
+    count_screen,
+    telegram_limiter,
+    telegram_error_kind,
+    packet_log,
+    prepare_packet,
+    retention_sweeper,
+    cache_saver,
+    session_evictor,
+    get_session,
+    save_session,
+    chat_busy_checks,
+    faq_cache,
+    normalize_key,
+    get_cached_faqs,
+    cache_faqs,
+    build_faq_messages,
+    parse_faqs,
+    finish_faq_stream,
+    build_question_filter_messages,
+    build_business_filter_messages,
+    parse_verdict,
+    question_verdict_key,
+    local_question_verdict,
+    local_business_verdict,
+    question_verdicts,
+    business_verdicts,
+    build_answer_messages,
+    lookup_cached_answer,
+    cache_answer,
+    start_answer_cache_seed,
+    start_faq_prewarm,
+    start_shared_runtime,
+    faq_prewarmer,
+    count_speculation,
+    format_answer_for_telegram,
+    answer_screen_text,
+    get_welcome_text,
+    get_faq_header_text,
+    build_faq_keyboard,
+    add_common_nav,
+)
+
+abot = AsyncTeleBot(API_TOKEN, parse_mode="HTML")
+aclient = AsyncGroq(api_key=GROQ_API_KEY, max_retries=0)
+
+
+# === ПАКЕТЫ ===
+
+async def save_packet_async(packet: Dict[str, Any]) -> str:
+    """
+    Как save_packet, но без блокировки цикла событий: если очередь писателя
+    полна, ждём место в отдельном потоке.
+    """
+    prepare_packet(packet)
+    if not packet_writer.try_submit(packet):
+        await asyncio.to_thread(packet_writer.submit, packet)
+    return packet["packet_id"]
+
+
+# === ПОРЯДОК ОБРАБОТКИ ВНУТРИ ЧАТА ===
+# Апдейты разных чатов обрабатываются конкурентно, одного чата — строго по очереди
+# (asyncio.Lock отдаёт блокировку ожидающим в порядке FIFO). После апдейта сессия
+# уходит в session_store, как и в sync-рантайме. Блокировка живёт, пока у чата
+# есть апдейт в работе или в очереди, — по числу пользователей в _chat_locks.
+
+_chat_locks: Dict[int, List[Any]] = {}
+
+
+@contextlib.asynccontextmanager
+async def chat_lock(chat_id: int) -> AsyncIterator[None]:
+    entry = _chat_locks.get(chat_id)
+    if entry is None:
+        entry = _chat_locks[chat_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _chat_locks[chat_id]
+
+
+def chat_busy(chat_id: int) -> bool:
+    return chat_id in _chat_locks
+
+
+# сессии чатов с апдейтом в работе session_evictor не выгружает
+chat_busy_checks.append(chat_busy)
+
+
+# === УНИВЕРСАЛЬНАЯ ОТРИСОВКА «СТРАНИЦЫ» ===
+
+async def tg_call_async(chat_id: Optional[int], fn: Callable[..., Awaitable[Any]], /, *args: Any, **kwargs: Any) -> Any:
+    """
+    Исходящий запрос через общий с sync-рантаймом telegram_limiter.
+    """
+    return await telegram_limiter.acall(chat_id, fn, *args, **kwargs)
+
+
+async def send_screen_async(
+    chat_id: int,
+    session: Dict[str, Any],
+    text: str,
+    banner_id: Optional[str] = None,
+    inline_markup: Optional[InlineKeyboardMarkup] = None,
+) -> None:
+    """
+    Асинхронная копия send_screen с той же логикой выбора «пропустить / редактировать / переотправить».
+    """
+    last_message_id = session.get("last_message_id")
+    action, text_h, markup_h = plan_screen(session, text, banner_id, inline_markup)
+
+    if action == "skip":
+        count_screen("skipped")
+        return
+
+    if action != "send":
+        try:
+            if action == "markup":
+                await tg_call_async(
+                    chat_id,
+                    abot.edit_message_reply_markup,
+                    chat_id=chat_id,
+                    message_id=last_message_id,
+                    reply_markup=inline_markup,
+                )
+            elif action == "media":
+                await tg_call_async(
+                    chat_id,
+                    abot.edit_message_media,
+                    InputMediaPhoto(banner_id, caption=text, parse_mode="HTML"),
+                    chat_id=chat_id,
+                    message_id=last_message_id,
+                    reply_markup=inline_markup,
+                )
+            elif action == "caption":
+                await tg_call_async(
+                    chat_id,
+                    abot.edit_message_caption,
+                    chat_id=chat_id,
+                    message_id=last_message_id,
+                    caption=text,
+                    reply_markup=inline_markup,
+                )
+            else:
+                await tg_call_async(
+                    chat_id,
+                    abot.edit_message_text,
+                    text,
+                    chat_id=chat_id,
+                    message_id=last_message_id,
+                    reply_markup=inline_markup,
+                )
+            count_screen(f"{action}_edits")
+            remember_screen(session, last_message_id, banner_id, text_h, markup_h)
+            return
+        except Exception as e:
+            kind = telegram_error_kind(e)
+            if kind == "not_modified":
+                remember_screen(session, last_message_id, banner_id, text_h, markup_h)
+                return
+            if kind == "rate_limited":
+                raise
+            count_screen(f"{action}_fallbacks")
+            try:
+                await tg_call_async(chat_id, abot.delete_message, chat_id, last_message_id)
+            except Exception:
+                pass
+
+    if banner_id:
+        msg = await tg_call_async(
+            chat_id,
+            abot.send_photo,
+            chat_id,
+            banner_id,
+            caption=text,
+            reply_markup=inline_markup,
+        )
+    else:
+        msg = await tg_call_async(
+            chat_id,
+            abot.send_message,
+            chat_id,
+            text,
+            reply_markup=inline_markup,
+        )
+
+    count_screen("sent")
+    remember_screen(session, msg.message_id, banner_id, text_h, markup_h)
+
+
+# === LLM ===
+
+async def _create_completion_async(
+    model: str,
+    kind: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    timeout: float,
+) -> str:
+    completion = await aclient.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        timeout=timeout,
+    )
+    text = completion.choices[0].message.content
+    record_llm_usage(kind, model, getattr(completion, "usage", None), messages, text)
+    return text
+
+
+async def _model_completion_async(
+    model: str,
+    kind: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+) -> str:
+    return await llm_gateway.acall(kind, _create_completion_async, model, kind, messages, temperature, max_tokens, breaker_key=model)
+
+
+async def _gateway_completion_async(kind: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    return await llm_router.acall(kind, _model_completion_async, kind, messages, temperature, max_tokens)
+
+
+async def complete_async(kind: str, messages: List[Dict[str, str]], temperature: float) -> str:
+    route = llm_router.route(kind)
+    if not LLM_SINGLEFLIGHT:
+        return await _gateway_completion_async(kind, messages, temperature, route.max_tokens)
+    key = flight_key(route.model, messages, temperature=temperature, max_tokens=route.max_tokens)
+    return await llm_flights.ado(key, _gateway_completion_async, kind, messages, temperature, route.max_tokens)
+
+
+async def routed_stream_async(kind: str, open_stream: Callable[..., Awaitable[Any]], messages: List[Dict[str, str]]):
+    """
+    Асинхронная копия main.routed_stream.
+    """
+    model = llm_router.pick(kind)
+    started = time.monotonic()
+    parts: List[str] = []
+    usage: Any = None
+    ok = False
+    try:
+        stream = await llm_gateway.acall(kind, open_stream, model, messages, breaker_key=model)
+        async for chunk in stream:
+            usage = stream_chunk_usage(chunk) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        ok = True
+    finally:
+        llm_router.record(kind, model, time.monotonic() - started, ok=ok)
+        if parts:
+            record_llm_usage(kind, model, usage, messages, "".join(parts))
+
+
+async def generate_faqs_async(business_description: str, n: int = 9) -> List[Dict[str, str]]:
+    text = await complete_async("faq", build_faq_messages(business_description, n), temperature=0.2)
+    return parse_faqs(text.strip(), n)
+
+
+async def _open_faq_stream_async(model: str, messages: List[Dict[str, str]], timeout: float) -> Any:
+    return await aclient.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.2,
+        max_tokens=llm_router.route("faq").max_tokens,
+        stream=True,
+        timeout=timeout,
+    )
+
+
+async def generate_faqs_stream_async(
+    business_description: str,
+    n: int = 9,
+    on_items: Optional[Callable[[List[Dict[str, str]]], Awaitable[None]]] = None,
+) -> Tuple[List[Dict[str, str]], bool]:
+    """
+    Асинхронная копия main.generate_faqs_stream.
+    """
+    parser = FaqStreamParser(n)
+    deltas = routed_stream_async("faq", _open_faq_stream_async, build_faq_messages(business_description, n))
+    try:
+        async for delta in deltas:
+            if parser.feed(delta) and on_items is not None:
+                await on_items(list(parser.items))
+    except Exception:
+        if not parser.items:
+            raise
+        return list(parser.items), False
+    return finish_faq_stream(parser, n)
+
+
+async def classify_question_async(question: str, business: Optional[str]) -> str:
+    return parse_verdict(await complete_async("classify", build_question_filter_messages(question, business), temperature=0.0))
+
+
+async def classify_business_async(business: str) -> str:
+    return parse_verdict(await complete_async("classify", build_business_filter_messages(business), temperature=0.0))
+
+
+async def check_question_allowed_async(
+    question: str,
+    session: Dict[str, Any],
+    before_llm: Optional[Callable[[], None]] = None,
+) -> Tuple[bool, str]:
+    business = session.get("business") or session.get("saved_business")
+    key = question_verdict_key(question, business)
+    label = local_question_verdict(key, question, business)
+    if label is None:
+        if before_llm is not None:
+            before_llm()
+        label = await classify_question_async(question, business)
+        question_verdicts.set(key, label)
+    return label == "OK", label
+
+
+async def check_business_allowed_async(
+    business: str,
+    before_llm: Optional[Callable[[], None]] = None,
+) -> Tuple[bool, str]:
+    key = normalize_key(business)
+    label = local_business_verdict(key, business)
+    if label is None:
+        if before_llm is not None:
+            before_llm()
+        label = await classify_business_async(business)
+        business_verdicts.set(key, label)
+    return label == "OK", label
+
+
+async def ask_llm_async(session: Dict[str, Any], question: str) -> str:
+    text = await complete_async("answer", build_answer_messages(session, question), temperature=0.3)
+    return text.strip()
+
+
+async def _open_answer_stream_async(model: str, messages: List[Dict[str, str]], timeout: float) -> Any:
+    return await aclient.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=llm_router.route("answer").max_tokens,
+        stream=True,
+        timeout=timeout,
+    )
+
+
+def ask_llm_stream_async(session: Dict[str, Any], question: str):
+    return routed_stream_async("answer", _open_answer_stream_async, build_answer_messages(session, question))
+
+
+# === СПЕКУЛЯТИВНОЕ ВЫПОЛНЕНИЕ ===
+
+class AsyncSpeculation:
+    """
+    Как main.Speculation, но на asyncio-задаче: discard() по-настоящему
+    отменяет запрос к Groq, а не только выбрасывает результат.
+    """
+
+    def __init__(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        self.fn = fn
+        self.args = args
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self.task is not None
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.fn(*self.args))
+            count_speculation("started")
+
+    async def result(self) -> Any:
+        count_speculation("used")
+        return await self.task
+
+    def discard(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            count_speculation("discarded")
+            self.task = None
+
+
+def speculate_async(fn: Callable[..., Awaitable[Any]], *args: Any) -> Optional[AsyncSpeculation]:
+    return AsyncSpeculation(fn, *args) if SPECULATIVE_LLM else None
+
+
+# === ПОТОКОВАЯ ОТРИСОВКА ОТВЕТА ===
+
+class AsyncStreamingAnswerRenderer:
+    """
+    Асинхронная копия main.StreamingAnswerRenderer.
+    """
+
+    def __init__(self, chat_id: int, session: Dict[str, Any], question: str) -> None:
+        self.chat_id = chat_id
+        self.session = session
+        self.question = question
+        self.parts: List[str] = []
+        self.shown_len = 0
+        self.last_edit = 0.0
+        self.first_render_at: Optional[float] = None
+
+    def _preview(self, text: str) -> str:
+        head = answer_screen_text(self.question, "")
+        room = CAPTION_LIMIT - len(head) - 2
+        body = text if len(text) <= room else text[: max(0, room - 1)] + "…"
+        return answer_screen_text(self.question, html.escape(body) + " ▍")
+
+    async def start(self) -> None:
+        await send_screen_async(
+            self.chat_id,
+            self.session,
+            answer_screen_text(self.question, "<i>Печатаю ответ…</i>"),
+            banner_id=BANNER_ANSWER_ID,
+        )
+
+    async def feed(self, delta: str) -> None:
+        self.parts.append(delta)
+        now = time.monotonic()
+        text = "".join(self.parts)
+        if now - self.last_edit < STREAM_EDIT_INTERVAL_SEC:
+            return
+        if len(text) - self.shown_len < STREAM_MIN_DELTA_CHARS and self.shown_len:
+            return
+        message_id = self.session.get("last_message_id")
+        if not message_id:
+            return
+        try:
+            await tg_call_async(
+                self.chat_id,
+                abot.edit_message_caption,
+                chat_id=self.chat_id,
+                message_id=message_id,
+                caption=self._preview(text.strip()),
+            )
+            self.session["last_text_hash"] = None
+            if self.first_render_at is None:
+                self.first_render_at = time.monotonic()
+        except Exception:
+            pass
+        self.shown_len = len(text)
+        self.last_edit = now
+
+    def text(self) -> str:
+        return "".join(self.parts).strip()
+
+
+# === ПОКАЗАТЬ FAQ ПО БИЗНЕСУ ===
+
+async def render_faq_list_async(chat_id: int, session: Dict[str, Any], pending: bool = False) -> None:
+    header = get_faq_header_text(session)
+    markup, page, total_pages = build_faq_keyboard(session)
+    status = " · остальные вопросы ещё пишутся…" if pending else ""
+    footer = f"\n\n<i>Страница {page + 1} из {total_pages}{status}</i>"
+    markup = add_common_nav(markup)
+
+    await send_screen_async(chat_id, session, header + footer, banner_id=BANNER_FAQ_ID, inline_markup=markup)
+
+
+class AsyncStreamingFaqRenderer:
+    """
+    Асинхронная копия main.StreamingFaqRenderer.
+    """
+
+    def __init__(self, chat_id: int, session: Dict[str, Any], page_size: int = 3) -> None:
+        self.chat_id = chat_id
+        self.session = session
+        self.page_size = page_size
+        self.shown_pages = 0
+        self.last_edit = 0.0
+        self.first_page_at: Optional[float] = None
+
+    async def feed(self, items: List[Dict[str, str]]) -> None:
+        pages = len(items) // self.page_size
+        if pages <= self.shown_pages:
+            return
+        now = time.monotonic()
+        if self.shown_pages and now - self.last_edit < STREAM_EDIT_INTERVAL_SEC:
+            return
+        self.session["faqs"] = items
+        self.session["stage"] = "choose_question"
+        self.session["faq_page"] = 0
+        self.session["faq_page_size"] = self.page_size
+        try:
+            await render_faq_list_async(self.chat_id, self.session, pending=True)
+        except Exception:
+            return
+        if self.first_page_at is None:
+            self.first_page_at = time.monotonic()
+        self.shown_pages = pages
+        self.last_edit = now
+
+
+async def present_faqs_for_business(
+    chat_id: int,
+    session: Dict[str, Any],
+    reuse: bool = False,
+    speculation: Optional[AsyncSpeculation] = None,
+) -> None:
+    business = session.get("business")
+    if not business:
+        session["stage"] = "waiting_business"
+        text = (
+            "<b>Опиши бизнес, с которым будем работать.</b>\n"
+            "<i>Например: кофейня у дома, маникюр на дому, маркетплейс.</i>"
+        )
+        await send_screen_async(chat_id, session, text, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
+        return
+
+    started_at = time.monotonic()
+    first_page_at: Optional[float] = None
+    faq_mode = "cache"
+    faqs = get_cached_faqs(business)
+    if faqs is not None and speculation is not None:
+        speculation.discard()
+
+    if faqs is None:
+        if reuse:
+            await asyncio.sleep(7)
+            pre_text = "<i>Продолжаем работать с этим бизнесом. Собираю типовые вопросы…</i>"
+        else:
+            pre_text = "<i>Принял описание бизнеса. Думаю над типовыми вопросами для такого дела…</i>"
+
+        await send_screen_async(chat_id, session, pre_text, banner_id=BANNER_FAQ_ID, inline_markup=add_common_nav())
+
+        complete_set = True
+        if speculation is not None and speculation.started:
+            faq_mode = "speculation"
+            faqs = await speculation.result()
+        elif STREAM_FAQS:
+            faq_mode = "stream"
+            renderer = AsyncStreamingFaqRenderer(chat_id, session)
+            faqs, complete_set = await generate_faqs_stream_async(business, n=9, on_items=renderer.feed)
+            first_page_at = renderer.first_page_at
+        else:
+            faq_mode = "blocking"
+            faqs = await generate_faqs_async(business, n=9)
+        if complete_set:
+            cache_faqs(business, faqs)
+    shown_at = time.monotonic()
+    session["faqs"] = faqs
+    session["stage"] = "choose_question"
+    session["faq_page"] = 0
+    session["faq_page_size"] = 3
+
+    await save_packet_async({
+        "type": "business_profile",
+        "chat_id": chat_id,
+        "business": business,
+        "faq_mode": faq_mode,
+        "faq_first_page_ms": int(((first_page_at or shown_at) - started_at) * 1000),
+        "faq_total_ms": int((shown_at - started_at) * 1000),
+    })
+
+    await render_faq_list_async(chat_id, session)
+
+
+# === ХЕНДЛЕРЫ ===
+# Логика один в один с main.py; зарегистрированные обёртки берут блокировку чата.
+
+HELP_TEXT = (
+    "Это краткая страница помощи для полного использования функционала данного бота!\n"
+    "Если вы на <i>Шаге 1</i>, то Вам нужно внести данные о своем бизнесе (опишите его идею, суть, не внося никакого вопроса касательно него на данном этапе), после чего (в случае легитимности идеи бизнеса) будет открыта <b>панель</b>.\n"
+    "При открытии панели вы сможете узнать ответы на ЧаВо касательно бизнес-идеи или задать <b>свой собственный</b>, а также задать совершенно новую бизнес идею (тогда прошлая идея будет отложена, вернуться к ней можно будет через повторное нажатие кнопки <b>Другой бизнес</b> и повторном внесении идеи), используя кнопку <b>Другой бизнес</b>, после чего Вы будете возвращены на Шаг 1.\n"
+    "Также можно вернуться на начальную страницу (при отсуствии внесенной идеи или находясь на странице помощи) через кнопку <b>В меню</b>. Навигация между ответами на ЧаВо производится через панель (кнопки <b>Вперёд</b> и <b>Назад</b> соответственно. Спасибо за использование LogiQ!)\n"
+)
+
+
+async def handle_start(message) -> None:
+    chat_id = message.chat.id
+    session = get_session(chat_id)
+
+    if session.get("first_start_seen"):
+        try:
+            await tg_call_async(chat_id, abot.delete_message, chat_id, message.message_id)
+        except Exception:
+            pass
+
+    session["faqs"] = []
+    session["faq_page"] = 0
+    session["stage"] = None
+    session["last_message_id"] = None
+    session["last_banner_id"] = None
+    session["first_start_seen"] = True
+
+    saved_business = session.get("saved_business")
+    text = get_welcome_text(saved_business)
+
+    await send_screen_async(chat_id, session, text, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
+
+    if saved_business:
+        session["business"] = saved_business
+        await present_faqs_for_business(chat_id, session, reuse=True)
+    else:
+        session["stage"] = "waiting_business"
+
+
+async def handle_help(message) -> None:
+    chat_id = message.chat.id
+    session = get_session(chat_id)
+    if not session["business"]:
+        session["stage"] = "waiting_business"
+    await send_screen_async(chat_id, session, HELP_TEXT, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
+
+
+async def handle_random_cmd(message) -> None:
+    chat_id = message.chat.id
+    text_msg = (message.text or "").strip()
+    session = get_session(chat_id)
+    if text_msg != "/help":
+        text_ = "Простите, я не распознаю данную команду... Воспользуйтесь /help, если возникают трудности."
+        if session["business"] is None:
+            session["stage"] = "waiting_business"
+        await send_screen_async(chat_id, session, text_, banner_id=BANNER_FAQ_ID)
+    else:
+        await handle_help(message)
+
+
+async def router(message) -> None:
+    chat_id = message.chat.id
+    text_msg = (message.text or "").strip()
+    session = get_session(chat_id)
+
+    is_start_like = text_msg.lower() in ("старт", "start", "/start") or text_msg == "/start"
+    if not (is_start_like and not session.get("first_start_seen")):
+        try:
+            await tg_call_async(chat_id, abot.delete_message, chat_id, message.message_id)
+        except Exception:
+            pass
+
+    if text_msg.lower() in ("старт", "start"):
+        return await handle_start(message)
+
+    if "/" in text_msg.lower():
+        return await handle_random_cmd(message)
+    stage = session.get("stage")
+
+    if stage == "waiting_business":
+        return await handle_business_description(message, session)
+    elif stage == "custom_question":
+        return await handle_custom_question(message, session)
+    else:
+        return await handle_start(message)
+
+
+async def handle_business_description(message, session: Dict[str, Any]) -> None:
+    chat_id = message.chat.id
+    business = (message.text or "").strip()
+
+    speculation = None if STREAM_FAQS else speculate_async(generate_faqs_async, business, 9)
+
+    def start_faqs() -> None:
+        if faq_cache.peek(normalize_key(business)) is None:
+            speculation.start()
+
+    allowed, reason = await check_business_allowed_async(
+        business,
+        before_llm=start_faqs if speculation is not None else None,
+    )
+
+    if not allowed:
+        if speculation is not None:
+            speculation.discard()
+        await save_packet_async({
+            "type": "rejected_business",
+            "chat_id": chat_id,
+            "business_raw": business,
+            "reason": reason,
+        })
+
+        if reason == "NOT_BUSINESS":
+            text = (
+                "<b>Похоже, это не описание бизнеса.</b>\n"
+                "Опиши, на чём ты хочешь <b>зарабатывать</b>: товар, услуга или формат дела."
+            )
+        elif reason == "ILLEGAL":
+            text = "<b>Я не могу помогать с заведомо незаконными видами деятельности.</b>"
+        else:
+            text = (
+                "<b>Не смог понять описание бизнеса.</b>\n"
+                "Попробуй сформулировать по-другому и указать, что ты продаёшь и кому."
+            )
+
+        await send_screen_async(chat_id, session, text, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
+        return
+
+    session["business"] = business
+    session["saved_business"] = business
+
+    await present_faqs_for_business(chat_id, session, reuse=False, speculation=speculation)
+
+
+async def handle_custom_question(message, session: Dict[str, Any]) -> None:
+    chat_id = message.chat.id
+    question = (message.text or "").strip()
+    started_at = time.monotonic()
+
+    # ответ из кэша отдаём только после вердикта
+    cached_answer = lookup_cached_answer(session, question)
+
+    speculation = None
+    if cached_answer is None and not STREAM_ANSWERS:
+        speculation = speculate_async(ask_llm_async, session, question)
+    allowed, reason = await check_question_allowed_async(
+        question,
+        session,
+        before_llm=speculation.start if speculation is not None else None,
+    )
+
+    if not allowed:
+        if speculation is not None:
+            speculation.discard()
+        await save_packet_async({
+            "type": "rejected_question",
+            "chat_id": chat_id,
+            "business": session.get("business") or session.get("saved_business"),
+            "question": question,
+            "reason": reason,
+        })
+
+        if reason == "NOT_BUSINESS":
+            text = (
+                "<b>Я помогаю только с вопросами про запуск и ведение бизнеса.</b>\n"
+                "Попробуй переформулировать так, чтобы вопрос был про твой микробизнес."
+            )
+        elif reason == "ILLEGAL":
+            text = "<b>Я не могу помогать с незаконными запросами или серыми схемами.</b>"
+        else:
+            text = "<b>Не могу обработать этот вопрос в рамках помощника по бизнесу.</b>"
+
+        # ВАЖНО: на странице выкинутых вопросов НЕ добавляем кнопку «В меню»
+        await send_screen_async(chat_id, session, text, banner_id=BANNER_ANSWER_ID)
+        return
+
+    if cached_answer is not None:
+        return await render_custom_answer(chat_id, session, question, cached_answer, "cache", started_at, None)
+
+    if STREAM_ANSWERS:
+        renderer = AsyncStreamingAnswerRenderer(chat_id, session, question)
+        await renderer.start()
+        async for delta in ask_llm_stream_async(session, question):
+            await renderer.feed(delta)
+        raw_answer = renderer.text()
+        first_render_at = renderer.first_render_at
+    else:
+        if speculation is not None and speculation.started:
+            raw_answer = await speculation.result()
+        else:
+            raw_answer = await ask_llm_async(session, question)
+        first_render_at = None
+    cache_answer(session, question, raw_answer)
+    answer_mode = "stream" if STREAM_ANSWERS else "blocking"
+    await render_custom_answer(chat_id, session, question, raw_answer, answer_mode, started_at, first_render_at)
+
+
+async def render_custom_answer(
+    chat_id: int,
+    session: Dict[str, Any],
+    question: str,
+    raw_answer: str,
+    answer_mode: str,
+    started_at: float,
+    first_render_at: Optional[float],
+) -> None:
+    formatted_answer = format_answer_for_telegram(raw_answer)
+    answered_at = time.monotonic()
+
+    session.add_history(question, raw_answer)
+
+    await save_packet_async({
+        "type": "user_question",
+        "chat_id": chat_id,
+        "business": session.get("business") or session.get("saved_business"),
+        "question": question,
+        "answer": raw_answer,
+        "answer_mode": answer_mode,
+        "answer_first_text_ms": int(((first_render_at or answered_at) - started_at) * 1000),
+        "answer_total_ms": int((answered_at - started_at) * 1000),
+    })
+
+    text = answer_screen_text(question, html.escape(formatted_answer))
+
+    await send_screen_async(chat_id, session, text, banner_id=BANNER_ANSWER_ID, inline_markup=add_common_nav())
+
+
+# === CALLBACK-КНОПКИ ===
+
+async def show_faq_page(chat_id: int, session: Dict[str, Any]) -> None:
+    header = get_faq_header_text(session)
+    markup, page, total_pages = build_faq_keyboard(session)
+    footer = f"\n\n<i>Страница {page + 1} из {total_pages}</i>"
+    markup = add_common_nav(markup)
+    await send_screen_async(chat_id, session, header + footer, banner_id=BANNER_FAQ_ID, inline_markup=markup)
+
+
+async def on_faq_button(callback_query) -> None:
+    chat_id = callback_query.message.chat.id
+    data = callback_query.data
+    session = get_session(chat_id)
+
+    if data == "faq_prev":
+        session["faq_page"] = max(0, session.get("faq_page", 0) - 1)
+        await show_faq_page(chat_id, session)
+        await abot.answer_callback_query(callback_query.id)
+        return
+
+    if data == "faq_next":
+        faqs = session.get("faqs") or []
+        size = session.get("faq_page_size", 3)
+        total_pages = (len(faqs) + size - 1) // size or 1
+        session["faq_page"] = min(total_pages - 1, session.get("faq_page", 0) + 1)
+        await show_faq_page(chat_id, session)
+        await abot.answer_callback_query(callback_query.id)
+        return
+
+    if data == "faq_other":
+        session["stage"] = "custom_question"
+        await abot.answer_callback_query(callback_query.id)
+        text = (
+            "<b>Окей, напиши свой вопрос текстом.</b>\n"
+            "<i>Сформулируй конкретно, что тебя волнует по бизнесу.</i>"
+        )
+        await send_screen_async(chat_id, session, text, banner_id=BANNER_ANSWER_ID, inline_markup=add_common_nav())
+        return
+
+    try:
+        idx = int(data.split("_")[1])
+    except (IndexError, ValueError):
+        await abot.answer_callback_query(callback_query.id, "Что-то пошло не так.")
+        return
+
+    faqs = session.get("faqs") or []
+    if idx < 0 or idx >= len(faqs):
+        await abot.answer_callback_query(
+            callback_query.id,
+            "Список вопросов устарел, давай начнём заново."
+        )
+        session["stage"] = "waiting_business"
+        text = (
+            "<b>Напиши, какой бизнес тебя интересует.</b>\n"
+            "<i>Например: кофейня у дома, маникюр на дому, маркетплейс.</i>"
+        )
+        await send_screen_async(chat_id, session, text, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
+        return
+
+    faq = faqs[idx]
+    question = faq["q"]
+    answer = faq["a"]
+    formatted_answer = format_answer_for_telegram(answer)
+
+    await abot.answer_callback_query(callback_query.id)
+
+    session.add_history(question, answer)
+
+    await save_packet_async({
+        "type": "faq_click",
+        "chat_id": chat_id,
+        "business": session.get("business") or session.get("saved_business"),
+        "question": question,
+        "answer": answer,
+    })
+
+    text = answer_screen_text(question, html.escape(formatted_answer))
+    await send_screen_async(chat_id, session, text, banner_id=BANNER_ANSWER_ID, inline_markup=add_common_nav())
+
+
+async def on_business_other(callback_query) -> None:
+    chat_id = callback_query.message.chat.id
+    session = get_session(chat_id)
+
+    await abot.answer_callback_query(callback_query.id)
+
+    session["stage"] = "waiting_business"
+    session["business"] = None
+
+    text = (
+        "<b>Хорошо, давай другой бизнес.</b>\n"
+        "Напиши, какой бизнес тебя интересует теперь."
+    )
+    await send_screen_async(chat_id, session, text, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
+
+
+async def on_go_menu(callback_query) -> None:
+    chat_id = callback_query.message.chat.id
+    session = get_session(chat_id)
+
+    await abot.answer_callback_query(callback_query.id)
+
+    session["faqs"] = []
+    session["faq_page"] = 0
+    session["stage"] = None
+    session["last_message_id"] = None
+    session["last_banner_id"] = None
+
+    saved_business = session.get("saved_business")
+    text = get_welcome_text(saved_business)
+    await send_screen_async(chat_id, session, text, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
+
+    if saved_business:
+        session["business"] = saved_business
+        await present_faqs_for_business(chat_id, session, reuse=True)
+    else:
+        session["stage"] = "waiting_business"
+
+
+# === РЕГИСТРАЦИЯ ===
+# Те же фильтры и тот же порядок регистрации, что в main.register_handlers.
+
+async def show_llm_unavailable(chat_id: int) -> None:
+    session = get_session(chat_id)
+    banner_id = BANNER_ANSWER_ID if session.get("stage") == "custom_question" else BANNER_WELCOME_ID
+    await save_packet_async({"type": "llm_unavailable", "chat_id": chat_id, "stage": session.get("stage")})
+    await send_screen_async(chat_id, session, LLM_UNAVAILABLE_TEXT, banner_id=banner_id, inline_markup=add_common_nav())
+
+
+async def _run_locked(chat_id: int, handler: Callable[[Any], Awaitable[None]], update: Any) -> None:
+    async with chat_lock(chat_id):
+        # session_store ходит в SQLite — загрузка и сохранение в потоке, не в цикле событий;
+        # внутри обработчика get_session уже берёт сессию из памяти
+        await asyncio.to_thread(get_session, chat_id)
+        try:
+            await handler(update)
+        except LlmUnavailable:
+            await show_llm_unavailable(chat_id)
+        finally:
+            await asyncio.to_thread(save_session, chat_id)
+
+
+def _locked_message(handler: Callable[[Any], Awaitable[None]]) -> Callable[[Any], Awaitable[None]]:
+    async def wrapper(message) -> None:
+        await _run_locked(message.chat.id, handler, message)
+    return wrapper
+
+
+def _locked_callback(handler: Callable[[Any], Awaitable[None]]) -> Callable[[Any], Awaitable[None]]:
+    async def wrapper(callback_query) -> None:
+        await _run_locked(callback_query.message.chat.id, handler, callback_query)
+    return wrapper
+
+
+abot.register_message_handler(_locked_message(handle_start), commands=["start"])
+abot.register_message_handler(_locked_message(handle_help), commands=["/help"])
+abot.register_message_handler(_locked_message(handle_random_cmd), commands=["/"])
+abot.register_message_handler(_locked_message(router), func=lambda m: True, content_types=["text"])
+abot.register_callback_query_handler(
+    _locked_callback(on_faq_button), func=lambda c: c.data and c.data.startswith("faq_")
+)
+abot.register_callback_query_handler(_locked_callback(on_business_other), func=lambda c: c.data == "business_other")
+abot.register_callback_query_handler(_locked_callback(on_go_menu), func=lambda c: c.data == "go_menu")
+
+
+async def run() -> None:
+    # из main — только общее: потоки записи пакетов и сессий, кэши с диска
+    start_shared_runtime()
+    print("Bot started (asyncio)")
+    start_answer_cache_seed()
+    # прогрев идёт в своём потоке через синхронный клиент — циклу событий не мешает
+    start_faq_prewarm()
+    retention_sweeper.start()
+    cache_saver.start()
+    session_evictor.start()
+    try:
+        await abot.infinity_polling()
+    finally:
+        faq_prewarmer.stop()
+        retention_sweeper.stop()
+        cache_saver.stop()
+        session_evictor.stop()
+        await abot.close_session()
+        packet_writer.close()
+        packet_log.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,1098 @@
+"""
+Локальные бенчмарки без Telegram и Groq.
+
+    python bench.py packet-write
+    python bench.py similarity
+    python bench.py telegram-burst
+    python bench.py telegram-flow
+    python bench.py sessions
+    python bench.py singleflight
+    python bench.py llm-chaos
+    python bench.py prompt-budget [--packets data/packets]
+    python bench.py answer-cache
+    python bench.py faq-prewarm
+    python bench.py faq-stream
+    python bench.py llm-routes
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import subprocess
+import resource
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from packet_log import PacketLog, PacketLogReader
+from similarity import SimilarityIndex
+from ratelimit import OutboundLimiter, TokenBucket, telegram_error_kind
+from session import Session, faq_sets_count
+from singleflight import SingleFlight, flight_key
+from llm_gateway import CallPolicy, CircuitBreaker, LlmGateway, LlmUnavailable
+from llm_router import ModelRouter, Route
+from fake_groq import FakeGroqServer
+from prompt_budget import count_tokens, message_tokens
+from answer_cache import AnswerCache
+from cache import LruTtlCache, normalize_key
+from prewarm import FaqPrewarmer
+from faq_stream import FaqStreamParser
+
+
+# === ОБЩЕЕ ===
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def measure(fn: Callable[[], Any], n: int) -> List[float]:
+    """
+    Латентность n вызовов fn в миллисекундах.
+    """
+    samples: List[float] = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def print_row(label: str, samples: List[float]) -> None:
+    print(
+        f"{label:<28} p50={percentile(samples, 50):8.3f}ms "
+        f"p99={percentile(samples, 99):8.3f}ms max={max(samples):8.3f}ms"
+    )
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss в Linux — килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def sample_packet() -> Dict[str, Any]:
+    return {
+        "packet_id": str(uuid.uuid4()),
+        "timestamp": int(time.time()),
+        "type": "user_question",
+        "event": "user_question",
+        "chat_id": 123456789,
+        "business": "кофейня у дома",
+        "question": "как посчитать себестоимость",
+        "answer": "Сложи прямые затраты на одну чашку и раздели постоянные расходы на объём продаж. " * 8,
+    }
+
+
+# === packet-write: латентность записи события от объёма хранимых данных ===
+
+def _legacy_save(data_dir: str, cutoff: float) -> None:
+    # старая схема: файл на событие + полный обход каталога на каждой записи
+    packet = sample_packet()
+    with open(os.path.join(data_dir, f"{packet['packet_id']}.json"), "w", encoding="utf-8") as f:
+        json.dump(packet, f, ensure_ascii=False, indent=4)
+    for fname in os.listdir(data_dir):
+        path = os.path.join(data_dir, fname)
+        with open(path, "r", encoding="utf-8") as f:
+            ts = json.load(f).get("timestamp")
+        if ts < cutoff:
+            os.remove(path)
+
+
+def bench_packet_write(args: argparse.Namespace) -> None:
+    cutoff = time.time() - 3 * 86400
+    root = tempfile.mkdtemp(prefix="bench_packets_")
+    try:
+        print("== segmented log ==")
+        log = PacketLog(os.path.join(root, "packets"))
+        retained = 0
+        for target in args.volumes:
+            while retained < target:
+                log.append(sample_packet())
+                retained += 1
+            print_row(f"retained={retained}", measure(lambda: log.append(sample_packet()), args.samples))
+            retained += args.samples
+        log.close()
+
+        if args.legacy:
+            print("== legacy one-file-per-event ==")
+            legacy_dir = os.path.join(root, "legacy")
+            os.makedirs(legacy_dir)
+            retained = 0
+            for target in args.legacy_volumes:
+                while retained < target:
+                    packet = sample_packet()
+                    with open(os.path.join(legacy_dir, f"{packet['packet_id']}.json"), "w", encoding="utf-8") as f:
+                        json.dump(packet, f, ensure_ascii=False, indent=4)
+                    retained += 1
+                samples = measure(lambda: _legacy_save(legacy_dir, cutoff), args.legacy_samples)
+                print_row(f"retained={retained}", samples)
+                retained += args.legacy_samples
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# === similarity: поиск похожих описаний бизнеса на большом индексе ===
+
+_ADJECTIVES = ["маленькая", "уютная", "семейная", "домашняя", "онлайн", "выездная", "детская", "премиум"]
+_BUSINESSES = [
+    "кофейня", "пекарня", "кондитерская", "маникюр", "барбершоп", "цветочный магазин",
+    "магазин одежды", "ремонт обуви", "химчистка", "автомойка", "шиномонтаж", "репетиторство",
+    "фотостудия", "йога студия", "груминг", "массаж", "доставка еды", "шаурма",
+]
+_PLACES = ["у дома", "на дому", "в ТЦ", "на маркетплейсе", "возле метро", "в спальном районе", "в центре", "в гараже"]
+
+
+def synthetic_business(rnd: random.Random) -> str:
+    parts = []
+    if rnd.random() < 0.5:
+        parts.append(rnd.choice(_ADJECTIVES))
+    parts.append(rnd.choice(_BUSINESSES))
+    parts.append(rnd.choice(_PLACES))
+    # хвост делает описания уникальными, как у реальных пользователей
+    parts.append(f"{rnd.choice(['для', 'и', 'с'])} {rnd.randrange(10**6)}")
+    return " ".join(parts)
+
+
+def bench_similarity(args: argparse.Namespace) -> None:
+    rnd = random.Random(42)
+    index = SimilarityIndex(threshold=args.threshold)
+
+    t0 = time.perf_counter()
+    for i in range(args.size):
+        index.add(f"b{i}", synthetic_business(rnd))
+    build_sec = time.perf_counter() - t0
+    print(f"indexed {args.size} descriptions in {build_sec:.1f}s, max RSS {max_rss_mb():.0f} MB")
+
+    queries = [synthetic_business(rnd) for _ in range(args.queries)]
+    samples = measure(lambda: index.query(queries.pop()), args.queries)
+    print_row("query", samples)
+    print(index.stats())
+
+
+# === telegram-burst: всплеск экранов в тысячи чатов против лимитов Telegram ===
+
+class FakeApiError(Exception):
+    def __init__(self, error_code: int, description: str, retry_after: int = 0) -> None:
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.result_json = {"parameters": {"retry_after": retry_after}} if retry_after else {}
+
+
+class FakeTelegram:
+    """
+    Отвечает как Bot API с лимитами: global_rate/с на бота, chat_rate/с новых
+    сообщений на чат (с запасом chat_burst), сверх — 429 с retry_after.
+    Правки и удаления в лимит чата не входят. Считает все вызовы.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, latency: float) -> None:
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_rate, time.monotonic())
+        self._chats: Dict[int, TokenBucket] = {}
+        self.calls = 0
+        self.rejected = 0
+        self._next_id = 1000
+
+    def _admit(self, chat_id: int, message: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+            # refill без долга: пробуем взять токен и возвращаем его, если не хватило
+            g_ok = self._global.reserve(now) == 0.0
+            c_ok = not message or chat.reserve(now) == 0.0
+            if not (g_ok and c_ok):
+                self._global.tokens += 1
+                if message:
+                    chat.tokens += 1
+                self.rejected += 1
+                raise FakeApiError(429, "Too Many Requests: retry after 1", retry_after=1)
+        time.sleep(self.latency)
+
+    def _message(self) -> Any:
+        with self._lock:
+            self._next_id += 1
+            return type("Msg", (), {"message_id": self._next_id})()
+
+    def edit_message_caption(self, chat_id: int, message_id: int, caption: str, reply_markup: Any = None) -> None:
+        self._admit(chat_id)
+
+    def edit_message_media(self, media: Any, chat_id: int, message_id: int, reply_markup: Any = None) -> None:
+        self._admit(chat_id)
+
+    def delete_message(self, chat_id: int, message_id: int) -> None:
+        self._admit(chat_id)
+
+    def send_message(self, chat_id: int, text: str, reply_markup: Any = None) -> Any:
+        self._admit(chat_id, message=True)
+        return self._message()
+
+    def send_photo(self, chat_id: int, photo: str, caption: str, reply_markup: Any = None) -> Any:
+        self._admit(chat_id, message=True)
+        return self._message()
+
+
+def _screen_legacy(api: FakeTelegram, chat_id: int, message_id: int, text: str) -> int:
+    # как было: любая ошибка правки -> удалить и отправить заново
+    try:
+        api.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=text)
+        return message_id
+    except Exception:
+        try:
+            api.delete_message(chat_id, message_id)
+        except Exception:
+            pass
+    return api.send_photo(chat_id, "banner", caption=text).message_id
+
+
+def _screen_limited(api: FakeTelegram, limiter: OutboundLimiter, chat_id: int, message_id: int, text: str) -> int:
+    try:
+        limiter.call(chat_id, api.edit_message_caption, chat_id=chat_id, message_id=message_id, caption=text)
+        return message_id
+    except Exception as e:
+        if telegram_error_kind(e) in ("not_modified", "rate_limited"):
+            raise
+        try:
+            limiter.call(chat_id, api.delete_message, chat_id, message_id)
+        except Exception:
+            pass
+    return limiter.call(chat_id, api.send_photo, chat_id, "banner", caption=text).message_id
+
+
+def bench_telegram_burst(args: argparse.Namespace) -> None:
+    modes = ["legacy", "limited"]
+    print(
+        f"{args.chats} chats x {args.screens} screens, Telegram limits "
+        f"{args.global_rate:g}/s per bot, {args.chat_rate:g}/s per chat"
+    )
+    for mode in modes:
+        api = FakeTelegram(args.global_rate, args.chat_rate, args.chat_burst, args.latency)
+        limiter = OutboundLimiter(
+            global_rate=args.global_rate,
+            global_burst=args.global_rate,
+            chat_rate=args.chat_rate,
+            chat_burst=args.chat_burst,
+        )
+        delivered = 0
+        lost = 0
+        counter_lock = threading.Lock()
+
+        def run_chat(chat_id: int) -> None:
+            nonlocal delivered, lost
+            message_id = chat_id
+            for i in range(args.screens):
+                try:
+                    if mode == "legacy":
+                        message_id = _screen_legacy(api, chat_id, message_id, f"screen {i}")
+                    else:
+                        message_id = _screen_limited(api, limiter, chat_id, message_id, f"screen {i}")
+                    ok = True
+                except Exception:
+                    ok = False
+                with counter_lock:
+                    delivered += ok
+                    lost += not ok
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(run_chat, range(args.chats)))
+        elapsed = time.perf_counter() - t0
+        print(
+            f"{mode:<8} elapsed={elapsed:6.1f}s delivered={delivered:<6} lost={lost:<6} "
+            f"api_calls={api.calls:<6} 429={api.rejected:<6} "
+            f"calls/screen={api.calls / max(1, delivered):.2f} screens/s={delivered / elapsed:.1f}"
+        )
+
+
+# === telegram-flow: сколько лимитер сам добавляет к обычному сценарию в чате ===
+
+def _business_flow(api: FakeTelegram, limiter: OutboundLimiter, chat_id: int, message_id: int) -> int:
+    # ввод описания бизнеса: удалить сообщение пользователя, экран «Думаю…»,
+    # смена баннера, подпись со статусом, список FAQ
+    limiter.call(chat_id, api.delete_message, chat_id, message_id - 1)
+    message_id = limiter.call(chat_id, api.send_message, chat_id, "Думаю…").message_id
+    limiter.call(chat_id, api.edit_message_media, "faq-banner", chat_id=chat_id, message_id=message_id)
+    limiter.call(chat_id, api.edit_message_caption, chat_id=chat_id, message_id=message_id, caption="почти готово")
+    limiter.call(chat_id, api.edit_message_caption, chat_id=chat_id, message_id=message_id, caption="FAQ")
+    return message_id
+
+
+def bench_telegram_flow(args: argparse.Namespace) -> None:
+    print(
+        f"{args.chats} chats x {args.flows} business-entry flows (5 calls each), "
+        f"{args.chat_rate:g}/s per chat, burst {args.chat_burst:g}, Bot API latency {args.latency * 1000:.0f}ms"
+    )
+    # как было: ведро чата на каждый вызов; сейчас — только на новые сообщения
+    for mode, chat_methods in (("all-calls", None), ("sends-only", ("send_message", "send_photo"))):
+        api = FakeTelegram(args.global_rate, args.chat_rate, args.chat_burst, args.latency)
+        limiter = OutboundLimiter(
+            global_rate=args.global_rate,
+            global_burst=args.global_rate,
+            chat_rate=args.chat_rate,
+            chat_burst=args.chat_burst,
+            chat_methods=chat_methods,
+        )
+        flow_ms: List[float] = []
+        samples_lock = threading.Lock()
+
+        def run_chat(chat_id: int) -> None:
+            message_id = 10
+            for _ in range(args.flows):
+                t0 = time.perf_counter()
+                message_id = _business_flow(api, limiter, chat_id, message_id)
+                with samples_lock:
+                    flow_ms.append((time.perf_counter() - t0) * 1000)
+                time.sleep(args.think)
+
+        with ThreadPoolExecutor(max_workers=args.chats) as pool:
+            list(pool.map(run_chat, range(1, args.chats + 1)))
+        stats = limiter.snapshot()
+        added = max(0.0, percentile(flow_ms, 50) - 5 * args.latency * 1000)
+        print(
+            f"{mode:<11} flow p50={percentile(flow_ms, 50):7.1f}ms p99={percentile(flow_ms, 99):7.1f}ms "
+            f"limiter_added_p50={added:6.1f}ms delayed_calls={int(stats['delayed']):<5} 429={api.rejected}"
+        )
+
+
+# === sessions: память на N чатов, dict-сессии vs компактные Session ===
+
+def _stored_session(rnd: random.Random, businesses: List[str], faq_sets: Dict[str, List[Dict[str, str]]]) -> Dict[str, Any]:
+    # так сессия выглядит после json.loads из session_store: все строки — свои копии
+    business = rnd.choice(businesses)
+    history = [
+        {"q": f"вопрос {rnd.randrange(10**6)} про {business}", "a": f"ответ {rnd.randrange(10**6)} " + "шаг за шагом. " * 90}
+        for _ in range(10)
+    ]
+    return json.loads(json.dumps({
+        "stage": "choose_question",
+        "business": business,
+        "saved_business": business,
+        "faqs": faq_sets[business],
+        "faq_page": rnd.randrange(3),
+        "faq_page_size": 3,
+        "history": history,
+        "last_message_id": rnd.randrange(10**6),
+        "last_banner_id": "AgACAgIAAxkBAAIBX2kakpgPBUVy_H_wy8XhZ6vTFL11AAJiD2sbgC3QSEk6pQ9Xrh_MAQADAgADeQADNgQ",
+        "last_text_hash": "0123456789abcdef",
+        "last_markup_hash": "fedcba9876543210",
+        "first_start_seen": True,
+    }, ensure_ascii=False))
+
+
+def _sessions_child(args: argparse.Namespace) -> None:
+    rnd = random.Random(7)
+    businesses = [synthetic_business(rnd) for _ in range(args.businesses)]
+    faq_sets = {
+        b: [{"q": f"Вопрос {i} про {b}?", "a": "Ответ: " + "конкретный шаг. " * 40} for i in range(9)]
+        for b in businesses
+    }
+    before = current_rss_mb()
+    sessions: Dict[int, Any] = {}
+    t0 = time.perf_counter()
+    for chat_id in range(args.chats):
+        data = _stored_session(rnd, businesses, faq_sets)
+        if args.mode == "dict":
+            data["history"] = data["history"][-10:]
+            sessions[chat_id] = data
+        else:
+            session = Session()
+            session.update(data)
+            sessions[chat_id] = session
+    build_sec = time.perf_counter() - t0
+    del faq_sets
+    used = current_rss_mb() - before
+    extra = f" faq_sets={faq_sets_count()}" if args.mode == "compact" else ""
+    print(
+        f"{args.mode:<8} chats={args.chats} rss_delta={used:7.1f}MB "
+        f"per_chat={used * 1024 / args.chats:6.2f}KB build={build_sec:5.1f}s{extra}"
+    )
+
+
+def bench_sessions(args: argparse.Namespace) -> None:
+    if args.mode:
+        return _sessions_child(args)
+    # каждый режим в отдельном процессе, чтобы RSS не смешивался
+    for mode in ("dict", "compact"):
+        subprocess.run(
+            [sys.executable, __file__, "sessions", "--mode", mode,
+             "--chats", str(args.chats), "--businesses", str(args.businesses)],
+            check=True,
+        )
+
+
+# === singleflight: одновременные одинаковые LLM-вызовы ===
+
+def bench_singleflight(args: argparse.Namespace) -> None:
+    rnd = random.Random(11)
+    popular = [synthetic_business(rnd) for _ in range(args.businesses)]
+    # users человек вводят один из популярных бизнесов в пределах окна window секунд
+    arrivals = sorted((rnd.uniform(0, args.window), rnd.choice(popular)) for _ in range(args.users))
+    print(
+        f"{args.users} users, {args.businesses} businesses within {args.window:g}s, "
+        f"LLM latency {args.latency * 1000:.0f}ms"
+    )
+    for mode in ("direct", "singleflight"):
+        flights = SingleFlight()
+        llm_calls = 0
+        calls_lock = threading.Lock()
+
+        def fake_llm(business: str) -> str:
+            nonlocal llm_calls
+            with calls_lock:
+                llm_calls += 1
+            time.sleep(args.latency)
+            return business
+
+        def run_user(arrival: Any) -> float:
+            at, business = arrival
+            time.sleep(max(0.0, start + at - time.perf_counter()))
+            t0 = time.perf_counter()
+            messages = [{"role": "user", "content": f"Сфера бизнеса: {business}"}]
+            if mode == "direct":
+                fake_llm(business)
+            else:
+                flights.do(flight_key("model", messages, temperature=0.2, max_tokens=1024), fake_llm, business)
+            return (time.perf_counter() - t0) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            samples = sorted(pool.map(run_user, arrivals))
+        stats = flights.stats()
+        print(
+            f"{mode:<13} llm_calls={llm_calls:<5} coalesced={stats['coalesced']:<5} "
+            f"max_waiters={stats['max_waiters']:<4} wait p50={percentile(samples, 50):6.1f}ms "
+            f"p99={percentile(samples, 99):6.1f}ms"
+        )
+
+
+# === llm-chaos: клиент Groq против fake_groq.py с задержками и ошибками ===
+
+CHAOS_PHASES = [
+    # (название, error_rate, hang_rate)
+    ("flaky", 0.1, 0.03),
+    ("outage", 1.0, 0.0),
+    ("recovered", 0.0, 0.0),
+]
+
+
+def bench_llm_chaos(args: argparse.Namespace) -> None:
+    from groq import Groq
+
+    server = FakeGroqServer(port=0, latency=args.latency, jitter=args.jitter, hang_sec=args.hang_sec, seed=3)
+    server.start()
+    messages = [{"role": "user", "content": "Текст пользователя: кофейня у дома. Ответь одним словом."}]
+    print(
+        f"fake Groq latency {args.latency * 1000:.0f}±{args.jitter * 1000:.0f}ms, hangs {args.hang_sec:g}s; "
+        f"{args.calls} classify calls per phase, {args.concurrency} at a time"
+    )
+    modes = {
+        # как было: клиент по умолчанию (свои 2 повтора, таймаут 60 с), без шлюза
+        "raw": None,
+        "gateway": CallPolicy(timeout=args.timeout, retries=2),
+        "gateway+hedge": CallPolicy(timeout=args.timeout, retries=2, hedge_after=args.hedge_after),
+    }
+    try:
+        for mode, policy in modes.items():
+            raw_client = Groq(api_key="x", base_url=server.base_url)
+            client = Groq(api_key="x", base_url=server.base_url, max_retries=0)
+            gateway = None
+            if policy is not None:
+                gateway = LlmGateway(
+                    {"classify": policy},
+                    breaker_factory=lambda: CircuitBreaker(failure_threshold=5, reset_timeout=args.breaker_reset),
+                    rng=random.Random(5),
+                    hedge_workers=2 * args.concurrency,
+                )
+
+            def create(timeout: float) -> str:
+                completion = client.chat.completions.create(
+                    model="fake", messages=messages, temperature=0.0, max_tokens=8, timeout=timeout,
+                )
+                return completion.choices[0].message.content
+
+            def one_call(_: int) -> Any:
+                t0 = time.perf_counter()
+                try:
+                    if gateway is None:
+                        raw_client.chat.completions.create(model="fake", messages=messages, temperature=0.0, max_tokens=8)
+                    else:
+                        gateway.call("classify", create)
+                    outcome = "ok"
+                except LlmUnavailable:
+                    outcome = "graceful"
+                except Exception:
+                    outcome = "error"
+                return outcome, (time.perf_counter() - t0) * 1000
+
+            for phase, error_rate, hang_rate in CHAOS_PHASES:
+                server.error_rate, server.hang_rate = error_rate, hang_rate
+                if phase == "recovered" and gateway is not None:
+                    # после паузы предохранитель в half_open пропускает одну пробу;
+                    # одновременные с ней вызовы отбиваются сразу — здесь проба идёт отдельно
+                    outcome, ms = one_call(0)
+                    print(f"{mode:<14} {'probe':<10} {outcome} {ms:.1f}ms, breaker {gateway.breaker().snapshot()['state']}")
+                before = server.stats["requests"]
+                t0 = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    results = list(pool.map(one_call, range(args.calls)))
+                elapsed = time.perf_counter() - t0
+                outcomes = {k: sum(1 for o, _ in results if o == k) for k in ("ok", "graceful", "error")}
+                samples = [ms for _, ms in results]
+                print(
+                    f"{mode:<14} {phase:<10} ok={outcomes['ok']:<4} graceful={outcomes['graceful']:<4} "
+                    f"error={outcomes['error']:<4} p50={percentile(samples, 50):7.1f}ms "
+                    f"p99={percentile(samples, 99):7.1f}ms max={max(samples):7.1f}ms "
+                    f"groq_requests={server.stats['requests'] - before:<5} elapsed={elapsed:5.1f}s"
+                )
+                if phase == "outage" and gateway is not None:
+                    # даём предохранителю дойти до half_open
+                    time.sleep(args.breaker_reset)
+            if gateway is not None:
+                print(f"{'':<14} stats {json.dumps(gateway.stats(), ensure_ascii=False)}")
+    finally:
+        server.stop()
+
+
+# === prompt-budget: размер промпта ask_llm и латентность, как было vs с бюджетом ===
+
+_ANSWER_STEPS = [
+    "Посчитай **себестоимость** каждой позиции и заложи наценку не ниже 2,5x.",
+    "Проверь, какие разрешения и регистрация нужны: самозанятость или ИП на УСН.",
+    "Начни с минимального ассортимента и расширяй его по статистике продаж.",
+    "Собери первые отзывы и попроси клиентов отметить тебя в соцсетях.",
+    "Заведи простую таблицу доходов и расходов и обновляй её каждую неделю.",
+    "Договорись с двумя поставщиками, чтобы не зависеть от одного.",
+    "Настрой карточку в картах и ответы на частые вопросы в мессенджере.",
+    "Раз в месяц сравнивай цены конкурентов и пересматривай свои.",
+]
+
+
+def _synthetic_conversations(chats: int, questions: int, seed: int = 21) -> List[List[Dict[str, str]]]:
+    rnd = random.Random(seed)
+    conversations = []
+    for _ in range(chats):
+        business = synthetic_business(rnd)
+        turns = []
+        for i in range(questions):
+            # ответ модели — до 1024 токенов: нумерованные шаги с пояснениями
+            steps = [
+                f"{n}. {rnd.choice(_ANSWER_STEPS)} " + " ".join(rnd.choice(_ANSWER_STEPS) for _ in range(rnd.randint(1, 4)))
+                for n in range(1, rnd.randint(4, 12))
+            ]
+            turns.append({
+                "business": business,
+                "question": f"Вопрос {i + 1}: как {rnd.choice(['увеличить выручку', 'найти клиентов', 'снизить расходы', 'нанять помощника'])} для «{business}»?",
+                "answer": "### План\n" + "\n".join(steps),
+            })
+        conversations.append(turns)
+    return conversations
+
+
+def _recorded_conversations(packets_dir: str) -> List[List[Dict[str, str]]]:
+    reader = PacketLogReader(packets_dir)
+    position = None
+    by_chat: Dict[Any, List[Dict[str, str]]] = {}
+    while True:
+        packets, position = reader.read(position) if position is not None else reader.read()
+        if not packets:
+            break
+        for packet in packets:
+            if packet.get("type") == "user_question" and packet.get("answer"):
+                by_chat.setdefault(packet.get("chat_id"), []).append({
+                    "business": packet.get("business") or "микробизнес",
+                    "question": packet.get("question") or "",
+                    "answer": packet["answer"],
+                })
+    return list(by_chat.values())
+
+
+def _legacy_answer_messages(business: str, history: List[Any], question: str) -> List[Dict[str, str]]:
+    # build_answer_messages до бюджета: три последние пары целиком
+    messages = [
+        {"role": "system", "content": "Ты Copilot-помощник для микробизнеса. Отвечай по делу, структурно и коротко, с конкретными шагами. Не уходи в воду."},
+        {"role": "user", "content": f"Описание бизнеса: {business}. Ты помогаешь владельцу принимать решения."},
+    ]
+    for prev_q, prev_a in history[-3:]:
+        messages.append({"role": "user", "content": f"Раньше владелец спрашивал: {prev_q}"})
+        messages.append({"role": "assistant", "content": f"Ты отвечал так: {prev_a}"})
+    messages.append({"role": "user", "content": f"Новый вопрос владельца: {question}\nДай чёткий, практический ответ."})
+    return messages
+
+
+def bench_prompt_budget(args: argparse.Namespace) -> None:
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:bench")
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench-prompt-"))
+    os.environ.setdefault("SESSION_STORE", "memory")
+    os.environ.setdefault("PACKET_ECHO_STDOUT", "0")
+    os.environ["PROMPT_INPUT_BUDGET_TOKENS"] = str(args.budget)
+    import main
+    from groq import Groq
+
+    if args.packets:
+        conversations = _recorded_conversations(args.packets)
+        source = f"recorded ({args.packets})"
+    else:
+        conversations = _synthetic_conversations(args.chats, args.questions)
+        source = "synthetic"
+    total = sum(len(c) for c in conversations)
+    print(f"{source}: {len(conversations)} conversations, {total} questions; budget {args.budget} tokens (estimate)")
+
+    prompts: Dict[str, List[List[Dict[str, str]]]] = {"before": [], "after": []}
+    build_us: List[float] = []
+    for turns in conversations:
+        history: List[Any] = []
+        session = main.new_session()
+        for turn in turns:
+            session["business"] = turn["business"]
+            prompts["before"].append(_legacy_answer_messages(turn["business"], history, turn["question"]))
+            t0 = time.perf_counter()
+            prompts["after"].append(main.build_answer_messages(session, turn["question"]))
+            build_us.append((time.perf_counter() - t0) * 1e6)
+            history.append((turn["question"], turn["answer"]))
+            session.add_history(turn["question"], turn["answer"])
+
+    for mode, items in prompts.items():
+        tokens = [message_tokens(m) for m in items]
+        print(
+            f"{mode:<7} prompt tokens p50={percentile(tokens, 50):6.0f} p90={percentile(tokens, 90):6.0f} "
+            f"p99={percentile(tokens, 99):6.0f} max={max(tokens):6.0f} total={sum(tokens)}"
+        )
+    print(f"        build_answer_messages p50={percentile(build_us, 50):.0f}us p99={percentile(build_us, 99):.0f}us")
+    print(f"        {json.dumps(main.answer_prompts.stats(), ensure_ascii=False)}")
+
+    # латентность: те же промпты в fake Groq, у которого задержка растёт с длиной промпта
+    server = FakeGroqServer(port=0, latency=args.latency, jitter=args.jitter, prefill_per_1k=args.prefill_ms_per_1k / 1000, seed=9)
+    server.start()
+    client = Groq(api_key="x", base_url=server.base_url, max_retries=0)
+    rnd = random.Random(4)
+    picks = rnd.sample(range(len(prompts["before"])), min(args.latency_calls, len(prompts["before"])))
+    try:
+        for mode, items in prompts.items():
+            samples = []
+            usage = []
+            for i in picks:
+                t0 = time.perf_counter()
+                completion = client.chat.completions.create(model="fake", messages=items[i], max_tokens=1024)
+                samples.append((time.perf_counter() - t0) * 1000)
+                usage.append(completion.usage.prompt_tokens)
+            print(
+                f"{mode:<7} latency p50={percentile(samples, 50):6.1f}ms p99={percentile(samples, 99):6.1f}ms "
+                f"(fake Groq: {args.latency * 1000:.0f}ms + {args.prefill_ms_per_1k:g}ms per 1k prompt tokens; "
+                f"server-side prompt_tokens p50={percentile(usage, 50):.0f})"
+            )
+    finally:
+        server.stop()
+
+
+# === answer-cache: доля вопросов, отвеченных из кэша без LLM ===
+
+# намерения владельцев и их разные формулировки
+_INTENTS = [
+    ["как посчитать себестоимость", "как рассчитать себестоимость", "как посчитать себестоимость?"],
+    ["как найти первых клиентов", "где найти первых клиентов", "как найти первых клиентов?"],
+    ["какие налоги платить", "какие налоги нужно платить", "какие налоги я должен платить"],
+    ["нужна ли онлайн касса", "нужна ли мне онлайн касса", "нужна ли онлайн-касса?"],
+    ["как поднять средний чек", "как увеличить средний чек", "как повысить средний чек"],
+    ["как удержать постоянных клиентов", "как удерживать постоянных клиентов", "как удержать постоянных клиентов?"],
+    ["как нанять первого сотрудника", "как нанять первого работника", "как нанять первого сотрудника?"],
+    ["сколько денег нужно на старт", "сколько нужно денег на старт", "сколько денег нужно на старт?"],
+    ["как продвигать в соцсетях", "как продвигаться в соцсетях", "как продвигать бизнес в соцсетях"],
+    ["как выбрать поставщика", "как выбирать поставщиков", "как выбрать поставщика?"],
+    # противоположные по смыслу вопросы отличаются одним словом — не должны делить ответ
+    ["как законно снизить налоги", "как снизить налоги законно", "как законно снизить налоги?"],
+    ["как незаконно снизить налоги", "как снизить налоги незаконно"],
+    ["как открыть вторую точку", "как открыть вторую точку?"],
+    ["как закрыть вторую точку", "как закрыть вторую точку?"],
+]
+_FOLLOW_UPS = ["а если бюджет меньше?", "подробнее про второй пункт", "а это дорого?", "почему?"]
+
+
+def bench_answer_cache(args: argparse.Namespace) -> None:
+    rnd = random.Random(17)
+    cache = AnswerCache(max_size=args.size, ttl=0, business_threshold=args.threshold)
+    llm_calls = 0
+    wrong = 0
+    asked = 0
+    # intent, из которого был сгенерирован закэшированный ответ
+    answers_intent: Dict[str, int] = {}
+    lookup_us: List[float] = []
+    for _ in range(args.owners):
+        business = f"{rnd.choice(_ADJECTIVES) + ' ' if rnd.random() < 0.5 else ''}{rnd.choice(_BUSINESSES[:args.kinds])} {rnd.choice(_PLACES)}"
+        for _ in range(args.questions):
+            asked += 1
+            if rnd.random() < args.follow_up_rate:
+                question, intent = rnd.choice(_FOLLOW_UPS), -1
+            else:
+                intent = rnd.randrange(len(_INTENTS))
+                question = rnd.choice(_INTENTS[intent])
+            t0 = time.perf_counter()
+            answer = cache.lookup(business, question)
+            lookup_us.append((time.perf_counter() - t0) * 1e6)
+            if answer is None:
+                llm_calls += 1
+                answer = f"ответ #{llm_calls}"
+                answers_intent[answer] = intent
+                cache.store(business, question, answer)
+            elif answers_intent.get(answer) != intent:
+                wrong += 1
+    stats = cache.stats()
+    print(
+        f"{args.owners} owners x {args.questions} questions, {args.kinds} business kinds, "
+        f"{args.follow_up_rate:.0%} follow-ups, business threshold {args.threshold}"
+    )
+    print(
+        f"asked={asked} llm_calls={llm_calls} answered_from_cache={asked - llm_calls} "
+        f"({(asked - llm_calls) / asked:.1%}) wrong_intent_hits={wrong} "
+        f"lookup p50={percentile(lookup_us, 50):.0f}us p99={percentile(lookup_us, 99):.0f}us"
+    )
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+# === faq-prewarm: первый запрос FAQ после деплоя без прогрева и с ним ===
+
+def bench_faq_prewarm(args: argparse.Namespace) -> None:
+    rnd = random.Random(23)
+    catalog = [synthetic_business(rnd) for _ in range(args.businesses)]
+    # популярность бизнесов — по Ципфу: немного очень частых и длинный хвост
+    weights = [1.0 / (rank + 1) ** args.zipf for rank in range(len(catalog))]
+    tmp = tempfile.mkdtemp(prefix="bench-prewarm-")
+    try:
+        log = PacketLog(os.path.join(tmp, "packets"))
+        for business in rnd.choices(catalog, weights, k=args.history):
+            log.append({"type": "business_profile", "chat_id": rnd.randrange(10**6), "business": business})
+        log.close()
+        traffic = rnd.choices(catalog, weights, k=args.users)
+        faqs = [{"q": "Вопрос?", "a": "Ответ."}]
+        print(
+            f"{args.history} business_profile packets over {args.businesses} businesses (zipf {args.zipf}), "
+            f"{args.users} users after deploy, LLM latency {args.latency * 1000:.0f}ms"
+        )
+
+        for mode in ("cold", "prewarmed"):
+            prewarm_calls = 0
+            if mode == "prewarmed":
+                # «старый» процесс прогрел и сохранил наборы; «новый» только читает файл
+                def fake_generate(business: str) -> List[Dict[str, str]]:
+                    nonlocal prewarm_calls
+                    prewarm_calls += 1
+                    return faqs
+
+                old_cache = LruTtlCache(max_size=args.cache_size, ttl=0)
+                warmer = FaqPrewarmer(
+                    os.path.join(tmp, "packets"), os.path.join(tmp, "prewarm.json"),
+                    generate=fake_generate,
+                    install=lambda business, items: old_cache.set(normalize_key(business), items) or True,
+                    cached=old_cache.peek,
+                    top_n=args.top, min_count=args.min_count, per_minute=1e9,
+                )
+                t0 = time.perf_counter()
+                warmer.run_once()
+                scan_ms = (time.perf_counter() - t0) * 1000
+
+            cache = LruTtlCache(max_size=args.cache_size, ttl=0)
+            load_ms = 0.0
+            if mode == "prewarmed":
+                loader = FaqPrewarmer(
+                    os.path.join(tmp, "packets"), os.path.join(tmp, "prewarm.json"),
+                    generate=lambda business: faqs,
+                    install=lambda business, items: cache.set(normalize_key(business), items) or True,
+                    cached=cache.peek,
+                )
+                t0 = time.perf_counter()
+                loader.load()
+                load_ms = (time.perf_counter() - t0) * 1000
+
+            waits: List[float] = []
+            llm_calls = 0
+            for business in traffic:
+                if cache.peek(normalize_key(business)) is not None:
+                    waits.append(0.0)
+                    continue
+                llm_calls += 1
+                cache.set(normalize_key(business), faqs)
+                waits.append(args.latency * 1000)
+            instant = sum(1 for w in waits if w == 0.0)
+            early = waits[: max(1, len(waits) // 10)]
+            line = (
+                f"{mode:<10} instant={instant / len(waits):6.1%} "
+                f"first_{len(early)}_instant={sum(1 for w in early if w == 0.0) / len(early):6.1%} "
+                f"llm_calls_after_deploy={llm_calls:<5} "
+                f"wait p50={percentile(waits, 50):5.0f}ms p90={percentile(waits, 90):5.0f}ms "
+                f"mean={sum(waits) / len(waits):5.0f}ms"
+            )
+            if mode == "prewarmed":
+                line += (
+                    f" | prewarm llm_calls={prewarm_calls} scan+generate={scan_ms:.0f}ms "
+                    f"load_at_startup={load_ms:.1f}ms (at {args.per_minute:g}/min: {prewarm_calls / args.per_minute:.1f}min)"
+                )
+            print(line)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# === faq-stream: когда пользователь видит первую страницу FAQ ===
+
+def bench_faq_stream(args: argparse.Namespace) -> None:
+    server = FakeGroqServer(
+        port=0, latency=args.latency, jitter=args.jitter, chunk_delay=args.chunk_delay_ms / 1000,
+        decode_blocking=True, seed=5,
+    )
+    server.start()
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:bench")
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    os.environ.setdefault("GROQ_BASE_URL", server.base_url)
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench-faq-stream-"))
+    os.environ.setdefault("SESSION_STORE", "memory")
+    os.environ.setdefault("PACKET_ECHO_STDOUT", "0")
+    os.environ.setdefault("FAQ_PREWARM_ENABLED", "0")
+    import main
+
+    print(
+        f"{args.calls} generate_faqs calls, time to first token {args.latency * 1000:.0f}ms, "
+        f"{args.chunk_delay_ms:g}ms per 5-word chunk"
+    )
+    try:
+        for mode in ("blocking", "stream"):
+            first_page: List[float] = []
+            total: List[float] = []
+            for i in range(args.calls):
+                business = f"бизнес {mode} {i}"
+                t0 = time.perf_counter()
+                first: List[float] = []
+                if mode == "blocking":
+                    faqs = main.generate_faqs(business)
+                else:
+                    def on_items(items: List[Dict[str, str]]) -> None:
+                        if len(items) >= 3 and not first:
+                            first.append(time.perf_counter() - t0)
+
+                    faqs, _complete = main.generate_faqs_stream(business, on_items=on_items)
+                elapsed = time.perf_counter() - t0
+                assert len(faqs) == 9, faqs
+                total.append(elapsed * 1000)
+                first_page.append((first[0] if first else elapsed) * 1000)
+            print(
+                f"{mode:<9} first page p50={percentile(first_page, 50):6.0f}ms p90={percentile(first_page, 90):6.0f}ms "
+                f"| full list p50={percentile(total, 50):6.0f}ms p90={percentile(total, 90):6.0f}ms"
+            )
+    finally:
+        server.stop()
+
+    # сломанный JSON: оборванный по max_tokens и вовсе не JSON
+    text = json.dumps({"faqs": [{"q": f"Вопрос {i}?", "a": f"Ответ {i}."} for i in range(9)]}, ensure_ascii=False)
+    for label, broken in (("truncated", text[: len(text) // 2]), ("not json", "Извини, вот вопросы: 1) ...")):
+        parser = FaqStreamParser(9)
+        for i in range(0, len(broken), 7):
+            parser.feed(broken[i:i + 7])
+        faqs, complete = main.finish_faq_stream(parser)
+        print(f"{label:<9} streamed={len(parser.items)} result={len(faqs)} items complete={complete} first_q={faqs[0]['q']!r}")
+
+
+# === llm-routes: одна модель vs маршрут с SLO и запасной моделью ===
+
+def bench_llm_routes(args: argparse.Namespace) -> None:
+    from groq import Groq
+
+    primary, fallback = "quality", "instant"
+    server = FakeGroqServer(
+        port=0,
+        model_latency={primary: (args.primary_latency, args.primary_jitter), fallback: (args.fallback_latency, args.fallback_jitter)},
+        hang_rate=args.hang_rate,
+        hang_sec=args.hang_sec,
+        seed=13,
+    )
+    server.start()
+    client = Groq(api_key="x", base_url=server.base_url, max_retries=0)
+    messages = [{"role": "user", "content": "Владелец кофейни спрашивает: как посчитать себестоимость?"}]
+    print(
+        f"{primary}: {args.primary_latency * 1000:.0f}±{args.primary_jitter * 1000:.0f}ms "
+        f"(slow phase {args.slow_latency * 1000:.0f}ms), {fallback}: {args.fallback_latency * 1000:.0f}±"
+        f"{args.fallback_jitter * 1000:.0f}ms; {args.hang_rate:.0%} requests stall {args.hang_sec:g}s; SLO {args.slo * 1000:.0f}ms; "
+        f"{args.calls} answer calls per phase, {args.concurrency} at a time"
+    )
+    modes = {
+        "single": Route(model=primary, max_tokens=1024),
+        "routed": Route(model=primary, max_tokens=1024, slo=args.slo, fallback_model=fallback),
+    }
+    try:
+        for mode, route in modes.items():
+            gateway = LlmGateway({"answer": CallPolicy(timeout=30.0, retries=1)}, rng=random.Random(5))
+            router = ModelRouter({"answer": route}, window=args.window, degrade_cooldown=args.cooldown, workers=2 * args.concurrency)
+
+            def create(model: str, timeout: float) -> str:
+                completion = client.chat.completions.create(
+                    model=model, messages=messages, temperature=0.3, max_tokens=route.max_tokens, timeout=timeout,
+                )
+                usage = completion.usage
+                router.record_usage("answer", model, usage.prompt_tokens, usage.completion_tokens)
+                return completion.choices[0].message.content
+
+            def one_call(_: int) -> float:
+                t0 = time.perf_counter()
+                router.call("answer", lambda model: gateway.call("answer", create, model))
+                return (time.perf_counter() - t0) * 1000
+
+            for phase, latency in (("normal", args.primary_latency), ("slow", args.slow_latency)):
+                server.model_latency[primary] = (latency, args.primary_jitter)
+                before = dict(router.stats()["answer"])
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    samples = list(pool.map(one_call, range(args.calls)))
+                after = router.stats()["answer"]
+                delta = {k: after[k] - before[k] for k in ("fallbacks", "fallback_wins", "degraded_calls")}
+                print(
+                    f"{mode:<7} {phase:<7} p50={percentile(samples, 50):6.0f}ms p90={percentile(samples, 90):6.0f}ms "
+                    f"p99={percentile(samples, 99):6.0f}ms over_slo={sum(1 for ms in samples if ms > args.slo * 1000):<4} "
+                    f"fallbacks={delta['fallbacks']:<4} fallback_wins={delta['fallback_wins']:<4} "
+                    f"degraded_calls={delta['degraded_calls']}"
+                )
+            print(f"{'':<7} routes {json.dumps(router.stats(), ensure_ascii=False)}")
+    finally:
+        server.stop()
+
+
+# === CLI ===
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("packet-write", help="латентность save_packet при растущем объёме лога")
+    p.add_argument("--volumes", type=int, nargs="+", default=[0, 10_000, 100_000, 300_000])
+    p.add_argument("--samples", type=int, default=2000)
+    p.add_argument("--legacy", action="store_true", help="для сравнения прогнать старую схему")
+    p.add_argument("--legacy-volumes", type=int, nargs="+", default=[0, 500, 2000])
+    p.add_argument("--legacy-samples", type=int, default=50)
+    p.set_defaults(func=bench_packet_write)
+
+    p = sub.add_parser("similarity", help="латентность поиска похожих описаний бизнеса")
+    p.add_argument("--size", type=int, default=100_000)
+    p.add_argument("--queries", type=int, default=2000)
+    p.add_argument("--threshold", type=float, default=0.8)
+    p.set_defaults(func=bench_similarity)
+
+    p = sub.add_parser("telegram-burst", help="всплеск экранов в тысячи чатов: как было vs через OutboundLimiter")
+    p.add_argument("--chats", type=int, default=2000)
+    p.add_argument("--screens", type=int, default=1)
+    p.add_argument("--workers", type=int, default=64)
+    p.add_argument("--global-rate", type=float, default=30.0)
+    p.add_argument("--chat-rate", type=float, default=1.0)
+    p.add_argument("--chat-burst", type=float, default=3.0)
+    p.add_argument("--latency", type=float, default=0.03, help="время ответа Bot API, с")
+    p.set_defaults(func=bench_telegram_burst)
+
+    p = sub.add_parser("telegram-flow", help="задержка, которую лимитер добавляет к сценарию ввода бизнеса")
+    # мало чатов — чтобы мерить лимит чата, а не общий лимит бота
+    p.add_argument("--chats", type=int, default=4)
+    p.add_argument("--flows", type=int, default=5)
+    p.add_argument("--think", type=float, default=2.0, help="пауза пользователя между сценариями, с")
+    p.add_argument("--global-rate", type=float, default=30.0)
+    p.add_argument("--chat-rate", type=float, default=1.0)
+    p.add_argument("--chat-burst", type=float, default=3.0)
+    p.add_argument("--latency", type=float, default=0.03, help="время ответа Bot API, с")
+    p.set_defaults(func=bench_telegram_flow)
+
+    p = sub.add_parser("sessions", help="память на N чатов: dict-сессии vs компактные Session")
+    p.add_argument("--chats", type=int, default=100_000)
+    p.add_argument("--businesses", type=int, default=2000, help="сколько разных бизнесов (наборов FAQ)")
+    p.add_argument("--mode", choices=["dict", "compact"], help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_sessions)
+
+    p = sub.add_parser("singleflight", help="наплыв одинаковых бизнесов: LLM-вызовы без и с single-flight")
+    p.add_argument("--users", type=int, default=300)
+    p.add_argument("--businesses", type=int, default=5)
+    p.add_argument("--window", type=float, default=2.0, help="за сколько секунд приходят все пользователи")
+    p.add_argument("--latency", type=float, default=1.5, help="время ответа LLM, с")
+    p.set_defaults(func=bench_singleflight)
+
+    p = sub.add_parser("llm-chaos", help="задержки, ошибки и отказ Groq: клиент как было vs LlmGateway")
+    p.add_argument("--calls", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=20)
+    p.add_argument("--latency", type=float, default=0.15, help="типичное время ответа fake Groq, с")
+    p.add_argument("--jitter", type=float, default=0.1)
+    p.add_argument("--hang-sec", type=float, default=10.0, help="сколько висит «зависший» запрос, с")
+    p.add_argument("--timeout", type=float, default=1.0, help="таймаут попытки в шлюзе, с")
+    p.add_argument("--hedge-after", type=float, default=0.3)
+    p.add_argument("--breaker-reset", type=float, default=2.0)
+    p.set_defaults(func=bench_llm_chaos)
+
+    p = sub.add_parser("prompt-budget", help="размер промпта ask_llm и латентность: три ответа целиком vs бюджет и конспект")
+    p.add_argument("--packets", default="", help="каталог лога пакетов с user_question; без него — синтетические диалоги")
+    p.add_argument("--chats", type=int, default=300)
+    p.add_argument("--questions", type=int, default=8)
+    p.add_argument("--budget", type=int, default=1500)
+    p.add_argument("--latency-calls", type=int, default=150)
+    p.add_argument("--latency", type=float, default=0.1)
+    p.add_argument("--jitter", type=float, default=0.02)
+    p.add_argument("--prefill-ms-per-1k", type=float, default=150.0)
+    p.set_defaults(func=bench_prompt_budget)
+
+    p = sub.add_parser("answer-cache", help="сколько своих вопросов отвечается из кэша ответов без LLM")
+    p.add_argument("--owners", type=int, default=3000)
+    p.add_argument("--questions", type=int, default=4)
+    p.add_argument("--kinds", type=int, default=18, help="сколько видов бизнеса из списка")
+    p.add_argument("--follow-up-rate", type=float, default=0.2)
+    p.add_argument("--threshold", type=float, default=0.8)
+    p.add_argument("--size", type=int, default=20000)
+    p.set_defaults(func=bench_answer_cache)
+
+    p = sub.add_parser("faq-prewarm", help="первые запросы FAQ после деплоя: без прогрева vs прогретые популярные бизнесы")
+    p.add_argument("--businesses", type=int, default=5000)
+    p.add_argument("--history", type=int, default=50_000, help="сколько business_profile пакетов в логе")
+    p.add_argument("--users", type=int, default=5000)
+    p.add_argument("--zipf", type=float, default=1.1)
+    p.add_argument("--top", type=int, default=200)
+    p.add_argument("--min-count", type=float, default=3.0)
+    p.add_argument("--per-minute", type=float, default=20.0)
+    p.add_argument("--cache-size", type=int, default=5000)
+    p.add_argument("--latency", type=float, default=3.0, help="время generate_faqs, с")
+    p.set_defaults(func=bench_faq_prewarm)
+
+    p = sub.add_parser("faq-stream", help="первая страница FAQ: ждать весь JSON vs потоковый разбор")
+    p.add_argument("--calls", type=int, default=20)
+    p.add_argument("--latency", type=float, default=0.3, help="время до первого токена, с")
+    p.add_argument("--jitter", type=float, default=0.05)
+    p.add_argument("--chunk-delay-ms", type=float, default=40.0, help="генерация 5 слов, мс")
+    p.set_defaults(func=bench_faq_stream)
+
+    p = sub.add_parser("llm-routes", help="ответы: одна модель vs маршрут с SLO и запасной быстрой моделью")
+    p.add_argument("--calls", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=10)
+    p.add_argument("--primary-latency", type=float, default=0.6)
+    p.add_argument("--primary-jitter", type=float, default=0.4)
+    p.add_argument("--slow-latency", type=float, default=2.5, help="задержка основной модели во второй фазе, с")
+    p.add_argument("--fallback-latency", type=float, default=0.2)
+    p.add_argument("--fallback-jitter", type=float, default=0.05)
+    p.add_argument("--hang-rate", type=float, default=0.04)
+    p.add_argument("--hang-sec", type=float, default=4.0)
+    p.add_argument("--slo", type=float, default=1.2)
+    p.add_argument("--window", type=int, default=50)
+    p.add_argument("--cooldown", type=float, default=60.0)
+    p.set_defaults(func=bench_llm_routes)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,240 @@
+import os
+import re
+import json
+import time
+import threading
+import contextlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки
+    fcntl = None  # type: ignore[assignment]
+
+# === КЭШ С LRU + TTL ===
+
+
+_PUNCT_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_key(text: str) -> str:
+    """
+    Нормализация пользовательского текста для ключа кэша:
+    регистр, ё→е, пунктуация и лишние пробелы не важны.
+    «Кофейня у дома!» и «  кофейня  у дома» дают один ключ.
+    """
+    text = (text or "").lower().replace("ё", "е")
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+@contextlib.contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Эксклюзивная блокировка между процессами на время «прочитать — слить — записать» файла path.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class LruTtlCache:
+    """
+    Потокобезопасный кэш ограниченного размера:
+    - вытеснение самых давно использованных (LRU) при переполнении,
+    - у каждой записи свой срок жизни ttl (секунды, 0 — бессрочно),
+    - счётчики hits / misses / expired / evictions в stats(),
+    - необязательное сохранение на диск (JSON) и загрузка при старте.
+
+    Ключи при сохранении на диск должны быть строками, значения — JSON-совместимыми.
+    Один файл могут сохранять несколько процессов (воркеры sharding.py): save()
+    под файловой блокировкой сливает свои записи с тем, что уже лежит на диске,
+    так что записи других процессов не теряются.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 0.0, path: Optional[str] = None) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path or None
+
+        self._lock = threading.Lock()
+        # key -> (expires_at (wall clock, 0 — бессрочно), value)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._dirty = False
+        # удалённые с прошлого save() ключи — их не возвращаем из файла при слиянии
+        self._deleted: Set[Hashable] = set()
+        self._cleared = False
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key) is not None
+
+    def _alive(self, expires_at: float, now: float) -> bool:
+        return not expires_at or expires_at > now
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if not self._alive(expires_at, now):
+                del self._data[key]
+                self._dirty = True
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable, touch: bool = False) -> Any:
+        """
+        Значение без учёта в статистике. touch=True — заодно поднять запись в LRU.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or not self._alive(item[0], time.time()):
+                return None
+            if touch:
+                self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            self._deleted.discard(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._data.keys())
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._deleted.add(key)
+                self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._deleted.clear()
+            self._cleared = True
+            self._dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    # --- диск ---
+
+    def save(self, force: bool = False) -> bool:
+        """
+        Атомарно пишет живые записи в self.path (через временный файл + os.replace),
+        слив их с записями файла: чужие ключи остаются, по общему ключу побеждает
+        запись с более поздним сроком жизни (её сделали позже), при равенстве — своя.
+        Без изменений с прошлого сохранения ничего не делает.
+        """
+        if not self.path:
+            return False
+        now = time.time()
+        with self._lock:
+            if not self._dirty and not force:
+                return False
+            ours: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict(
+                (key, item) for key, item in self._data.items() if self._alive(item[0], now)
+            )
+            deleted, self._deleted = self._deleted, set()
+            cleared, self._cleared = self._cleared, False
+            self._dirty = False
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with file_lock(self.path):
+            # чужие записи — старше своих в порядке LRU, при переполнении уходят первыми
+            items: List[List[Any]] = []
+            for key, expires_at, value in ([] if cleared else self._read_items()):
+                if key in deleted or not self._alive(expires_at, now):
+                    continue
+                mine = ours.get(key)
+                if mine is None:
+                    items.append([key, expires_at, value])
+                elif expires_at and mine[0] and expires_at > mine[0]:
+                    ours[key] = (expires_at, value)
+            items.extend([key, expires_at, value] for key, (expires_at, value) in ours.items())
+            items = items[-self.max_size:]
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"items": items}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        return True
+
+    def _read_items(self) -> List[Tuple[Hashable, float, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+        items: List[Tuple[Hashable, float, Any]] = []
+        for item in data.get("items", []):
+            try:
+                key, expires_at, value = item
+            except (TypeError, ValueError):
+                continue
+            items.append((key, expires_at, value))
+        return items
+
+    def load(self) -> int:
+        """
+        Подгружает записи из self.path (порядок LRU сохраняется). Возвращает число записей.
+        """
+        if not self.path:
+            return 0
+        items = self._read_items()
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for key, expires_at, value in items:
+                if not self._alive(expires_at, now):
+                    continue
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+                loaded += 1
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return loaded
@@ -0,0 +1,154 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, Set, Tuple
+
+# === ДИСПЕТЧЕР АПДЕЙТОВ ПО ЧАТАМ ===
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(ordered: list, p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+class ChatDispatcher:
+    """
+    Очередь FIFO на каждый чат поверх общего ограниченного пула потоков:
+    апдейты одного чата выполняются строго по очереди (сессия и last_message_id
+    не гоняются), разные чаты — параллельно, до workers одновременно.
+
+    Задача в пуле обрабатывает один апдейт и, если у чата есть ещё, ставит
+    себя в конец пула заново — так длинная очередь одного чата не держит
+    поток, пока остальные ждут.
+
+    Если у чата уже max_backlog необработанных апдейтов, новые выбрасываются
+    и считаются в stats()["dropped"].
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        workers: int = 16,
+        max_backlog: int = 20,
+        wait_samples: int = 1000,
+        name: str = "chat-dispatcher",
+    ) -> None:
+        self.handler = handler
+        self.workers = workers
+        self.max_backlog = max_backlog
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        # chat -> очередь (время постановки, апдейт)
+        self._queues: Dict[Hashable, Deque[Tuple[float, Any]]] = {}
+        # чаты, у которых задача уже стоит в пуле или выполняется
+        self._scheduled: Set[Hashable] = set()
+        self._depth = 0
+        self._waits: Deque[float] = deque(maxlen=wait_samples)
+
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.max_chat_depth = 0
+
+    def submit(self, key: Hashable, item: Any) -> bool:
+        """
+        Ставит апдейт в очередь чата key. False — очередь чата переполнена, апдейт выброшен.
+        """
+        with self._lock:
+            q = self._queues.get(key)
+            if q is None:
+                q = self._queues[key] = deque()
+            if len(q) >= self.max_backlog:
+                self.dropped += 1
+                return False
+            q.append((time.monotonic(), item))
+            self.submitted += 1
+            self._depth += 1
+            self.max_depth = max(self.max_depth, self._depth)
+            self.max_chat_depth = max(self.max_chat_depth, len(q))
+            if key in self._scheduled:
+                return True
+            self._scheduled.add(key)
+        self._pool.submit(self._run_one, key)
+        return True
+
+    def _run_one(self, key: Hashable) -> None:
+        with self._lock:
+            queued_at, item = self._queues[key].popleft()
+            self._depth -= 1
+            self._waits.append((time.monotonic() - queued_at) * 1000)
+
+        failed = False
+        try:
+            self.handler(item)
+        except Exception:
+            failed = True
+            logger.exception("update handler failed")
+
+        with self._lock:
+            self.processed += 1
+            self.errors += failed
+            if self._queues[key]:
+                reschedule = True
+            else:
+                del self._queues[key]
+                self._scheduled.discard(key)
+                reschedule = False
+        if reschedule:
+            self._pool.submit(self._run_one, key)
+
+    def busy(self, key: Hashable) -> bool:
+        """
+        У чата key есть апдейт в очереди или в работе.
+        """
+        with self._lock:
+            return key in self._scheduled
+
+    def queue_depth(self) -> int:
+        return self._depth
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            active_chats = len(self._queues)
+        return {
+            "workers": self.workers,
+            "queue_depth": self._depth,
+            "active_chats": active_chats,
+            "max_depth": self.max_depth,
+            "max_chat_depth": self.max_chat_depth,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "wait_ms_p50": round(_percentile(waits, 50), 2),
+            "wait_ms_p99": round(_percentile(waits, 99), 2),
+            "wait_ms_max": round(waits[-1], 2) if waits else 0.0,
+        }
+
+    def wait_idle(self, poll: float = 0.01) -> None:
+        """
+        Ждёт, пока не останется ни поставленных, ни выполняющихся апдейтов.
+        """
+        while True:
+            with self._lock:
+                if not self._scheduled:
+                    return
+            time.sleep(poll)
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Перестаёт принимать задачи; при wait=True дожидается уже поставленных.
+        Апдейты, которые задача чата ставит себе следом, при этом тоже доедаются.
+        """
+        if wait:
+            self.wait_idle()
+        self._pool.shutdown(wait=wait)
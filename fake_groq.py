@@ -0,0 +1,262 @@
+"""
+Локальный фейковый Groq (OpenAI-совместимый /openai/v1/chat/completions)
+с управляемой задержкой и ошибками — для проверки бота и LlmGateway без сети.
+
+    python fake_groq.py --port 8090 --latency-ms 400 --error-rate 0.2 --hang-rate 0.05
+
+Бот направляется на него переменной окружения, которую читает сам клиент groq:
+
+    GROQ_BASE_URL=http://127.0.0.1:8090 python main.py
+
+Ответы детерминированы по виду запроса: короткий max_tokens — вердикт "OK",
+запрос FAQ — JSON со списком вопросов, остальное — текст ответа (поддерживается stream).
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # по умолчанию очередь accept всего 5 — сотня одновременных запросов
+    # упиралась бы в повторную отправку SYN, а не в задержку «Groq»
+    request_queue_size = 512
+    daemon_threads = True
+
+
+class FakeGroqServer:
+    """
+    Параметры можно менять на ходу (например, error_rate = 1.0 — «Groq лежит»):
+    - latency / jitter — задержка ответа, с; model_latency — свои (latency, jitter) для отдельных моделей;
+    - prefill_per_1k — добавка к задержке за каждую 1000 входных токенов, с;
+    - chunk_delay — пауза между кусками (по 5 слов) при stream, с;
+      decode_blocking — ответ без stream тоже ждёт столько, сколько шёл бы поток;
+    - error_rate — доля ответов error_status (503, 500, 429 ...);
+    - hang_rate — доля запросов, которые висят hang_sec секунд перед ответом.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8090,
+        latency: float = 0.2,
+        jitter: float = 0.1,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        hang_rate: float = 0.0,
+        hang_sec: float = 60.0,
+        prefill_per_1k: float = 0.0,
+        chunk_delay: float = 0.01,
+        decode_blocking: bool = False,
+        model_latency: Optional[Dict[str, Tuple[float, float]]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.latency = latency
+        self.prefill_per_1k = prefill_per_1k
+        self.chunk_delay = chunk_delay
+        self.decode_blocking = decode_blocking
+        self.model_latency: Dict[str, Tuple[float, float]] = dict(model_latency or {})
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate
+        self.hang_sec = hang_sec
+        self.rng = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "errors": 0, "hangs": 0, "ok": 0}
+        self.httpd = _HTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _fate(self, prompt_tokens: int, model: str = "") -> str:
+        latency, jitter = self.model_latency.get(model, (self.latency, self.jitter))
+        with self._lock:
+            roll = self.rng.random()
+            delay = max(0.0, latency + self.rng.uniform(-jitter, jitter))
+        delay += prompt_tokens / 1000 * self.prefill_per_1k
+        if roll < self.hang_rate:
+            return "hang"
+        if roll < self.hang_rate + self.error_rate:
+            return "error"
+        time.sleep(delay)
+        return "ok"
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _json(self, code: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self) -> None:
+                server._count("requests")
+                length = int(self.headers.get("Content-Length", "0") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.split("?", 1)[0] != COMPLETIONS_PATH:
+                    return self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+                fate = server._fate(_usage(request, "")["prompt_tokens"], str(request.get("model", "")))
+                try:
+                    if fate == "hang":
+                        server._count("hangs")
+                        time.sleep(server.hang_sec)
+                    elif fate == "error":
+                        server._count("errors")
+                        headers = {"retry-after": "1"} if server.error_status == 429 else None
+                        return self._json(server.error_status, {
+                            "error": {"message": "injected failure", "type": "server_error"},
+                        }, headers)
+                    server._count("ok")
+                    text = fake_reply(request)
+                    if request.get("stream"):
+                        return self._stream(request, text)
+                    if server.decode_blocking:
+                        time.sleep(server.chunk_delay * ((len(text.split(" ")) + 4) // 5))
+                    self._json(200, completion_body(request, text))
+                except (BrokenPipeError, ConnectionResetError):
+                    # клиент уже ушёл по таймауту
+                    pass
+
+            def _stream(self, request: Dict[str, Any], text: str) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                words = text.split(" ")
+                for i in range(0, len(words), 5):
+                    piece = " ".join(words[i:i + 5]) + (" " if i + 5 < len(words) else "")
+                    chunk = chunk_body(request, {"content": piece}, None)
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(server.chunk_delay)
+                done = chunk_body(request, {}, "stop")
+                self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.close_connection = True
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-groq", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def fake_reply(request: Dict[str, Any]) -> str:
+    messages: List[Dict[str, str]] = request.get("messages") or []
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    if (request.get("max_tokens") or 1024) <= 16:
+        return "OK"
+    if '"faqs"' in prompt:
+        faqs = [{"q": f"Типовой вопрос {i}?", "a": f"Короткий практичный ответ {i}."} for i in range(1, 10)]
+        return json.dumps({"faqs": faqs}, ensure_ascii=False)
+    return "1. Посчитай расходы. 2. Найди первых клиентов. 3. Собери отзывы и улучши продукт."
+
+
+def _usage(request: Dict[str, Any], text: str) -> Dict[str, int]:
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages") or []) // 4
+    completion_tokens = len(text) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def completion_body(request: Dict[str, Any], text: str) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": _usage(request, text),
+    }
+
+
+def chunk_body(request: Dict[str, Any], delta: Dict[str, str], finish_reason: Optional[str]) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": request.get("model", "fake"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-sec", type=float, default=60.0)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0)
+    parser.add_argument("--chunk-delay-ms", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    server = FakeGroqServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        hang_rate=args.hang_rate,
+        hang_sec=args.hang_sec,
+        prefill_per_1k=args.prefill_ms_per_1k / 1000,
+        chunk_delay=args.chunk_delay_ms / 1000,
+    )
+    print(f"fake Groq on {server.base_url} (GROQ_BASE_URL={server.base_url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,95 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# === ПОТОКОВЫЙ РАЗБОР FAQ ===
+#
+# generate_faqs ждал весь JSON {"faqs":[{"q","a"}, ...]} целиком, хотя первой
+# странице хватает трёх пунктов. FaqStreamParser получает текст кусками по мере
+# генерации и отдаёт каждый пункт, как только закрылся его объект.
+#
+# Разбор — однопроходный сканер: помнит, внутри ли мы строки (и экранирования),
+# и стек открытых скобок. Объект, открытый прямо внутри массива "faqs" верхнего
+# объекта, при закрытии разбирается json.loads по своему срезу. Всё, что вне
+# JSON (```json и пояснения модели), пропускается. Итог по всему тексту всё
+# равно считает parse_faqs — с его запасным пунктом для сломанного JSON.
+
+
+class FaqStreamParser:
+    """
+    feed(chunk) -> новые готовые пункты [{q, a}, ...]; все готовые — в items,
+    весь полученный текст — в text. Пунктов не больше n.
+    """
+
+    def __init__(self, n: int = 9) -> None:
+        self.n = n
+        self.items: List[Dict[str, str]] = []
+        self.text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key: Optional[str] = None
+        self._faqs_array = False
+        self._item_start = -1
+
+    @property
+    def done(self) -> bool:
+        return len(self.items) >= self.n
+
+    def _item(self, raw: str) -> Optional[Dict[str, str]]:
+        try:
+            data: Any = json.loads(raw)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        q = str(data.get("q") or "").strip()
+        a = str(data.get("a") or "").strip()
+        return {"q": q, "a": a} if q and a else None
+
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        self.text += chunk
+        text = self.text
+        fresh: List[Dict[str, str]] = []
+        stack = self._stack
+        i = self._pos
+        end = len(text)
+        while i < end:
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(stack) == 1:
+                        # строка на верхнем уровне объекта — возможно, ключ "faqs"
+                        try:
+                            self._last_key = json.loads(text[self._string_start:i + 1])
+                        except ValueError:
+                            self._last_key = None
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "[" and stack == ["{"]:
+                    self._faqs_array = self._last_key == "faqs"
+                elif ch == "{" and self._faqs_array and stack == ["{", "["]:
+                    self._item_start = i
+                stack.append(ch)
+            elif ch in "}]":
+                if stack:
+                    stack.pop()
+                if ch == "}" and self._item_start >= 0 and stack == ["{", "["]:
+                    item = self._item(text[self._item_start:i + 1])
+                    self._item_start = -1
+                    if item is not None and not self.done:
+                        self.items.append(item)
+                        fresh.append(item)
+                elif ch == "]" and stack == ["{"]:
+                    self._faqs_array = False
+            i += 1
+        self._pos = end
+        return fresh
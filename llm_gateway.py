@@ -0,0 +1,338 @@
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple, Type
+
+import httpx
+from groq import APIConnectionError
+
+# === ШЛЮЗ К LLM: ТАЙМАУТЫ, ПОВТОРЫ, ПРЕДОХРАНИТЕЛЬ, ХЕДЖИРОВАНИЕ ===
+#
+# Все запросы к Groq идут через LlmGateway.call / acall с видом вызова
+# ("faq", "classify", "answer"). У каждого вида своя политика: таймаут
+# попытки, число повторов и (по желанию) хедж — второй такой же запрос,
+# если первый не ответил за hedge_after секунд; берётся первый успешный.
+# Повторы — с экспоненциальной задержкой и полным джиттером.
+# Предохранитель — свой у каждой модели (breaker_key): после failure_threshold
+# подряд неудачных попыток запросы к ней не отправляются reset_timeout секунд и сразу падают с
+# LlmUnavailable — хендлеры показывают пользователю вежливый экран.
+# Запрос, который Groq отверг (4xx), не повторяется и падает с LlmRejected —
+# подвидом LlmUnavailable, чтобы пользователь увидел тот же экран, а не «Думаю…».
+
+
+class LlmUnavailable(Exception):
+    """
+    LLM сейчас недоступна: предохранитель разомкнут или исчерпаны повторы.
+    """
+
+
+class LlmRejected(LlmUnavailable):
+    """
+    Groq отверг запрос (400/401/403/404/413, ...): неверный ключ, модель маршрута
+    или слишком длинный промпт. Повтор не поможет, но пользователю нужен тот же
+    вежливый экран, поэтому это подвид LlmUnavailable. status_code — код ответа.
+    """
+
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CallPolicy(NamedTuple):
+    timeout: float
+    retries: int = 2
+    hedge_after: float = 0.0     # 0 — без хеджа
+
+
+# Сбои связи с Groq: таймауты и обрывы соединения клиента groq (APITimeoutError —
+# подкласс APIConnectionError), транспорта httpx (в том числе посреди стрима) и
+# наших wait_for / хеджа. asyncio.TimeoutError и concurrent.futures.TimeoutError
+# с Python 3.11 — это TimeoutError.
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    APIConnectionError,
+    httpx.TransportError,
+    TimeoutError,
+    ConnectionError,
+)
+
+RETRYABLE_STATUSES = (408, 409, 429)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Сбои связи (TRANSIENT_ERRORS), 408/409/429 и 5xx можно повторить.
+    Прочие 4xx — ошибка самого запроса, а любое другое исключение
+    (AttributeError, KeyError, ...) — ошибка в коде: повтор не поможет.
+    """
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return True
+    status = getattr(exc, "status_code", None)
+    if not isinstance(status, int):
+        return False
+    return status in RETRYABLE_STATUSES or status >= 500
+
+
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold неудач подряд) -> open -> (reset_timeout) ->
+    half_open: пропускает одну пробную попытку; успех закрывает, неудача снова открывает.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def release(self) -> None:
+        """
+        Попытка закончилась ничем, что говорило бы о здоровье сервиса (ошибка в нашем
+        коде): состояние не меняем, но пробную попытку half_open отпускаем.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                self.state = "open"
+                self.opened_at = self.clock()
+                self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "opens": self.opens}
+
+
+class LlmGateway:
+    """
+    call(kind, fn, *args) вызывает fn(*args, timeout=policy.timeout) по политике вида
+    kind; acall — то же для корутин. Статистика по видам — в stats().
+
+    Предохранитель у каждого breaker_key свой (ключ — модель): упавшая основная
+    модель не закрывает дорогу запасной. Новые создаёт breaker_factory.
+
+    С хеджем обе копии запроса идут в свой пул на hedge_workers потоков —
+    его размер должен покрывать по два запроса на каждый одновременный вызов.
+    """
+
+    def __init__(
+        self,
+        policies: Dict[str, CallPolicy],
+        breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+        hedge_workers: int = 32,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.policies = policies
+        self.breaker_factory = breaker_factory
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rng = rng or random.Random()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._hedge_workers = hedge_workers
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, key: str, n: int = 1) -> None:
+        with self._lock:
+            counters = self.counters.setdefault(kind, {
+                "calls": 0,
+                "attempts": 0,
+                "retries": 0,
+                "timeouts": 0,
+                "failures": 0,
+                "short_circuited": 0,
+                "rejected": 0,
+                "hedged": 0,
+                "hedge_wins": 0,
+            })
+            counters[key] += n
+
+    def breaker(self, key: str = "") -> CircuitBreaker:
+        with self._lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = self.breakers[key] = self.breaker_factory()
+            return breaker
+
+    def backoff(self, attempt: int) -> float:
+        # «полный джиттер»: равномерно от 0 до экспоненциального потолка
+        return self.rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _admit(self, kind: str, breaker: CircuitBreaker) -> None:
+        if not breaker.allow():
+            self._count(kind, "short_circuited")
+            raise LlmUnavailable(f"circuit open, {kind} call skipped")
+
+    def _failed(self, kind: str, breaker: CircuitBreaker, exc: BaseException, attempt: int, policy: CallPolicy) -> bool:
+        """
+        Учитывает неудачную попытку; True — стоит повторить.
+        """
+        if not is_retryable(exc):
+            if isinstance(getattr(exc, "status_code", None), int):
+                # ответ от сервиса пришёл — значит он жив
+                breaker.record_success()
+            else:
+                breaker.release()
+            return False
+        breaker.record_failure()
+        if isinstance(exc, TimeoutError) or "timeout" in type(exc).__name__.lower():
+            self._count(kind, "timeouts")
+        return attempt < policy.retries
+
+    def _reject(self, kind: str, exc: BaseException) -> None:
+        """
+        Неповторяемая ошибка: ответ Groq с кодом — LlmRejected, ошибка в коде — как есть.
+        """
+        status = getattr(exc, "status_code", None)
+        if not isinstance(status, int):
+            raise exc
+        self._count(kind, "rejected")
+        raise LlmRejected(f"{kind} call rejected with status {status}", status) from exc
+
+    # --- потоки ---
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=self._hedge_workers, thread_name_prefix="llm-hedge")
+            return self._hedge_pool
+
+    def _attempt(self, kind: str, policy: CallPolicy, fn: Callable[..., Any], args: Any) -> Any:
+        if policy.hedge_after <= 0:
+            return fn(*args, timeout=policy.timeout)
+        pool = self._pool()
+        primary = pool.submit(fn, *args, timeout=policy.timeout)
+        done, _ = wait([primary], timeout=policy.hedge_after)
+        if done:
+            return primary.result()
+        self._count(kind, "hedged")
+        hedge = pool.submit(fn, *args, timeout=policy.timeout)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count(kind, "hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, kind: str, fn: Callable[..., Any], *args: Any, breaker_key: str = "") -> Any:
+        policy = self.policies[kind]
+        breaker = self.breaker(breaker_key)
+        self._count(kind, "calls")
+        attempt = 0
+        while True:
+            self._admit(kind, breaker)
+            self._count(kind, "attempts")
+            try:
+                result = self._attempt(kind, policy, fn, args)
+            except Exception as e:
+                if not self._failed(kind, breaker, e, attempt, policy):
+                    if not is_retryable(e):
+                        self._reject(kind, e)
+                    self._count(kind, "failures")
+                    raise LlmUnavailable(f"{kind} call failed after {attempt + 1} attempts") from e
+                attempt += 1
+                self._count(kind, "retries")
+                time.sleep(self.backoff(attempt))
+                continue
+            breaker.record_success()
+            return result
+
+    # --- asyncio ---
+
+    async def _aattempt(self, kind: str, policy: CallPolicy, fn: Callable[..., Awaitable[Any]], args: Any) -> Any:
+        if policy.hedge_after <= 0:
+            return await asyncio.wait_for(fn(*args, timeout=policy.timeout), policy.timeout)
+        tasks = [asyncio.ensure_future(asyncio.wait_for(fn(*args, timeout=policy.timeout), policy.timeout))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=policy.hedge_after)
+            if not done:
+                self._count(kind, "hedged")
+                tasks.append(asyncio.ensure_future(asyncio.wait_for(fn(*args, timeout=policy.timeout), policy.timeout)))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._count(kind, "hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # проигравший (или никому уже не нужный) запрос отменяем
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def acall(self, kind: str, fn: Callable[..., Awaitable[Any]], *args: Any, breaker_key: str = "") -> Any:
+        policy = self.policies[kind]
+        breaker = self.breaker(breaker_key)
+        self._count(kind, "calls")
+        attempt = 0
+        while True:
+            self._admit(kind, breaker)
+            self._count(kind, "attempts")
+            try:
+                result = await self._aattempt(kind, policy, fn, args)
+            except Exception as e:
+                if not self._failed(kind, breaker, e, attempt, policy):
+                    if not is_retryable(e):
+                        self._reject(kind, e)
+                    self._count(kind, "failures")
+                    raise LlmUnavailable(f"{kind} call failed after {attempt + 1} attempts") from e
+                attempt += 1
+                self._count(kind, "retries")
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {kind: dict(c) for kind, c in self.counters.items()}
+            breakers = dict(self.breakers)
+        stats["breakers"] = {key: breaker.snapshot() for key, breaker in breakers.items()}
+        return stats
@@ -0,0 +1,267 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Set
+
+# === МАРШРУТИЗАЦИЯ ВЫЗОВОВ LLM ПО МОДЕЛЯМ ===
+#
+# У каждого вида вызова ("classify", "faq", "answer") свой маршрут: модель,
+# max_tokens и SLO по задержке. Если основная модель не ответила за slo секунд
+# (или упала), параллельно уходит тот же запрос в более быструю fallback_model,
+# берётся первый успешный ответ. Если p90 основной модели по последним window
+# вызовам выше SLO, маршрут на degrade_cooldown секунд целиком переходит на
+# fallback_model, потом снова пробует основную.
+#
+# Каждая попытка внутри идёт через LlmGateway (таймауты, повторы, предохранитель).
+# Задержки и токены (usage из ответа) копятся по маршрутам и моделям — stats().
+
+
+class Route(NamedTuple):
+    model: str
+    max_tokens: int
+    slo: float = 0.0             # 0 — без SLO: fallback только при ошибке
+    fallback_model: str = ""     # "" — без запасной модели
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+class _ModelStats:
+    __slots__ = ("calls", "errors", "latencies", "prompt_tokens", "completion_tokens")
+
+    def __init__(self, samples: int) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=samples)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = list(self.latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+            "latency_p90_ms": round(_percentile(latencies, 90) * 1000, 1),
+            "latency_p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "completion_tokens_per_call": round(self.completion_tokens / self.calls, 1) if self.calls else 0.0,
+        }
+
+
+class _RouteState:
+    __slots__ = ("window", "degraded_until", "counters", "models")
+
+    def __init__(self, window: int) -> None:
+        self.window: Deque[float] = deque(maxlen=window)
+        self.degraded_until = 0.0
+        self.counters: Dict[str, int] = {
+            "calls": 0,
+            "slo_misses": 0,
+            "primary_errors": 0,
+            "fallbacks": 0,
+            "fallback_wins": 0,
+            "degraded_calls": 0,
+            "degradations": 0,
+        }
+        self.models: Dict[str, _ModelStats] = {}
+
+
+class ModelRouter:
+    """
+    call(kind, fn, *args) вызывает fn(model, *args) по маршруту kind; acall — то же
+    для корутин. fn сама сообщает токены через record_usage (из completion.usage).
+    Потоковые вызовы выбирают модель через pick() и отчитываются через record().
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, Route],
+        window: int = 50,
+        min_samples: int = 10,
+        degrade_cooldown: float = 60.0,
+        samples: int = 1000,
+        workers: int = 32,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.routes = routes
+        self.min_samples = min_samples
+        self.degrade_cooldown = degrade_cooldown
+        self.samples = samples
+        self.clock = clock
+        self._workers = workers
+        self._pool_: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._state: Dict[str, _RouteState] = {kind: _RouteState(window) for kind in routes}
+
+    def route(self, kind: str) -> Route:
+        return self.routes[kind]
+
+    def _model_stats(self, state: _RouteState, model: str) -> _ModelStats:
+        stats = state.models.get(model)
+        if stats is None:
+            stats = state.models[model] = _ModelStats(self.samples)
+        return stats
+
+    def pick(self, kind: str) -> str:
+        """
+        Модель для вызова сейчас: основная или fallback_model, если маршрут деградировал.
+        """
+        route = self.routes[kind]
+        with self._lock:
+            state = self._state[kind]
+            state.counters["calls"] += 1
+            if route.fallback_model and self.clock() < state.degraded_until:
+                state.counters["degraded_calls"] += 1
+                return route.fallback_model
+        return route.model
+
+    def record(self, kind: str, model: str, latency: float, ok: bool = True) -> None:
+        route = self.routes[kind]
+        with self._lock:
+            state = self._state[kind]
+            stats = self._model_stats(state, model)
+            stats.calls += 1
+            stats.errors += not ok
+            stats.latencies.append(latency)
+            if model != route.model or route.slo <= 0 or not route.fallback_model:
+                return
+            if self.clock() < state.degraded_until:
+                # запоздавшие вызовы основной модели, начатые до перехода на запасную
+                return
+            state.window.append(latency)
+            if len(state.window) >= self.min_samples and _percentile(list(state.window), 90) > route.slo:
+                state.degraded_until = self.clock() + self.degrade_cooldown
+                state.counters["degradations"] += 1
+                state.window.clear()
+
+    def record_usage(self, kind: str, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            stats = self._model_stats(self._state[kind], model)
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+
+    def _count(self, kind: str, key: str) -> None:
+        with self._lock:
+            self._state[kind].counters[key] += 1
+
+    def _fallback_for(self, kind: str, model: str) -> str:
+        route = self.routes[kind]
+        return route.fallback_model if route.fallback_model and route.fallback_model != model else ""
+
+    # --- потоки ---
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool_ is None:
+                self._pool_ = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="llm-route")
+            return self._pool_
+
+    def _timed(self, kind: str, model: str, fn: Callable[..., Any], args: Any) -> Any:
+        started = self.clock()
+        try:
+            result = fn(model, *args)
+        except Exception:
+            self.record(kind, model, self.clock() - started, ok=False)
+            raise
+        self.record(kind, model, self.clock() - started)
+        return result
+
+    def call(self, kind: str, fn: Callable[..., Any], *args: Any) -> Any:
+        model = self.pick(kind)
+        fallback = self._fallback_for(kind, model)
+        if not fallback:
+            return self._timed(kind, model, fn, args)
+
+        slo = self.routes[kind].slo
+        pool = self._pool()
+        primary = pool.submit(self._timed, kind, model, fn, args)
+        done, _ = wait([primary], timeout=slo if slo > 0 else None)
+        if done and primary.exception() is None:
+            return primary.result()
+        self._count(kind, "primary_errors" if done else "slo_misses")
+        self._count(kind, "fallbacks")
+        # основная модель не успела — не ждём её одну, но и не бросаем: кто первый
+        second = pool.submit(self._timed, kind, fallback, fn, args)
+        pending: Set["Future[Any]"] = {second} if done else {primary, second}
+        error: Optional[BaseException] = primary.exception() if done else None
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.exception() is None:
+                    if future is second:
+                        self._count(kind, "fallback_wins")
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    # --- asyncio ---
+
+    async def _atimed(self, kind: str, model: str, fn: Callable[..., Awaitable[Any]], args: Any) -> Any:
+        started = self.clock()
+        try:
+            result = await fn(model, *args)
+        except asyncio.CancelledError:
+            # проигравший запрос: его задержка — не меньше, чем он успел прождать
+            self.record(kind, model, self.clock() - started)
+            raise
+        except Exception:
+            self.record(kind, model, self.clock() - started, ok=False)
+            raise
+        self.record(kind, model, self.clock() - started)
+        return result
+
+    async def acall(self, kind: str, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        model = self.pick(kind)
+        fallback = self._fallback_for(kind, model)
+        if not fallback:
+            return await self._atimed(kind, model, fn, args)
+
+        slo = self.routes[kind].slo
+        tasks = [asyncio.ensure_future(self._atimed(kind, model, fn, args))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=slo if slo > 0 else None)
+            if done and tasks[0].exception() is None:
+                return tasks[0].result()
+            self._count(kind, "primary_errors" if done else "slo_misses")
+            self._count(kind, "fallbacks")
+            tasks.append(asyncio.ensure_future(self._atimed(kind, fallback, fn, args)))
+            pending = {tasks[1]} if done else set(tasks)
+            error: Optional[BaseException] = tasks[0].exception() if done else None
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            self._count(kind, "fallback_wins")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        stats: Dict[str, Any] = {}
+        with self._lock:
+            for kind, route in self.routes.items():
+                state = self._state[kind]
+                stats[kind] = {
+                    "model": route.model,
+                    "fallback_model": route.fallback_model,
+                    "max_tokens": route.max_tokens,
+                    "slo_ms": int(route.slo * 1000),
+                    "degraded": now < state.degraded_until,
+                    **state.counters,
+                    "models": {model: s.snapshot() for model, s in state.models.items()},
+                }
+        return stats
@@ -2,29 +2,237 @@
 import os
 import json
 import time
+import atexit
 import uuid
 import html
-from typing import Tuple, Any, Dict, List, Optional
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Tuple, Any, Callable, Dict, Iterator, List, Optional
 
 import telebot
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
 from groq import Groq
 
+from packet_log import PacketLog, PacketLogReader, PacketWriter
+from periodic import PeriodicTask
+from cache import LruTtlCache, normalize_key
+from similarity import SimilarityIndex
+from preclassifier import PreClassifier
+from dispatcher import ChatDispatcher
+from ratelimit import OutboundLimiter, telegram_error_kind
+from session_store import open_session_store
+from session import Session, faq_sets_count
+from prompt_budget import PromptBuilder, count_tokens, message_tokens
+from faq_stream import FaqStreamParser
+from answer_cache import AnswerCache
+from prewarm import FaqPrewarmer
+from webhook import WebhookServer
+from singleflight import SingleFlight, flight_key
+from llm_gateway import CallPolicy, CircuitBreaker, LlmGateway, LlmUnavailable
+from llm_router import ModelRouter, Route
+
 # === НАСТРОЙКИ ===
 
 API_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
-# HTML по умолчанию, чтобы везде работало форматирование
-bot = telebot.TeleBot(API_TOKEN, parse_mode="HTML")
+# Бот создаёт start_sync_runtime() (см. «ЗАПУСК»): async_bot импортирует этот модуль,
+# и импорт не должен поднимать sync-рантайм — клиентов, пулы потоков, фоновых писателей.
+bot: Optional[telebot.TeleBot] = None
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")  # TODO: подставь свой реальный ключ
 MODEL_NAME = "llama-3.1-8b-instant"
 
-client = Groq(api_key=GROQ_API_KEY)
+# синхронный клиент Groq создаётся при первом вызове, см. groq_client()
+client: Any = None
 
 DATA_DIR = os.getenv("DATA_DIR", "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
 LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "3"))
+LOG_CLEANUP_INTERVAL_SEC = int(os.getenv("LOG_CLEANUP_INTERVAL_SEC", "600"))
+
+# Лог пакетов: data/packets/<YYYYMMDDHH>/*.jsonl, ротация по размеру и возрасту сегмента
+PACKETS_DIR = os.path.join(DATA_DIR, "packets")
+PACKET_SEGMENT_MAX_BYTES = int(os.getenv("PACKET_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+PACKET_SEGMENT_MAX_AGE_SEC = int(os.getenv("PACKET_SEGMENT_MAX_AGE_SEC", "3600"))
+
+# Фоновая запись пакетов: очередь, групповая запись, политика fsync и переполнения
+PACKET_QUEUE_SIZE = int(os.getenv("PACKET_QUEUE_SIZE", "10000"))
+PACKET_BATCH_SIZE = int(os.getenv("PACKET_BATCH_SIZE", "500"))
+PACKET_FLUSH_INTERVAL_MS = int(os.getenv("PACKET_FLUSH_INTERVAL_MS", "200"))
+PACKET_FSYNC = os.getenv("PACKET_FSYNC", "none")                # none | batch | interval
+PACKET_QUEUE_FULL = os.getenv("PACKET_QUEUE_FULL", "block")     # block | drop | sync
+PACKET_ECHO_STDOUT = os.getenv("PACKET_ECHO_STDOUT", "1") == "1"
+
+packet_log = PacketLog(
+    PACKETS_DIR,
+    max_segment_bytes=PACKET_SEGMENT_MAX_BYTES,
+    max_segment_age=PACKET_SEGMENT_MAX_AGE_SEC,
+    flush_each=False,
+)
+
+packet_writer = PacketWriter(
+    packet_log,
+    max_queue=PACKET_QUEUE_SIZE,
+    batch_size=PACKET_BATCH_SIZE,
+    flush_interval=PACKET_FLUSH_INTERVAL_MS / 1000.0,
+    fsync_policy=PACKET_FSYNC,
+    overflow_policy=PACKET_QUEUE_FULL,
+    echo_stdout=PACKET_ECHO_STDOUT,
+)
+# поток писателя запускает start_shared_runtime(); до него submit пишет сразу в лог
+
+# Сессии: "sqlite" — переживают рестарт (пишутся пачками в фоне), "memory" — только в процессе
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(DATA_DIR, "sessions.sqlite3"))
+SESSION_FLUSH_INTERVAL_MS = int(os.getenv("SESSION_FLUSH_INTERVAL_MS", "500"))
+SESSION_HISTORY_SIZE = int(os.getenv("SESSION_HISTORY_SIZE", "3"))
+
+# В памяти держим не больше SESSION_MAX_IN_MEMORY сессий; простоявшие SESSION_IDLE_SEC
+# выгружаются в session_store и поднимаются обратно при следующем апдейте чата
+SESSION_MAX_IN_MEMORY = int(os.getenv("SESSION_MAX_IN_MEMORY", "50000"))
+SESSION_IDLE_SEC = int(os.getenv("SESSION_IDLE_SEC", "1800"))
+SESSION_EVICT_INTERVAL_SEC = int(os.getenv("SESSION_EVICT_INTERVAL_SEC", "60"))
+
+# фоновую запись пачками запускает start_shared_runtime()
+session_store = open_session_store(SESSION_STORE, SESSION_DB_PATH, flush_interval=SESSION_FLUSH_INTERVAL_MS / 1000)
+
+# Промпт ответа на свой вопрос — не больше PROMPT_INPUT_BUDGET_TOKENS (оценка) входных токенов:
+# прошлые ответы в нём обрезаются до PROMPT_TURN_MAX_TOKENS, а вытесненные из истории
+# пары живут в скользящем конспекте сессии размером до PROMPT_SUMMARY_MAX_TOKENS
+PROMPT_INPUT_BUDGET_TOKENS = int(os.getenv("PROMPT_INPUT_BUDGET_TOKENS", "1500"))
+PROMPT_TURN_MAX_TOKENS = int(os.getenv("PROMPT_TURN_MAX_TOKENS", "350"))
+PROMPT_SUMMARY_MAX_TOKENS = int(os.getenv("PROMPT_SUMMARY_MAX_TOKENS", "300"))
+
+# Кэш FAQ по нормализованному описанию бизнеса (пустой FAQ_CACHE_PATH — без диска)
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+FAQ_CACHE_SIZE = int(os.getenv("FAQ_CACHE_SIZE", "5000"))
+FAQ_CACHE_TTL_SEC = int(os.getenv("FAQ_CACHE_TTL_SEC", str(7 * 86400)))
+FAQ_CACHE_PATH = os.getenv("FAQ_CACHE_PATH", os.path.join(CACHE_DIR, "faq.json"))
+CACHE_SAVE_INTERVAL_SEC = int(os.getenv("CACHE_SAVE_INTERVAL_SEC", "300"))
+# Похожие описания («кофейня возле дома» ~ «кофейня у дома») берут тот же набор FAQ.
+# Мера Жаккара по 3-граммам основ слов плюс совпадение самих значимых слов
+# («магазин обуви» не похож на «магазин одежды»); 0 — только точное совпадение.
+FAQ_SIMILARITY_THRESHOLD = float(os.getenv("FAQ_SIMILARITY_THRESHOLD", "0.8"))
+# Кэш вердиктов classify_business / classify_question (пустой путь — без диска)
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "50000"))
+VERDICT_CACHE_TTL_SEC = int(os.getenv("VERDICT_CACHE_TTL_SEC", str(30 * 86400)))
+BUSINESS_VERDICT_CACHE_PATH = os.getenv("BUSINESS_VERDICT_CACHE_PATH", os.path.join(CACHE_DIR, "verdicts_business.json"))
+QUESTION_VERDICT_CACHE_PATH = os.getenv("QUESTION_VERDICT_CACHE_PATH", os.path.join(CACHE_DIR, "verdicts_question.json"))
+# Кэш ответов на свои вопросы: тот же вопрос по похожему бизнесу — без LLM.
+# Вопросы совпадают по набору значимых слов, бизнесы сравниваются с FAQ_SIMILARITY_THRESHOLD.
+# Кэш проверяется только после модерации вопроса (check_question_allowed).
+# Пустой кэш при старте заполняется из user_question пакетов лога (ANSWER_CACHE_SEED_FROM_PACKETS).
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "20000"))
+ANSWER_CACHE_TTL_SEC = int(os.getenv("ANSWER_CACHE_TTL_SEC", str(3 * 86400)))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(CACHE_DIR, "answers.json"))
+ANSWER_CACHE_SEED_FROM_PACKETS = os.getenv("ANSWER_CACHE_SEED_FROM_PACKETS", "1") == "1"
+# Прогрев FAQ: самые частые бизнесы из business_profile пакетов генерируются заранее
+# (не чаще FAQ_PREWARM_PER_MIN в минуту) и обновляются раз в FAQ_PREWARM_REFRESH_SEC.
+FAQ_PREWARM_ENABLED = os.getenv("FAQ_PREWARM_ENABLED", "1") == "1"
+FAQ_PREWARM_TOP = int(os.getenv("FAQ_PREWARM_TOP", "200"))
+FAQ_PREWARM_MIN_COUNT = float(os.getenv("FAQ_PREWARM_MIN_COUNT", "3"))
+FAQ_PREWARM_PER_MIN = float(os.getenv("FAQ_PREWARM_PER_MIN", "20"))
+FAQ_PREWARM_INTERVAL_SEC = int(os.getenv("FAQ_PREWARM_INTERVAL_SEC", "3600"))
+FAQ_PREWARM_REFRESH_SEC = int(os.getenv("FAQ_PREWARM_REFRESH_SEC", str(86400)))
+FAQ_PREWARM_HALF_LIFE_SEC = int(os.getenv("FAQ_PREWARM_HALF_LIFE_SEC", str(3 * 86400)))
+FAQ_PREWARM_PATH = os.getenv("FAQ_PREWARM_PATH", os.path.join(CACHE_DIR, "faq_prewarm.json"))
+
+# Локальный префильтр перед LLM-фильтрами (обучение: python preclassifier.py train)
+PRECLASSIFIER_ENABLED = os.getenv("PRECLASSIFIER_ENABLED", "1") == "1"
+PRECLASSIFIER_MODEL_PATH = os.getenv("PRECLASSIFIER_MODEL_PATH", os.path.join(DATA_DIR, "models", "preclassifier.json"))
+# PRECLASSIFIER_THRESHOLD пустой — порог, сохранённый с моделью при обучении
+PRECLASSIFIER_THRESHOLD = float(os.getenv("PRECLASSIFIER_THRESHOLD") or 0) or None
+
+# Спекулятивно: пока LLM-фильтр думает, параллельно уже генерируем ответ / FAQ.
+# Быстрее на один LLM-вызов, но при отказе фильтра токены на ответ потрачены зря.
+SPECULATIVE_LLM = os.getenv("SPECULATIVE_LLM", "1") == "1"
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+# Одинаковые LLM-вызовы (модель, промпт, параметры), идущие одновременно,
+# делят один запрос к Groq (single-flight)
+LLM_SINGLEFLIGHT = os.getenv("LLM_SINGLEFLIGHT", "1") == "1"
+
+# Запросы к Groq: таймаут одной попытки по виду вызова, LLM_RETRIES повторов с джиттером.
+# После LLM_BREAKER_FAILURES неудач подряд у модели LLM_BREAKER_RESET_SEC секунд к ней
+# не ходим (запасная модель маршрута продолжает работать); нет ни одной — сразу
+# показываем «сервис временно недоступен».
+# LLM_HEDGE_AFTER_MS > 0: если классификатор не ответил за столько мс — дублируем запрос.
+# GROQ_BASE_URL (читает сам клиент groq) — например, локальный fake_groq.py.
+LLM_TIMEOUT_FAQ_SEC = float(os.getenv("LLM_TIMEOUT_FAQ_SEC", "30"))
+LLM_TIMEOUT_CLASSIFY_SEC = float(os.getenv("LLM_TIMEOUT_CLASSIFY_SEC", "5"))
+LLM_TIMEOUT_ANSWER_SEC = float(os.getenv("LLM_TIMEOUT_ANSWER_SEC", "30"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF_BASE_MS = int(os.getenv("LLM_BACKOFF_BASE_MS", "200"))
+LLM_BACKOFF_MAX_MS = int(os.getenv("LLM_BACKOFF_MAX_MS", "2000"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SEC = float(os.getenv("LLM_BREAKER_RESET_SEC", "30"))
+LLM_HEDGE_AFTER_MS = int(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+
+# Маршруты LLM: своя модель, max_tokens и SLO по задержке на каждый вид вызова.
+# Не уложилась в SLO (или упала) основная модель — тот же запрос уходит в
+# LLM_ROUTE_*_FALLBACK_MODEL (пусто — без запасной), берётся первый ответ.
+# p90 основной модели выше SLO — маршрут на LLM_ROUTE_DEGRADE_COOLDOWN_SEC переходит на запасную.
+# Например: LLM_ROUTE_ANSWER_MODEL=llama-3.3-70b-versatile LLM_ROUTE_ANSWER_FALLBACK_MODEL=llama-3.1-8b-instant
+LLM_ROUTE_CLASSIFY_MODEL = os.getenv("LLM_ROUTE_CLASSIFY_MODEL", MODEL_NAME)
+LLM_ROUTE_CLASSIFY_MAX_TOKENS = int(os.getenv("LLM_ROUTE_CLASSIFY_MAX_TOKENS", "8"))
+LLM_ROUTE_CLASSIFY_SLO_MS = int(os.getenv("LLM_ROUTE_CLASSIFY_SLO_MS", "1500"))
+LLM_ROUTE_CLASSIFY_FALLBACK_MODEL = os.getenv("LLM_ROUTE_CLASSIFY_FALLBACK_MODEL", "")
+LLM_ROUTE_FAQ_MODEL = os.getenv("LLM_ROUTE_FAQ_MODEL", MODEL_NAME)
+LLM_ROUTE_FAQ_MAX_TOKENS = int(os.getenv("LLM_ROUTE_FAQ_MAX_TOKENS", "1024"))
+LLM_ROUTE_FAQ_SLO_MS = int(os.getenv("LLM_ROUTE_FAQ_SLO_MS", "8000"))
+LLM_ROUTE_FAQ_FALLBACK_MODEL = os.getenv("LLM_ROUTE_FAQ_FALLBACK_MODEL", "")
+LLM_ROUTE_ANSWER_MODEL = os.getenv("LLM_ROUTE_ANSWER_MODEL", MODEL_NAME)
+LLM_ROUTE_ANSWER_MAX_TOKENS = int(os.getenv("LLM_ROUTE_ANSWER_MAX_TOKENS", "1024"))
+LLM_ROUTE_ANSWER_SLO_MS = int(os.getenv("LLM_ROUTE_ANSWER_SLO_MS", "6000"))
+LLM_ROUTE_ANSWER_FALLBACK_MODEL = os.getenv("LLM_ROUTE_ANSWER_FALLBACK_MODEL", "")
+LLM_ROUTE_WINDOW = int(os.getenv("LLM_ROUTE_WINDOW", "50"))
+LLM_ROUTE_DEGRADE_COOLDOWN_SEC = float(os.getenv("LLM_ROUTE_DEGRADE_COOLDOWN_SEC", "60"))
+
+# Стриминг ответа на свой вопрос: экран ответа обновляется по мере генерации.
+# Правки одного сообщения не чаще раза в STREAM_EDIT_INTERVAL_SEC (лимиты Telegram).
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "0") == "1"
+STREAM_EDIT_INTERVAL_SEC = float(os.getenv("STREAM_EDIT_INTERVAL_SEC", "1.0"))
+STREAM_MIN_DELTA_CHARS = int(os.getenv("STREAM_MIN_DELTA_CHARS", "40"))
+# Стриминг FAQ: список показывается, как только готова первая страница (3 пункта),
+# остальные страницы дописываются по ходу генерации.
+STREAM_FAQS = os.getenv("STREAM_FAQS", "0") == "1"
+
+# Обработка апдейтов: общий пул потоков, внутри одного чата — строго по очереди.
+# Сверх CHAT_MAX_BACKLOG необработанных апдейтов от одного чата новые выбрасываются.
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "16"))
+CHAT_MAX_BACKLOG = int(os.getenv("CHAT_MAX_BACKLOG", "20"))
+
+# Приём апдейтов: "polling" (long polling) или "webhook" (локальный HTTP-сервер).
+# WEBHOOK_URL — публичный адрес для setWebhook; пустой — вебхук регистрируется снаружи.
+# WEBHOOK_SECRET обязателен (без него режим webhook не стартует); слушаем 127.0.0.1,
+# наружу — через обратный прокси или явный WEBHOOK_HOST=0.0.0.0.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Исходящие запросы к Telegram: не больше TG_GLOBAL_RATE/с на бота и TG_CHAT_RATE/с новых
+# сообщений на личный чат (правки и удаления идут только в общий лимит),
+# на 429 ждём retry_after и повторяем до TG_MAX_RETRIES раз
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", "3"))
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "3"))
+
+# Смена баннера одним edit_message_media вместо удаления и новой отправки
+SCREEN_EDIT_MEDIA = os.getenv("SCREEN_EDIT_MEDIA", "1") == "1"
+
+telegram_limiter = OutboundLimiter(
+    global_rate=TG_GLOBAL_RATE,
+    global_burst=TG_GLOBAL_RATE,
+    chat_rate=TG_CHAT_RATE,
+    chat_burst=TG_CHAT_BURST,
+    max_retries=TG_MAX_RETRIES,
+)
 
 # Баннеры (file_id PNG из Telegram)
 BANNER_WELCOME_ID = os.getenv("BANNER_WELCOME_ID", "AgACAgIAAxkBAAPdaRouNS26y2b8S9nt1K6ItTmiCLgAAuURaxtq0dFI5attTAw2YqABAAMCAAN5AAM2BA")   # привет, выбор бизнеса, ошибки по бизнесу
@@ -36,37 +244,40 @@ BANNER_ANSWER_ID = os.getenv("BANNER_ANSWER_ID", "AgACAgIAAxkBAAIBYWkakqu9MiOGp-
 
 def cleanup_old_logs() -> None:
     """
-    Удаляем JSON-лог-файлы старше LOG_RETENTION_DAYS.
+    Удаляем часовые корзины лога пакетов старше LOG_RETENTION_DAYS
+    (по имени каталога, без чтения файлов) и старые одиночные data/*.json.
+    Вызывается фоновым таймером retention_sweeper, а не из save_packet.
     """
-    now = time.time()
-    cutoff = now - LOG_RETENTION_DAYS * 86400
+    cutoff = time.time() - LOG_RETENTION_DAYS * 86400
+
+    packet_log.drop_expired_buckets(cutoff)
 
+    # хвосты старого формата «один файл на событие»
     try:
-        for fname in os.listdir(DATA_DIR):
-            if not fname.endswith(".json"):
+        for entry in os.scandir(DATA_DIR):
+            if not entry.name.endswith(".json") or not entry.is_file():
                 continue
-            path = os.path.join(DATA_DIR, fname)
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                ts = data.get("timestamp")
-                if not isinstance(ts, (int, float)):
-                    raise ValueError("no ts")
-            except Exception:
-                ts = os.path.getmtime(path)
-
-            if ts < cutoff:
-                os.remove(path)
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
     except FileNotFoundError:
         pass
 
 
+retention_sweeper = PeriodicTask(cleanup_old_logs, interval=LOG_CLEANUP_INTERVAL_SEC, name="retention-sweeper")
+
+
 # === ЗАПИСЬ ПАКЕТОВ / ЛОГИ ДЛЯ docker_worker ===
 
 def save_packet(packet: Dict[str, Any]) -> str:
     """
-    Пишем JSON в data/*.json — это будет забирать docker_worker.
-    Формат:
+    Ставим пакет в очередь packet_writer и сразу возвращаемся в хендлер.
+    Фоновый поток пачками дописывает пакеты строками в сегменты
+    data/packets/<час>/*.jsonl — это будет забирать docker_worker
+    (см. PacketLogReader) — и дублирует их json-строками в stdout.
+    Формат строки:
     {
       "packet_id": "...",
       "timestamp": 1234567890,
@@ -74,7 +285,15 @@ def save_packet(packet: Dict[str, Any]) -> str:
       "event": "...",
       ... payload ...
     }
-    Параллельно пишем одну json-строку в stdout.
+    Возвращает packet_id.
+    """
+    packet_writer.submit(prepare_packet(packet))
+    return packet["packet_id"]
+
+
+def prepare_packet(packet: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Дозаполняет служебные поля пакета (packet_id, timestamp, type, event).
     """
     if "packet_id" not in packet:
         packet["packet_id"] = str(uuid.uuid4())
@@ -84,61 +303,215 @@ def save_packet(packet: Dict[str, Any]) -> str:
         packet["type"] = "event"
     if "event" not in packet:
         packet["event"] = packet["type"]
+    return packet
 
-    filename = os.path.join(DATA_DIR, f"{packet['packet_id']}.json")
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(packet, f, ensure_ascii=False, indent=4)
 
-    try:
-        line = json.dumps({"log_type": "packet", **packet}, ensure_ascii=False)
-        print(line, flush=True)
-    except Exception:
-        pass
+# === СЕССИИ ===
+# chat_id -> session: горячие сессии в памяти (порядок — от давно использованных к свежим),
+# за остальными get_session идёт в session_store
+
+Session.history_size = SESSION_HISTORY_SIZE
+Session.summary_max_tokens = PROMPT_SUMMARY_MAX_TOKENS
+
+sessions: "OrderedDict[int, Session]" = OrderedDict()
+_sessions_lock = threading.Lock()
+session_evictions = {"idle": 0, "overflow": 0, "skipped_busy": 0}
+
+# Моложе этого сессию не выгружаем даже при переполнении
+SESSION_MIN_IDLE_SEC = 60
 
-    cleanup_old_logs()
-    return filename
+# «У чата есть апдейт в очереди или в работе» — по одной проверке на рантайм
+# (chat_dispatcher, блокировки async_bot). Сессию такого чата не выгружаем:
+# обработчик может идти минутами (повторы LLM), и его изменения ушли бы в
+# выгруженную копию, которую save_session уже не найдёт.
+chat_busy_checks: List[Callable[[int], bool]] = []
 
 
-# === СЕССИИ В ПАМЯТИ ===
-# chat_id -> session
+def chat_busy(chat_id: int) -> bool:
+    return any(check(chat_id) for check in chat_busy_checks)
 
-sessions: Dict[int, Dict[str, Any]] = {}
 
+def new_session() -> Session:
+    return Session()
 
-def get_session(chat_id: int) -> Dict[str, Any]:
+
+def get_session(chat_id: int) -> Session:
     """
-    Структура session:
+    Структура session (Session, доступ как к словарю):
     {
         "stage": "waiting_business" | "choose_question" | "custom_question",
         "business": str | None,          # текущий бизнес
         "saved_business": str | None,    # последний бизнес юзера
-        "faqs": list[{"q","a"}],
+        "faqs": list[{"q","a"}],         # общий на все чаты набор (FaqSet)
         "faq_page": int,
         "faq_page_size": int,
-        "history": list[{"q","a"}],
+        "history": deque[(q, a)],        # последние SESSION_HISTORY_SIZE пар
+        "summary": str,                  # конспект более старых пар, строка на пару
         "last_message_id": int | None,   # последний «экран» (сообщение бота)
         "last_banner_id": str | None,    # какой баннер был на последнем экране
+        "last_text_hash": str | None,    # хеш подписи/текста последнего экрана
+        "last_markup_hash": str | None,  # хеш клавиатуры последнего экрана
         "first_start_seen": bool        # был ли уже хотя бы один /start от пользователя
     }
+    Сессия, которой нет в памяти, при первом обращении подгружается из session_store.
+    """
+    now = time.time()
+    with _sessions_lock:
+        session = sessions.get(chat_id)
+        if session is not None:
+            sessions.move_to_end(chat_id)
+            session.last_seen = now
+            return session
+
+    session = new_session()
+    stored = session_store.load(chat_id)
+    if stored:
+        # поля, добавленные после сохранения, берутся по умолчанию
+        session.update(stored)
+    with _sessions_lock:
+        # апдейты одного чата идут по очереди, так что гонки за один chat_id нет
+        sessions[chat_id] = session
+    return session
+
+
+def save_session(chat_id: int) -> None:
+    """
+    После обработки апдейта: снимок сессии уходит в session_store (запись в фоне).
+    """
+    session = sessions.get(chat_id)
+    if session is not None:
+        session_store.save(chat_id, session.to_dict())
+
+
+def evict_idle_sessions() -> None:
+    """
+    Выгружает из памяти сессии, простоявшие SESSION_IDLE_SEC, и самые давние сверх
+    SESSION_MAX_IN_MEMORY. Перед выгрузкой снимок уходит в session_store, так что
+    следующий get_session поднимет сессию обратно. Без постоянного хранилища не выгружаем.
+    """
+    if not session_store.persistent:
+        return
+    now = time.time()
+    with _sessions_lock:
+        for chat_id, session in list(sessions.items()):
+            idle = now - session.last_seen
+            if idle >= SESSION_IDLE_SEC:
+                reason = "idle"
+            elif len(sessions) > SESSION_MAX_IN_MEMORY and idle >= SESSION_MIN_IDLE_SEC:
+                reason = "overflow"
+            else:
+                break
+            if chat_busy(chat_id):
+                session_evictions["skipped_busy"] += 1
+                continue
+            session_evictions[reason] += 1
+            del sessions[chat_id]
+            # снимок — под той же блокировкой: get_session этого чата сразу после
+            # выгрузки должен найти его в session_store, а не прочитать старую версию
+            session_store.save(chat_id, session.to_dict())
+
+
+def release_sessions(keep: Callable[[int], bool]) -> int:
+    """
+    Выгружает в session_store все сессии, для которых keep(chat_id) ложно, и сбрасывает
+    store на диск — после этого их чаты может подхватить другой процесс (sharding.py).
+    Вызывать, когда апдейтов этих чатов в обработке нет. Возвращает число выгруженных.
     """
-    if chat_id not in sessions:
-        sessions[chat_id] = {
-            "stage": None,
-            "business": None,
-            "saved_business": None,
-            "faqs": [],
-            "faq_page": 0,
-            "faq_page_size": 3,
-            "history": [],
-            "last_message_id": None,
-            "last_banner_id": None,
-            "first_start_seen": False,
-        }
-    return sessions[chat_id]
+    with _sessions_lock:
+        released = [(chat_id, sessions.pop(chat_id)) for chat_id in list(sessions) if not keep(chat_id)]
+    for chat_id, session in released:
+        session_store.save(chat_id, session.to_dict())
+    session_store.flush()
+    return len(released)
+
+
+session_evictor = PeriodicTask(evict_idle_sessions, interval=SESSION_EVICT_INTERVAL_SEC, name="session-evictor")
 
 
 # === УНИВЕРСАЛЬНАЯ ОТРИСОВКА «СТРАНИЦЫ» ===
 
+def tg_call(chat_id: Optional[int], fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+    """
+    Любой исходящий запрос в чат — через telegram_limiter (темп + повтор на 429).
+    """
+    return telegram_limiter.call(chat_id, fn, *args, **kwargs)
+
+
+screen_stats: Dict[str, int] = {
+    "skipped": 0,           # экран не изменился — в Telegram ничего не шлём
+    "markup_edits": 0,      # поменялась только клавиатура
+    "caption_edits": 0,
+    "text_edits": 0,
+    "media_edits": 0,       # сменили баннер, подпись и кнопки одним запросом
+    "markup_fallbacks": 0,  # правка не удалась -> удалили и отправили заново
+    "caption_fallbacks": 0,
+    "text_fallbacks": 0,
+    "media_fallbacks": 0,
+    "sent": 0,              # новое сообщение
+}
+_screen_stats_lock = threading.Lock()
+
+
+def count_screen(key: str) -> None:
+    with _screen_stats_lock:
+        screen_stats[key] += 1
+
+
+def content_hash(value: str) -> str:
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def markup_hash(markup: Optional[InlineKeyboardMarkup]) -> str:
+    return content_hash(markup.to_json() if markup is not None else "")
+
+
+def plan_screen(
+    session: Dict[str, Any],
+    text: str,
+    banner_id: Optional[str],
+    inline_markup: Optional[InlineKeyboardMarkup],
+) -> Tuple[str, str, str]:
+    """
+    Что сделать с прошлым экраном, чтобы показать новый, по хешам того, что уже показано:
+    "skip" | "markup" | "caption" | "text" | "media" | "send". Плюс хеши нового текста и клавиатуры.
+    "media" — баннер сменился на другой баннер: фото, подпись и кнопки меняются одной правкой.
+    """
+    text_h = content_hash(text)
+    markup_h = markup_hash(inline_markup)
+    last_banner_id = session.get("last_banner_id")
+
+    if not session.get("last_message_id"):
+        return "send", text_h, markup_h
+    if last_banner_id and banner_id and last_banner_id == banner_id:
+        edit = "caption"
+    elif not last_banner_id and not banner_id:
+        edit = "text"
+    elif last_banner_id and banner_id and SCREEN_EDIT_MEDIA:
+        return "media", text_h, markup_h
+    else:
+        # текстовое сообщение в фото (и обратно) правкой не превратить
+        return "send", text_h, markup_h
+
+    if text_h == session.get("last_text_hash"):
+        if markup_h == session.get("last_markup_hash"):
+            return "skip", text_h, markup_h
+        return "markup", text_h, markup_h
+    return edit, text_h, markup_h
+
+
+def remember_screen(
+    session: Dict[str, Any],
+    message_id: int,
+    banner_id: Optional[str],
+    text_h: Optional[str],
+    markup_h: Optional[str],
+) -> None:
+    session["last_message_id"] = message_id
+    session["last_banner_id"] = banner_id
+    session["last_text_hash"] = text_h
+    session["last_markup_hash"] = markup_h
+
+
 def send_screen(
     chat_id: int,
     session: Dict[str, Any],
@@ -148,66 +521,264 @@ def send_screen(
 ) -> None:
     """
     Универсальная функция для «страницы»:
-    - по возможности редактирует прошлое сообщение бота,
+    - если на экране уже ровно это (по хешам) — ничего не делает,
+    - по возможности редактирует прошлое сообщение бота, и только то, что поменялось
+      (при смене баннера — одним edit_message_media),
     - если редактировать нельзя — удаляет и отправляет новое,
     - на каждом экране есть баннер (PNG) и подпись text.
     """
     last_message_id = session.get("last_message_id")
-    last_banner_id = session.get("last_banner_id")
+    action, text_h, markup_h = plan_screen(session, text, banner_id, inline_markup)
+
+    if action == "skip":
+        count_screen("skipped")
+        return
 
     # Попытка аккуратно отредактировать прошлый экран
-    if last_message_id:
+    if action != "send":
         try:
-            # если и раньше был баннер, и тот же самый — меняем только caption/кнопки
-            if last_banner_id and banner_id and last_banner_id == banner_id:
-                bot.edit_message_caption(
+            if action == "markup":
+                # подпись та же — меняем только кнопки
+                tg_call(
+                    chat_id,
+                    bot.edit_message_reply_markup,
+                    chat_id=chat_id,
+                    message_id=last_message_id,
+                    reply_markup=inline_markup,
+                )
+            elif action == "media":
+                # другой баннер — меняем фото, подпись и кнопки одним запросом
+                tg_call(
+                    chat_id,
+                    bot.edit_message_media,
+                    InputMediaPhoto(banner_id, caption=text, parse_mode="HTML"),
+                    chat_id=chat_id,
+                    message_id=last_message_id,
+                    reply_markup=inline_markup,
+                )
+            elif action == "caption":
+                # тот же баннер — меняем caption/кнопки
+                tg_call(
+                    chat_id,
+                    bot.edit_message_caption,
                     chat_id=chat_id,
                     message_id=last_message_id,
                     caption=text,
                     reply_markup=inline_markup,
                 )
-                return
-            # если и раньше был текст без баннера, и сейчас без баннера — редактируем текст
-            if not last_banner_id and not banner_id:
-                bot.edit_message_text(
+            else:
+                # и раньше был текст без баннера, и сейчас без баннера — редактируем текст
+                tg_call(
+                    chat_id,
+                    bot.edit_message_text,
                     text,
                     chat_id=chat_id,
                     message_id=last_message_id,
                     reply_markup=inline_markup,
                 )
+            count_screen(f"{action}_edits")
+            remember_screen(session, last_message_id, banner_id, text_h, markup_h)
+            return
+        except Exception as e:
+            kind = telegram_error_kind(e)
+            # экран уже ровно такой — ничего делать не нужно
+            if kind == "not_modified":
+                remember_screen(session, last_message_id, banner_id, text_h, markup_h)
                 return
-        except Exception:
+            # Telegram просит притормозить и повторы не помогли: удаление и переотправка
+            # только добавят запросов в флуд
+            if kind == "rate_limited":
+                raise
+            count_screen(f"{action}_fallbacks")
             # редактирование не удалось — попробуем удалить
             try:
-                bot.delete_message(chat_id, last_message_id)
+                tg_call(chat_id, bot.delete_message, chat_id, last_message_id)
             except Exception:
                 pass
 
     # Если редактирование не сработало или баннер поменялся — отправляем новый экран
     if banner_id:
-        msg = bot.send_photo(
+        msg = tg_call(
+            chat_id,
+            bot.send_photo,
             chat_id,
             banner_id,
             caption=text,
             reply_markup=inline_markup,
         )
     else:
-        msg = bot.send_message(
+        msg = tg_call(
+            chat_id,
+            bot.send_message,
             chat_id,
             text,
             reply_markup=inline_markup,
         )
 
-    session["last_message_id"] = msg.message_id
-    session["last_banner_id"] = banner_id
+    count_screen("sent")
+    remember_screen(session, msg.message_id, banner_id, text_h, markup_h)
 
 
-# === LLM: ГЕНЕРАЦИЯ FAQ ===
+# === LLM: ОБЩИЙ ВЫЗОВ ===
 
-def generate_faqs(business_description: str, n: int = 9) -> List[Dict[str, str]]:
+llm_flights = SingleFlight()
+
+llm_gateway = LlmGateway(
+    {
+        "faq": CallPolicy(timeout=LLM_TIMEOUT_FAQ_SEC, retries=LLM_RETRIES),
+        "classify": CallPolicy(
+            timeout=LLM_TIMEOUT_CLASSIFY_SEC,
+            retries=LLM_RETRIES,
+            hedge_after=LLM_HEDGE_AFTER_MS / 1000,
+        ),
+        "answer": CallPolicy(timeout=LLM_TIMEOUT_ANSWER_SEC, retries=LLM_RETRIES),
+    },
+    # свой предохранитель у каждой модели — запасная не страдает от упавшей основной
+    breaker_factory=lambda: CircuitBreaker(failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET_SEC),
+    backoff_base=LLM_BACKOFF_BASE_MS / 1000,
+    backoff_max=LLM_BACKOFF_MAX_MS / 1000,
+    # классификаторы зовутся из потоков chat_dispatcher, хедж — вторая копия запроса
+    hedge_workers=2 * CHAT_WORKERS,
+)
+
+
+llm_router = ModelRouter(
+    {
+        "classify": Route(
+            model=LLM_ROUTE_CLASSIFY_MODEL,
+            max_tokens=LLM_ROUTE_CLASSIFY_MAX_TOKENS,
+            slo=LLM_ROUTE_CLASSIFY_SLO_MS / 1000,
+            fallback_model=LLM_ROUTE_CLASSIFY_FALLBACK_MODEL,
+        ),
+        "faq": Route(
+            model=LLM_ROUTE_FAQ_MODEL,
+            max_tokens=LLM_ROUTE_FAQ_MAX_TOKENS,
+            slo=LLM_ROUTE_FAQ_SLO_MS / 1000,
+            fallback_model=LLM_ROUTE_FAQ_FALLBACK_MODEL,
+        ),
+        "answer": Route(
+            model=LLM_ROUTE_ANSWER_MODEL,
+            max_tokens=LLM_ROUTE_ANSWER_MAX_TOKENS,
+            slo=LLM_ROUTE_ANSWER_SLO_MS / 1000,
+            fallback_model=LLM_ROUTE_ANSWER_FALLBACK_MODEL,
+        ),
+    },
+    window=LLM_ROUTE_WINDOW,
+    degrade_cooldown=LLM_ROUTE_DEGRADE_COOLDOWN_SEC,
+    workers=2 * CHAT_WORKERS,
+)
+
+
+def record_llm_usage(kind: str, model: str, usage: Any, messages: List[Dict[str, str]], text: str) -> None:
     """
-    Генерация списка FAQ: [{q, a}, ...]
+    Токены из usage ответа Groq; если его нет (поток без x_groq, тестовый клиент) — оценка count_tokens.
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens is None:
+        prompt_tokens = message_tokens(messages)
+    if completion_tokens is None:
+        completion_tokens = count_tokens(text)
+    llm_router.record_usage(kind, model, int(prompt_tokens), int(completion_tokens))
+
+
+def stream_chunk_usage(chunk: Any) -> Any:
+    # Groq кладёт usage потока в x_groq последнего куска
+    return getattr(getattr(chunk, "x_groq", None), "usage", None)
+
+
+_client_lock = threading.Lock()
+
+
+def groq_client() -> Any:
+    """
+    Синхронный клиент Groq, создаётся при первом вызове. Повторы делает llm_gateway,
+    у самого клиента они выключены. В async_bot им пользуется только прогрев FAQ.
+    """
+    global client
+    with _client_lock:
+        if client is None:
+            client = Groq(api_key=GROQ_API_KEY, max_retries=0)
+        return client
+
+
+def _create_completion(
+    model: str,
+    kind: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    timeout: float,
+) -> str:
+    completion = groq_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        timeout=timeout,
+    )
+    text = completion.choices[0].message.content
+    record_llm_usage(kind, model, getattr(completion, "usage", None), messages, text)
+    return text
+
+
+def _model_completion(model: str, kind: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    return llm_gateway.call(kind, _create_completion, model, kind, messages, temperature, max_tokens, breaker_key=model)
+
+
+def _gateway_completion(kind: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    return llm_router.call(kind, _model_completion, kind, messages, temperature, max_tokens)
+
+
+def complete(kind: str, messages: List[Dict[str, str]], temperature: float) -> str:
     """
+    Текст ответа модели; kind — вид вызова ("faq", "classify", "answer"):
+    по нему llm_router выбирает модель и max_tokens, llm_gateway — таймауты и повторы.
+    Одновременные одинаковые вызовы склеиваются в один запрос.
+    Groq недоступен — LlmUnavailable (её ловит process_update).
+    """
+    route = llm_router.route(kind)
+    if not LLM_SINGLEFLIGHT:
+        return _gateway_completion(kind, messages, temperature, route.max_tokens)
+    key = flight_key(route.model, messages, temperature=temperature, max_tokens=route.max_tokens)
+    return llm_flights.do(key, _gateway_completion, kind, messages, temperature, route.max_tokens)
+
+
+def routed_stream(kind: str, open_stream: Callable[..., Any], messages: List[Dict[str, str]]) -> Iterator[str]:
+    """
+    Куски текста потокового вызова по маршруту kind. Модель — llm_router.pick
+    (деградировавший маршрут сразу идёт в запасную); запасная по SLO здесь не
+    подключается — начало ответа уже на экране. Задержка и токены пишутся в конце.
+    """
+    model = llm_router.pick(kind)
+    started = time.monotonic()
+    parts: List[str] = []
+    usage: Any = None
+    ok = False
+    try:
+        # через шлюз идёт только открытие потока; оборванный посреди поток не повторяем
+        stream = llm_gateway.call(kind, open_stream, model, messages, breaker_key=model)
+        for chunk in stream:
+            usage = stream_chunk_usage(chunk) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        ok = True
+    finally:
+        llm_router.record(kind, model, time.monotonic() - started, ok=ok)
+        if parts:
+            record_llm_usage(kind, model, usage, messages, "".join(parts))
+
+
+# === LLM: ГЕНЕРАЦИЯ FAQ ===
+
+FAQ_FALLBACK_QUESTION = "Как мне запустить и развивать этот бизнес?"
+
+
+def build_faq_messages(business_description: str, n: int = 9) -> List[Dict[str, str]]:
     system_prompt = (
         "Ты помощник для владельцев очень маленького бизнеса (микробизнес).\n"
         "По описанию бизнеса придумай список типовых вопросов и коротких, "
@@ -219,19 +790,16 @@ def generate_faqs(business_description: str, n: int = 9) -> List[Dict[str, str]]
         f"Сфера бизнеса: {business_description}\n"
         f"Сделай {n} самых частых вопросов владельца к такому помощнику."
     )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    completion = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.2,
-        max_tokens=1024,
-    )
-
-    text = completion.choices[0].message.content.strip()
 
+def parse_faqs(text: str, n: int = 9) -> List[Dict[str, str]]:
+    """
+    JSON от модели -> [{q, a}, ...]; если JSON сломан — один запасной пункт с сырым текстом.
+    """
     try:
         data = json.loads(text)
         faqs = data.get("faqs", [])
@@ -245,20 +813,264 @@ def generate_faqs(business_description: str, n: int = 9) -> List[Dict[str, str]]
         return clean
     except Exception:
         return [{
-            "q": "Как мне запустить и развивать этот бизнес?",
+            "q": FAQ_FALLBACK_QUESTION,
             "a": text,
         }]
 
 
+def generate_faqs(business_description: str, n: int = 9) -> List[Dict[str, str]]:
+    """
+    Генерация списка FAQ: [{q, a}, ...]
+    """
+    text = complete("faq", build_faq_messages(business_description, n), temperature=0.2).strip()
+    return parse_faqs(text, n)
+
+
+def _open_faq_stream(model: str, messages: List[Dict[str, str]], timeout: float) -> Any:
+    return groq_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.2,
+        max_tokens=llm_router.route("faq").max_tokens,
+        stream=True,
+        timeout=timeout,
+    )
+
+
+def finish_faq_stream(parser: FaqStreamParser, n: int = 9) -> Tuple[List[Dict[str, str]], bool]:
+    """
+    Итог потока: (faqs, complete). Решает parse_faqs по всему тексту; если JSON
+    сломан (оборван по max_tokens, обёрнут в ```), но пункты уже разобраны
+    и показаны — остаются они, а не запасной пункт. complete=False — набор
+    неполный, в кэш его не кладём.
+    """
+    faqs = parse_faqs(parser.text.strip(), n)
+    if faqs and faqs[0]["q"] == FAQ_FALLBACK_QUESTION and parser.items:
+        return list(parser.items), False
+    return faqs, True
+
+
+def generate_faqs_stream(
+    business_description: str,
+    n: int = 9,
+    on_items: Optional[Callable[[List[Dict[str, str]]], None]] = None,
+) -> Tuple[List[Dict[str, str]], bool]:
+    """
+    То же, что generate_faqs, но по потоку: on_items(готовые пункты) зовётся
+    на каждый новый пункт. Возвращает (faqs, complete), см. finish_faq_stream.
+    """
+    parser = FaqStreamParser(n)
+    deltas = routed_stream("faq", _open_faq_stream, build_faq_messages(business_description, n))
+    try:
+        for delta in deltas:
+            if parser.feed(delta) and on_items is not None:
+                on_items(list(parser.items))
+    except Exception:
+        # обрыв посреди потока: уже показанные пункты лучше ошибки
+        if not parser.items:
+            raise
+        return list(parser.items), False
+    return finish_faq_stream(parser, n)
+
+
+# === КЭШ FAQ ===
+
+# С диска кэши читает load_caches() при запуске рантайма, не при импорте.
+faq_cache = LruTtlCache(max_size=FAQ_CACHE_SIZE, ttl=FAQ_CACHE_TTL_SEC, path=FAQ_CACHE_PATH)
+
+# индекс похожих описаний поверх ключей faq_cache (ключи — нормализованные описания)
+faq_similarity = SimilarityIndex(threshold=FAQ_SIMILARITY_THRESHOLD)
+
+
+# Кэши вердиктов фильтров: classify_* детерминированы (temperature=0.0),
+# поэтому повторный или чуть иначе записанный текст можно не отправлять в LLM.
+# hits этих кэшей — ровно число сэкономленных вызовов LLM.
+business_verdicts = LruTtlCache(max_size=VERDICT_CACHE_SIZE, ttl=VERDICT_CACHE_TTL_SEC, path=BUSINESS_VERDICT_CACHE_PATH)
+question_verdicts = LruTtlCache(max_size=VERDICT_CACHE_SIZE, ttl=VERDICT_CACHE_TTL_SEC, path=QUESTION_VERDICT_CACHE_PATH)
+
+answer_cache = AnswerCache(
+    max_size=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL_SEC,
+    path=ANSWER_CACHE_PATH,
+    business_threshold=FAQ_SIMILARITY_THRESHOLD or 1.0,
+)
+
+persistent_caches: List[LruTtlCache] = [faq_cache, business_verdicts, question_verdicts, answer_cache.cache]
+
+preclassifier = PreClassifier.load(PRECLASSIFIER_MODEL_PATH, threshold=PRECLASSIFIER_THRESHOLD)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {
+        "faq": faq_cache.stats(),
+        "faq_similar": faq_similarity.stats(),
+        "business_verdicts": business_verdicts.stats(),
+        "question_verdicts": question_verdicts.stats(),
+        "preclassifier": preclassifier.stats(),
+        "speculation": dict(speculation_stats),
+        "singleflight": llm_flights.stats(),
+        "llm": llm_gateway.stats(),
+        "routes": llm_router.stats(),
+        "prompts": answer_prompts.stats(),
+        "answers": answer_cache.stats(),
+        "prewarm": faq_prewarmer.stats(),
+        "dispatcher": chat_dispatcher.stats() if chat_dispatcher is not None else {},
+        "ingest": ingest_stats(),
+        "telegram": telegram_limiter.snapshot(),
+        "screens": dict(screen_stats),
+        "sessions": {
+            "in_memory": len(sessions),
+            "faq_sets": faq_sets_count(),
+            "evicted_idle": session_evictions["idle"],
+            "evicted_overflow": session_evictions["overflow"],
+            "eviction_skipped_busy": session_evictions["skipped_busy"],
+            **session_store.stats(),
+        },
+    }
+
+
+def save_caches_to_disk() -> None:
+    for cache in persistent_caches:
+        try:
+            cache.save()
+        except OSError:
+            pass
+
+
+def save_caches() -> None:
+    """
+    Периодически: сбрасываем кэши на диск и пишем их статистику пакетом cache_stats.
+    """
+    save_caches_to_disk()
+    save_packet({"type": "cache_stats", **cache_stats()})
+
+
+cache_saver = PeriodicTask(save_caches, interval=CACHE_SAVE_INTERVAL_SEC, name="cache-saver")
+
+
+def get_cached_faqs(business_description: str) -> Optional[List[Dict[str, str]]]:
+    """
+    FAQ из кэша: сначала по точному нормализованному ключу,
+    затем по самому похожему ранее виденному описанию.
+    """
+    key = normalize_key(business_description)
+    faqs = faq_cache.get(key)
+    if faqs is not None or FAQ_SIMILARITY_THRESHOLD <= 0:
+        return faqs
+
+    match = faq_similarity.query(business_description)
+    if match is None:
+        return None
+    similar_key, _score = match
+    faqs = faq_cache.peek(similar_key, touch=True)
+    if faqs is None:
+        # запись уже вытеснена из кэша — чистим индекс
+        faq_similarity.remove(similar_key)
+    return faqs
+
+
+def cache_faqs(business_description: str, faqs: List[Dict[str, str]]) -> bool:
+    """
+    Запасной ответ (когда модель сломала JSON) не кэшируем —
+    в следующий раз попробуем сгенерировать нормальный список.
+    """
+    if not faqs or faqs[0]["q"] == FAQ_FALLBACK_QUESTION:
+        return False
+    key = normalize_key(business_description)
+    faq_cache.set(key, faqs)
+    if FAQ_SIMILARITY_THRESHOLD > 0:
+        faq_similarity.add(key, key)
+    return True
+
+
+def seed_answer_cache() -> int:
+    """
+    Первый запуск с кэшем ответов: заполняем его ответами из user_question пакетов лога.
+    """
+    reader = PacketLogReader(PACKETS_DIR)
+    packets, position = reader.read()
+    seeded = 0
+    while packets:
+        for packet in packets:
+            if packet.get("type") == "user_question" and packet.get("answer_mode") != "cache":
+                seeded += answer_cache.store(packet.get("business"), packet.get("question") or "", packet.get("answer") or "")
+        packets, position = reader.read(position)
+    return seeded
+
+
+def lookup_cached_answer(session: Dict[str, Any], question: str) -> Optional[str]:
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    return answer_cache.lookup(session.get("business") or session.get("saved_business"), question)
+
+
+def cache_answer(session: Dict[str, Any], question: str, answer: str) -> None:
+    if ANSWER_CACHE_ENABLED:
+        answer_cache.store(session.get("business") or session.get("saved_business"), question, answer)
+
+
+def generate_and_cache_faqs(business_description: str, n: int = 9) -> List[Dict[str, str]]:
+    faqs = generate_faqs(business_description, n=n)
+    cache_faqs(business_description, faqs)
+    return faqs
+
+
+faq_prewarmer = FaqPrewarmer(
+    PACKETS_DIR,
+    FAQ_PREWARM_PATH,
+    generate=generate_faqs,
+    install=cache_faqs,
+    cached=faq_cache.peek,
+    top_n=FAQ_PREWARM_TOP,
+    min_count=FAQ_PREWARM_MIN_COUNT,
+    refresh_after=FAQ_PREWARM_REFRESH_SEC,
+    per_minute=FAQ_PREWARM_PER_MIN,
+    half_life=FAQ_PREWARM_HALF_LIFE_SEC,
+    interval=FAQ_PREWARM_INTERVAL_SEC,
+)
+
+
+def load_caches() -> None:
+    """
+    Кэши с диска. Сохранение при выходе регистрируется только после загрузки:
+    иначе процесс, который лишь импортировал модуль, затёр бы файлы пустыми кэшами.
+    """
+    faq_cache.load()
+    if FAQ_SIMILARITY_THRESHOLD > 0:
+        for key in faq_cache.keys():
+            faq_similarity.add(key, key)
+    business_verdicts.load()
+    question_verdicts.load()
+    answer_cache.cache.load()
+    answer_cache.rebuild_index()
+    # прогретые наборы — в кэш FAQ сразу при старте, даже если faq.json не успел сохраниться
+    if FAQ_PREWARM_ENABLED:
+        faq_prewarmer.load()
+    atexit.register(save_caches_to_disk)
+
+
+def start_faq_prewarm(generate: bool = True) -> None:
+    if FAQ_PREWARM_ENABLED:
+        faq_prewarmer.start(generate=generate)
+
+
 # === LLM: ФИЛЬТР ВОПРОСОВ ===
 
-def classify_question(question: str, business: Optional[str]) -> str:
+VERDICT_LABELS = ("OK", "NOT_BUSINESS", "ILLEGAL")
+
+
+def parse_verdict(label_raw: str) -> str:
     """
-    Возвращает:
-      - "OK"           — вопрос про бизнес и законный
-      - "NOT_BUSINESS" — вопрос не относится к бизнесу
-      - "ILLEGAL"      — вопрос про незаконные действия
+    Первое слово ответа модели; всё непонятное считаем NOT_BUSINESS.
     """
+    words = label_raw.strip().upper().split()
+    label = words[0] if words else ""
+    if label not in VERDICT_LABELS:
+        label = "NOT_BUSINESS"
+    return label
+
+
+def build_question_filter_messages(question: str, business: Optional[str]) -> List[Dict[str, str]]:
     business_part = (
         f"Описание бизнеса пользователя: {business}."
         if business else
@@ -283,29 +1095,56 @@ def classify_question(question: str, business: Optional[str]) -> str:
         "налогов, наркотики, оружие, взлом, насилие и т.п.) — ответь: ILLEGAL.\n"
         "Ответь строго ОДНИМ словом: OK, NOT_BUSINESS или ILLEGAL."
     )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    completion = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.0,
-        max_tokens=8,
-    )
 
-    label_raw = completion.choices[0].message.content.strip()
-    label = label_raw.upper().split()[0]
+def classify_question(question: str, business: Optional[str]) -> str:
+    """
+    Возвращает:
+      - "OK"           — вопрос про бизнес и законный
+      - "NOT_BUSINESS" — вопрос не относится к бизнесу
+      - "ILLEGAL"      — вопрос про незаконные действия
+    """
+    return parse_verdict(complete("classify", build_question_filter_messages(question, business), temperature=0.0))
+
+
+def question_verdict_key(question: str, business: Optional[str]) -> str:
+    # вердикт по вопросу зависит и от контекста бизнеса
+    return f"{normalize_key(business or '')}\n{normalize_key(question)}"
 
-    if label not in ("OK", "NOT_BUSINESS", "ILLEGAL"):
-        label = "NOT_BUSINESS"
 
+def local_question_verdict(key: str, question: str, business: Optional[str]) -> Optional[str]:
+    """
+    Вердикт без LLM: из кэша или от префильтра. None — нужно спросить LLM.
+    В кэш вердиктов пишутся только ответы LLM: решение префильтра дешёво
+    пересчитать, а ошибку правила кэш закрепил бы на VERDICT_CACHE_TTL_SEC.
+    """
+    label = question_verdicts.get(key)
+    if label is None and PRECLASSIFIER_ENABLED:
+        label = preclassifier.classify_question(question, business)
     return label
 
 
-def check_question_allowed(question: str, session: Dict[str, Any]) -> Tuple[bool, str]:
+def check_question_allowed(
+    question: str,
+    session: Dict[str, Any],
+    before_llm: Optional[Callable[[], None]] = None,
+) -> Tuple[bool, str]:
+    """
+    before_llm вызывается, только если вердикт не нашёлся локально
+    и сейчас будет LLM-вызов (используется для спекулятивного запуска ответа).
+    """
     business = session.get("business") or session.get("saved_business")
-    label = classify_question(question, business)
+    key = question_verdict_key(question, business)
+    label = local_question_verdict(key, question, business)
+    if label is None:
+        if before_llm is not None:
+            before_llm()
+        label = classify_question(question, business)
+        question_verdicts.set(key, label)
     if label == "OK":
         return True, label
     return False, label
@@ -313,13 +1152,7 @@ def check_question_allowed(question: str, session: Dict[str, Any]) -> Tuple[bool
 
 # === LLM: ФИЛЬТР ОПИСАНИЯ БИЗНЕСА ===
 
-def classify_business(business: str) -> str:
-    """
-    Возвращает:
-      - "OK"           — похоже на легальный бизнес / деятельность
-      - "NOT_BUSINESS" — вообще не описание бизнеса
-      - "ILLEGAL"      — заведомо незаконная деятельность
-    """
+def build_business_filter_messages(business: str) -> List[Dict[str, str]]:
     system_prompt = (
         "Ты фильтр описаний бизнеса для Telegram-бота-помощника по микробизнесу. "
         "Определи, является ли текст описанием бизнеса и не содержит ли он "
@@ -336,28 +1169,41 @@ def classify_business(business: str) -> str:
         "наркотики, оружие, взлом, насилие и т.п.) — ответь: ILLEGAL.\n"
         "Ответь строго ОДНИМ словом: OK, NOT_BUSINESS или ILLEGAL."
     )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    completion = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.0,
-        max_tokens=8,
-    )
 
-    label_raw = completion.choices[0].message.content.strip()
-    label = label_raw.upper().split()[0]
+def classify_business(business: str) -> str:
+    """
+    Возвращает:
+      - "OK"           — похоже на легальный бизнес / деятельность
+      - "NOT_BUSINESS" — вообще не описание бизнеса
+      - "ILLEGAL"      — заведомо незаконная деятельность
+    """
+    return parse_verdict(complete("classify", build_business_filter_messages(business), temperature=0.0))
 
-    if label not in ("OK", "NOT_BUSINESS", "ILLEGAL"):
-        label = "NOT_BUSINESS"
 
+def local_business_verdict(key: str, business: str) -> Optional[str]:
+    """
+    Вердикт без LLM: из кэша или от префильтра. None — нужно спросить LLM.
+    """
+    label = business_verdicts.get(key)
+    if label is None and PRECLASSIFIER_ENABLED:
+        # очевидные случаи решаем локально, остальное — в LLM (в кэш — только ответы LLM)
+        label = preclassifier.classify_business(business)
     return label
 
 
-def check_business_allowed(business: str) -> Tuple[bool, str]:
-    label = classify_business(business)
+def check_business_allowed(business: str, before_llm: Optional[Callable[[], None]] = None) -> Tuple[bool, str]:
+    key = normalize_key(business)
+    label = local_business_verdict(key, business)
+    if label is None:
+        if before_llm is not None:
+            before_llm()
+        label = classify_business(business)
+        business_verdicts.set(key, label)
     if label == "OK":
         return True, label
     return False, label
@@ -365,7 +1211,14 @@ def check_business_allowed(business: str) -> Tuple[bool, str]:
 
 # === LLM: ОТВЕТ НА ВОПРОС С УЧЁТОМ ИСТОРИИ ===
 
-def ask_llm(session: Dict[str, Any], question: str) -> str:
+answer_prompts = PromptBuilder(PROMPT_INPUT_BUDGET_TOKENS, turn_max_tokens=PROMPT_TURN_MAX_TOKENS)
+
+
+def build_answer_messages(session: Dict[str, Any], question: str) -> List[Dict[str, str]]:
+    """
+    Промпт в пределах PROMPT_INPUT_BUDGET_TOKENS: системный промпт, бизнес,
+    конспект старых вопросов, свежая история (см. PromptBuilder), новый вопрос.
+    """
     business = session.get("business") or session.get("saved_business") or "микробизнес"
     history = session.get("history") or []
 
@@ -375,7 +1228,7 @@ def ask_llm(session: Dict[str, Any], question: str) -> str:
         "с конкретными шагами. Не уходи в воду."
     )
 
-    messages: List[Dict[str, str]] = [
+    head: List[Dict[str, str]] = [
         {"role": "system", "content": system_prompt},
         {
             "role": "user",
@@ -383,25 +1236,84 @@ def ask_llm(session: Dict[str, Any], question: str) -> str:
                        f"Ты помогаешь владельцу принимать решения.",
         },
     ]
-
-    for pair in history[-3:]:
-        messages.append({"role": "user", "content": f"Раньше владелец спрашивал: {pair['q']}"})
-        messages.append({"role": "assistant", "content": f"Ты отвечал так: {pair['a']}"})
-
-    messages.append({
+    tail = [{
         "role": "user",
         "content": f"Новый вопрос владельца: {question}\n"
                    f"Дай чёткий, практический ответ.",
-    })
+    }]
+    return answer_prompts.build(head, list(history), session.get("summary") or "", tail)
+
+
+def ask_llm(session: Dict[str, Any], question: str) -> str:
+    return complete("answer", build_answer_messages(session, question), temperature=0.3).strip()
+
 
-    completion = client.chat.completions.create(
-        model=MODEL_NAME,
+def _open_answer_stream(model: str, messages: List[Dict[str, str]], timeout: float) -> Any:
+    return groq_client().chat.completions.create(
+        model=model,
         messages=messages,
         temperature=0.3,
-        max_tokens=1024,
+        max_tokens=llm_router.route("answer").max_tokens,
+        stream=True,
+        timeout=timeout,
     )
 
-    return completion.choices[0].message.content.strip()
+
+def ask_llm_stream(session: Dict[str, Any], question: str) -> Iterator[str]:
+    """
+    То же, что ask_llm, но отдаёт куски текста по мере генерации.
+    """
+    return routed_stream("answer", _open_answer_stream, build_answer_messages(session, question))
+
+
+# === СПЕКУЛЯТИВНОЕ ВЫПОЛНЕНИЕ LLM-ВЫЗОВОВ ===
+
+# пул создаёт start_sync_runtime(); пока его нет, спекуляций тоже нет
+llm_pool: Optional[ThreadPoolExecutor] = None
+
+speculation_stats: Dict[str, int] = {"started": 0, "used": 0, "discarded": 0}
+_speculation_lock = threading.Lock()
+
+
+def count_speculation(key: str) -> None:
+    with _speculation_lock:
+        speculation_stats[key] += 1
+
+
+class Speculation:
+    """
+    Отложенный «на всякий случай» LLM-вызов: start() запускает fn(*args) в llm_pool,
+    result() забирает результат, discard() отменяет (или просто выбрасывает,
+    если запрос уже ушёл в Groq — HTTP-запрос прервать нельзя).
+    """
+
+    def __init__(self, fn: Callable[..., Any], *args: Any) -> None:
+        self.fn = fn
+        self.args = args
+        self.future: Optional[Future] = None
+
+    @property
+    def started(self) -> bool:
+        return self.future is not None
+
+    def start(self) -> None:
+        if self.future is None:
+            self.future = llm_pool.submit(self.fn, *self.args)
+            count_speculation("started")
+
+    def result(self) -> Any:
+        count_speculation("used")
+        return self.future.result()
+
+    def discard(self) -> None:
+        if self.future is not None:
+            self.future.cancel()
+            count_speculation("discarded")
+            self.future = None
+
+
+def speculate(fn: Callable[..., Any], *args: Any) -> Optional[Speculation]:
+    return Speculation(fn, *args) if SPECULATIVE_LLM and llm_pool is not None else None
 
 
 # === ФОРМАТИРОВАНИЕ ОТВЕТОВ ПОД TELEGRAM ===
@@ -471,8 +1383,95 @@ def format_answer_for_telegram(text: str) -> str:
     return text
 
 
+# === ПОТОКОВАЯ ОТРИСОВКА ОТВЕТА ===
+
+# подпись к фото в Telegram — не больше 1024 символов
+CAPTION_LIMIT = 1024
+
+
+def answer_screen_text(question: str, answer_html: str) -> str:
+    return (
+        "<b>Вопрос:</b>\n"
+        f"{html.escape(question)}\n\n"
+        "<b>Ответ:</b>\n"
+        f"{answer_html}"
+    )
+
+
+class StreamingAnswerRenderer:
+    """
+    Показывает ответ по мере генерации: правит подпись экрана ответа
+    (edit_message_caption) не чаще interval секунд и только если текст
+    заметно вырос. Промежуточный текст — просто экранированный, без
+    format_answer_for_telegram: финальную версию рисует send_screen.
+    """
+
+    def __init__(self, chat_id: int, session: Dict[str, Any], question: str) -> None:
+        self.chat_id = chat_id
+        self.session = session
+        self.question = question
+        self.parts: List[str] = []
+        self.shown_len = 0
+        self.last_edit = 0.0
+        self.first_render_at: Optional[float] = None
+        self.edits = 0
+
+    def _preview(self, text: str) -> str:
+        head = answer_screen_text(self.question, "")
+        room = CAPTION_LIMIT - len(head) - 2
+        body = text if len(text) <= room else text[: max(0, room - 1)] + "…"
+        return answer_screen_text(self.question, html.escape(body) + " ▍")
+
+    def start(self) -> None:
+        send_screen(
+            self.chat_id,
+            self.session,
+            answer_screen_text(self.question, "<i>Печатаю ответ…</i>"),
+            banner_id=BANNER_ANSWER_ID,
+        )
+
+    def feed(self, delta: str) -> None:
+        self.parts.append(delta)
+        now = time.monotonic()
+        text = "".join(self.parts)
+        if now - self.last_edit < STREAM_EDIT_INTERVAL_SEC:
+            return
+        if len(text) - self.shown_len < STREAM_MIN_DELTA_CHARS and self.shown_len:
+            return
+        message_id = self.session.get("last_message_id")
+        if not message_id:
+            return
+        try:
+            tg_call(
+                self.chat_id,
+                bot.edit_message_caption,
+                chat_id=self.chat_id,
+                message_id=message_id,
+                caption=self._preview(text.strip()),
+            )
+            self.edits += 1
+            # на экране теперь промежуточный текст — хеш последнего экрана больше не верен
+            self.session["last_text_hash"] = None
+            if self.first_render_at is None:
+                self.first_render_at = time.monotonic()
+        except Exception:
+            # промежуточная правка не критична — финальный экран всё равно будет
+            pass
+        self.shown_len = len(text)
+        self.last_edit = now
+
+    def text(self) -> str:
+        return "".join(self.parts).strip()
+
+
 # === ТЕКСТЫ ДЛЯ ЭКРАНОВ ===
 
+LLM_UNAVAILABLE_TEXT = (
+    "<b>Помощник сейчас перегружен и не успевает ответить.</b>\n"
+    "Попробуй ещё раз через минуту — твой бизнес и история вопросов сохранены."
+)
+
+
 def get_welcome_text(saved_business: Optional[str]) -> str:
     if saved_business:
         safe_business = html.escape(saved_business)
@@ -608,7 +1607,67 @@ def add_common_nav(markup: Optional[InlineKeyboardMarkup] = None) -> InlineKeybo
 
 
 # === ПОКАЗАТЬ FAQ ПО БИЗНЕСУ ===
-def present_faqs_for_business(chat_id: int, session: Dict[str, Any], reuse: bool = False) -> None:
+
+def render_faq_list(chat_id: int, session: Dict[str, Any], pending: bool = False) -> None:
+    """
+    Экран списка FAQ с текущей страницей; pending — список ещё дописывается.
+    """
+    header = get_faq_header_text(session)
+    markup, page, total_pages = build_faq_keyboard(session)
+    status = " · остальные вопросы ещё пишутся…" if pending else ""
+    footer = f"\n\n<i>Страница {page + 1} из {total_pages}{status}</i>"
+    markup = add_common_nav(markup)
+
+    send_screen(chat_id, session, header + footer, banner_id=BANNER_FAQ_ID, inline_markup=markup)
+
+
+class StreamingFaqRenderer:
+    """
+    Показывает список FAQ по ходу generate_faqs_stream: первый раз — как только
+    готова первая страница, дальше — когда набирается очередная страница,
+    но не чаще STREAM_EDIT_INTERVAL_SEC. Финальный экран рисует present_faqs_for_business.
+    """
+
+    def __init__(self, chat_id: int, session: Dict[str, Any], page_size: int = 3) -> None:
+        self.chat_id = chat_id
+        self.session = session
+        self.page_size = page_size
+        self.shown_pages = 0
+        self.last_edit = 0.0
+        self.first_page_at: Optional[float] = None
+
+    def feed(self, items: List[Dict[str, str]]) -> None:
+        pages = len(items) // self.page_size
+        if pages <= self.shown_pages:
+            return
+        now = time.monotonic()
+        if self.shown_pages and now - self.last_edit < STREAM_EDIT_INTERVAL_SEC:
+            return
+        self.session["faqs"] = items
+        self.session["stage"] = "choose_question"
+        self.session["faq_page"] = 0
+        self.session["faq_page_size"] = self.page_size
+        try:
+            render_faq_list(self.chat_id, self.session, pending=True)
+        except Exception:
+            # промежуточный экран не критичен — финальный всё равно будет
+            return
+        if self.first_page_at is None:
+            self.first_page_at = time.monotonic()
+        self.shown_pages = pages
+        self.last_edit = now
+
+
+def present_faqs_for_business(
+    chat_id: int,
+    session: Dict[str, Any],
+    reuse: bool = False,
+    speculation: Optional[Speculation] = None,
+) -> None:
+    """
+    speculation — уже запущенная (спекулятивно, параллельно с фильтром)
+    генерация FAQ для этого бизнеса; если FAQ нашлись в кэше, она выбрасывается.
+    """
     business = session.get("business")
     if not business:
         session["stage"] = "waiting_business"
@@ -619,16 +1678,41 @@ def present_faqs_for_business(chat_id: int, session: Dict[str, Any], reuse: bool
         send_screen(chat_id, session, text, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
         return
 
-    if reuse:
-        time.sleep(7)
-        pre_text = "<i>Продолжаем работать с этим бизнесом. Собираю типовые вопросы…</i>"
-    else:
-        pre_text = "<i>Принял описание бизнеса. Думаю над типовыми вопросами для такого дела…</i>"
-
-    # Показать «промежуточную» страницу со статусом
-    send_screen(chat_id, session, pre_text, banner_id=BANNER_FAQ_ID, inline_markup=add_common_nav())
-
-    faqs = generate_faqs(business, n=9)
+    started_at = time.monotonic()
+    first_page_at: Optional[float] = None
+    faq_mode = "cache"
+    faqs = get_cached_faqs(business)
+    if faqs is not None and speculation is not None:
+        speculation.discard()
+
+    # FAQ уже в кэше — сразу рисуем список, без паузы и промежуточного экрана
+    if faqs is None:
+        if reuse:
+            time.sleep(7)
+            pre_text = "<i>Продолжаем работать с этим бизнесом. Собираю типовые вопросы…</i>"
+        else:
+            pre_text = "<i>Принял описание бизнеса. Думаю над типовыми вопросами для такого дела…</i>"
+
+        # Показать «промежуточную» страницу со статусом
+        send_screen(chat_id, session, pre_text, banner_id=BANNER_FAQ_ID, inline_markup=add_common_nav())
+
+        if speculation is not None and speculation.started:
+            # в кэш кладём только после вердикта OK
+            faq_mode = "speculation"
+            faqs = speculation.result()
+            cache_faqs(business, faqs)
+        elif STREAM_FAQS:
+            # первая страница появится по ходу генерации, финальный список — ниже
+            faq_mode = "stream"
+            renderer = StreamingFaqRenderer(chat_id, session)
+            faqs, complete_set = generate_faqs_stream(business, n=9, on_items=renderer.feed)
+            if complete_set:
+                cache_faqs(business, faqs)
+            first_page_at = renderer.first_page_at
+        else:
+            faq_mode = "blocking"
+            faqs = generate_and_cache_faqs(business, n=9)
+    shown_at = time.monotonic()
     session["faqs"] = faqs
     session["stage"] = "choose_question"
     session["faq_page"] = 0
@@ -638,19 +1722,16 @@ def present_faqs_for_business(chat_id: int, session: Dict[str, Any], reuse: bool
         "type": "business_profile",
         "chat_id": chat_id,
         "business": business,
+        "faq_mode": faq_mode,
+        "faq_first_page_ms": int(((first_page_at or shown_at) - started_at) * 1000),
+        "faq_total_ms": int((shown_at - started_at) * 1000),
     })
 
-    header = get_faq_header_text(session)
-    markup, page, total_pages = build_faq_keyboard(session)
-    footer = f"\n\n<i>Страница {page + 1} из {total_pages}</i>"
-    markup = add_common_nav(markup)
-
-    send_screen(chat_id, session, header + footer, banner_id=BANNER_FAQ_ID, inline_markup=markup)
+    render_faq_list(chat_id, session)
 
 
 # === ХЕНДЛЕРЫ ===
 
-@bot.message_handler(commands=["start"])
 def handle_start(message):
     chat_id = message.chat.id
     session = get_session(chat_id)
@@ -658,7 +1739,7 @@ def handle_start(message):
     # Первый /start не удаляем, все последующие стараемся убрать
     if session.get("first_start_seen"):
         try:
-            bot.delete_message(chat_id, message.message_id)
+            tg_call(chat_id, bot.delete_message, chat_id, message.message_id)
         except Exception:
             pass
 
@@ -681,7 +1762,6 @@ def handle_start(message):
     else:
         session["stage"] = "waiting_business"
 
-@bot.message_handler(commands=["/help"])
 def handle_help(message):
     chat_id = message.chat.id
     #text_msg = (message.text or "").strip()
@@ -699,7 +1779,6 @@ def handle_help(message):
         send_screen(chat_id, session, text_msg, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
 
 
-@bot.message_handler(commands=["/"])
 def handle_random_cmd(message):
     chat_id = message.chat.id
     text_msg = (message.text or "").strip()
@@ -718,7 +1797,6 @@ def handle_random_cmd(message):
         handle_help(message)
 
 
-@bot.message_handler(func=lambda m: True, content_types=["text"])
 def router(message):
     chat_id = message.chat.id
     text_msg = (message.text or "").strip()
@@ -728,7 +1806,7 @@ def router(message):
     is_start_like = text_msg.lower() in ("старт", "start", "/start") or text_msg == "/start"
     if not (is_start_like and not session.get("first_start_seen")):
         try:
-            bot.delete_message(chat_id, message.message_id)
+            tg_call(chat_id, bot.delete_message, chat_id, message.message_id)
         except Exception:
             pass
 
@@ -751,9 +1829,22 @@ def handle_business_description(message, session: Dict[str, Any]) -> None:
     chat_id = message.chat.id
     business = (message.text or "").strip()
 
-    allowed, reason = check_business_allowed(business)
+    # если вердикт пойдёт в LLM — параллельно с ним начинаем генерировать FAQ
+    # (при стриминге первая страница и так появляется рано, спекуляция не нужна)
+    speculation = None if STREAM_FAQS else speculate(generate_faqs, business, 9)
+
+    def start_faqs() -> None:
+        if faq_cache.peek(normalize_key(business)) is None:
+            speculation.start()
+
+    allowed, reason = check_business_allowed(
+        business,
+        before_llm=start_faqs if speculation is not None else None,
+    )
 
     if not allowed:
+        if speculation is not None:
+            speculation.discard()
         save_packet({
             "type": "rejected_business",
             "chat_id": chat_id,
@@ -780,16 +1871,33 @@ def handle_business_description(message, session: Dict[str, Any]) -> None:
     session["business"] = business
     session["saved_business"] = business
 
-    present_faqs_for_business(chat_id, session, reuse=False)
+    present_faqs_for_business(chat_id, session, reuse=False, speculation=speculation)
 
 
 def handle_custom_question(message, session: Dict[str, Any]) -> None:
     chat_id = message.chat.id
     question = (message.text or "").strip()
-
-    allowed, reason = check_question_allowed(question, session)
+    started_at = time.monotonic()
+
+    # такой же вопрос по похожему бизнесу уже разбирали — ответ возьмём из кэша,
+    # но только после вердикта: модерацию кэш не обходит
+    cached_answer = lookup_cached_answer(session, question)
+
+    # если вердикт пойдёт в LLM — параллельно с ним начинаем считать ответ
+    # (при стриминге ответ и так показывается сразу, спекуляция не нужна)
+    speculation = None
+    if cached_answer is None and not STREAM_ANSWERS:
+        speculation = speculate(ask_llm, session, question)
+    allowed, reason = check_question_allowed(
+        question,
+        session,
+        before_llm=speculation.start if speculation is not None else None,
+    )
 
     if not allowed:
+        # ответ показываем только после вердикта OK — иначе выбрасываем
+        if speculation is not None:
+            speculation.discard()
         # ЛОГИ И ОТВЕТ ДЛЯ ВЫКИНУТЫХ ВОПРОСОВ
         save_packet({
             "type": "rejected_question",
@@ -813,13 +1921,42 @@ def handle_custom_question(message, session: Dict[str, Any]) -> None:
         send_screen(chat_id, session, text, banner_id=BANNER_ANSWER_ID)
         return
 
-    # Сразу считаем итоговый ответ и рисуем одну аккуратную страницу
-    raw_answer = ask_llm(session, question)
+    if cached_answer is not None:
+        return render_custom_answer(chat_id, session, question, cached_answer, "cache", started_at, None)
+
+    if STREAM_ANSWERS:
+        # Показываем ответ по мере генерации, финальную страницу рисуем ниже
+        renderer = StreamingAnswerRenderer(chat_id, session, question)
+        renderer.start()
+        for delta in ask_llm_stream(session, question):
+            renderer.feed(delta)
+        raw_answer = renderer.text()
+        first_render_at = renderer.first_render_at
+    else:
+        # Сразу считаем итоговый ответ и рисуем одну аккуратную страницу
+        if speculation is not None and speculation.started:
+            raw_answer = speculation.result()
+        else:
+            raw_answer = ask_llm(session, question)
+        first_render_at = None
+    cache_answer(session, question, raw_answer)
+    answer_mode = "stream" if STREAM_ANSWERS else "blocking"
+    render_custom_answer(chat_id, session, question, raw_answer, answer_mode, started_at, first_render_at)
+
+
+def render_custom_answer(
+    chat_id: int,
+    session: Dict[str, Any],
+    question: str,
+    raw_answer: str,
+    answer_mode: str,
+    started_at: float,
+    first_render_at: Optional[float],
+) -> None:
     formatted_answer = format_answer_for_telegram(raw_answer)
+    answered_at = time.monotonic()
 
-    history = session.get("history") or []
-    history.append({"q": question, "a": raw_answer})
-    session["history"] = history[-10:]
+    session.add_history(question, raw_answer)
 
     save_packet({
         "type": "user_question",
@@ -827,24 +1964,19 @@ def handle_custom_question(message, session: Dict[str, Any]) -> None:
         "business": session.get("business") or session.get("saved_business"),
         "question": question,
         "answer": raw_answer,
+        # латентность, которую видит пользователь: до первого текста ответа и до полного
+        "answer_mode": answer_mode,
+        "answer_first_text_ms": int(((first_render_at or answered_at) - started_at) * 1000),
+        "answer_total_ms": int((answered_at - started_at) * 1000),
     })
 
-    safe_q = html.escape(question)
-    safe_a = html.escape(formatted_answer)
-
-    text = (
-        "<b>Вопрос:</b>\n"
-        f"{safe_q}\n\n"
-        "<b>Ответ:</b>\n"
-        f"{safe_a}"
-    )
+    text = answer_screen_text(question, html.escape(formatted_answer))
 
     send_screen(chat_id, session, text, banner_id=BANNER_ANSWER_ID, inline_markup=add_common_nav())
 
 
 # === CALLBACK-КНОПКИ ===
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("faq_"))
 def on_faq_button(callback_query):
     chat_id = callback_query.message.chat.id
     data = callback_query.data
@@ -911,9 +2043,7 @@ def on_faq_button(callback_query):
 
     bot.answer_callback_query(callback_query.id)
 
-    history = session.get("history") or []
-    history.append({"q": question, "a": answer})
-    session["history"] = history[-10:]
+    session.add_history(question, answer)
 
     save_packet({
         "type": "faq_click",
@@ -936,7 +2066,6 @@ def on_faq_button(callback_query):
     send_screen(chat_id, session, text, banner_id=BANNER_ANSWER_ID, inline_markup=add_common_nav())
 
 
-@bot.callback_query_handler(func=lambda c: c.data == "business_other")
 def on_business_other(callback_query):
     chat_id = callback_query.message.chat.id
     session = get_session(chat_id)
@@ -953,7 +2082,6 @@ def on_business_other(callback_query):
     send_screen(chat_id, session, text, banner_id=BANNER_WELCOME_ID, inline_markup=add_common_nav())
 
 
-@bot.callback_query_handler(func=lambda c: c.data == "go_menu")
 def on_go_menu(callback_query):
     """
     Кнопка "🏠 В меню" доступна почти на всех экранах.
@@ -985,6 +2113,187 @@ def on_go_menu(callback_query):
         session["stage"] = "waiting_business"
 
 
+# === ДИСПЕТЧЕР АПДЕЙТОВ ===
+
+def update_chat_id(update: telebot.types.Update) -> Optional[int]:
+    for message in (update.message, update.edited_message):
+        if message is not None:
+            return message.chat.id
+    query = update.callback_query
+    if query is not None and query.message is not None:
+        return query.message.chat.id
+    return None
+
+
+# исходный bot.process_new_updates (хендлеры telebot в текущем потоке), см. start_sync_runtime()
+process_update_inline: Optional[Callable[[List[telebot.types.Update]], None]] = None
+
+# задержка от приёма апдейта (ответ getUpdates / POST вебхука) до начала его обработки
+ingest_latency_ms: "deque[float]" = deque(maxlen=1000)
+webhook_server: Optional[WebhookServer] = None
+
+
+def ingest_stats() -> Dict[str, Any]:
+    samples = sorted(ingest_latency_ms)
+    stats: Dict[str, Any] = {"mode": BOT_MODE}
+    if samples:
+        stats["latency_ms_p50"] = round(samples[len(samples) // 2], 2)
+        stats["latency_ms_p99"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2)
+        stats["latency_ms_max"] = round(samples[-1], 2)
+    if webhook_server is not None:
+        stats["webhook"] = dict(webhook_server.stats)
+    return stats
+
+
+def process_update(update: telebot.types.Update) -> None:
+    received_at = getattr(update, "received_at", None)
+    if received_at is not None:
+        ingest_latency_ms.append((time.monotonic() - received_at) * 1000)
+    try:
+        process_update_inline([update])
+    except LlmUnavailable:
+        # стадию сессии не трогаем: пользователь может просто повторить сообщение
+        show_llm_unavailable(update_chat_id(update))
+    finally:
+        chat_id = update_chat_id(update)
+        if chat_id is not None:
+            save_session(chat_id)
+
+
+def show_llm_unavailable(chat_id: Optional[int]) -> None:
+    if chat_id is None:
+        return
+    session = get_session(chat_id)
+    banner_id = BANNER_ANSWER_ID if session.get("stage") == "custom_question" else BANNER_WELCOME_ID
+    save_packet({"type": "llm_unavailable", "chat_id": chat_id, "stage": session.get("stage")})
+    send_screen(chat_id, session, LLM_UNAVAILABLE_TEXT, banner_id=banner_id, inline_markup=add_common_nav())
+
+
+# очереди чатов и пул хендлеров, создаёт start_sync_runtime()
+chat_dispatcher: Optional[ChatDispatcher] = None
+
+
+def dispatch_updates(updates: List[telebot.types.Update]) -> None:
+    """
+    Вместо bot.process_new_updates: раскладывает апдейты по очередям чатов
+    и сразу возвращается, чтобы поллинг забирал следующую пачку.
+    Апдейты без чата идут каждый в свою очередь.
+    """
+    if not updates:
+        return
+    received_at = time.monotonic()
+    for update in updates:
+        if getattr(update, "received_at", None) is None:
+            update.received_at = received_at
+    bot.last_update_id = max(bot.last_update_id, max(u.update_id for u in updates))
+    for update in updates:
+        chat_id = update_chat_id(update)
+        chat_dispatcher.submit(chat_id if chat_id is not None else ("update", update.update_id), update)
+
+
+def handle_raw_updates(raw_updates: List[Dict[str, Any]], received_at: float) -> None:
+    """
+    JSON апдейтов (WebhookServer, воркер sharding.py) -> Update -> очереди чатов.
+    """
+    updates = [telebot.types.Update.de_json(raw) for raw in raw_updates]
+    for update in updates:
+        update.received_at = received_at
+    dispatch_updates(updates)
+
+
+def run_webhook() -> None:
+    global webhook_server
+    webhook_server = WebhookServer(
+        handle_raw_updates,
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        path=WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+    )
+    if WEBHOOK_URL:
+        bot.set_webhook(url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None)
+    print(f"Webhook listening on {WEBHOOK_HOST}:{webhook_server.port}{WEBHOOK_PATH}")
+    try:
+        webhook_server.serve_forever()
+    finally:
+        webhook_server.httpd.server_close()
+
+
+def start_answer_cache_seed() -> None:
+    if ANSWER_CACHE_ENABLED and ANSWER_CACHE_SEED_FROM_PACKETS and len(answer_cache.cache) == 0:
+        threading.Thread(target=seed_answer_cache, name="answer-cache-seed", daemon=True).start()
+
+
+# === ЗАПУСК ===
+# Импорт модуля только читает настройки и создаёт объекты без потоков и сети —
+# его функции берёт и async_bot. Общее для обоих рантаймов (потоки записи пакетов
+# и сессий, кэши с диска) поднимает start_shared_runtime(), sync-рантайм (TeleBot,
+# хендлеры, пул хендлеров и пул спекуляций) — start_sync_runtime().
+
+_shared_started = False
+
+
+def start_shared_runtime() -> None:
+    global _shared_started
+    if _shared_started:
+        return
+    _shared_started = True
+    packet_writer.start()
+    # при остановке процесса дописываем всё, что осталось в очереди
+    atexit.register(packet_writer.close)
+    session_store.start()
+    atexit.register(session_store.close)
+    load_caches()
+
+
+def register_handlers(telebot_bot: telebot.TeleBot) -> None:
+    telebot_bot.register_message_handler(handle_start, commands=["start"])
+    telebot_bot.register_message_handler(handle_help, commands=["/help"])
+    telebot_bot.register_message_handler(handle_random_cmd, commands=["/"])
+    telebot_bot.register_message_handler(router, func=lambda m: True, content_types=["text"])
+    telebot_bot.register_callback_query_handler(on_faq_button, func=lambda c: c.data and c.data.startswith("faq_"))
+    telebot_bot.register_callback_query_handler(on_business_other, func=lambda c: c.data == "business_other")
+    telebot_bot.register_callback_query_handler(on_go_menu, func=lambda c: c.data == "go_menu")
+
+
+def start_sync_runtime() -> None:
+    global bot, llm_pool, chat_dispatcher, process_update_inline
+    if bot is not None:
+        return
+    start_shared_runtime()
+    # HTML по умолчанию, чтобы везде работало форматирование.
+    # threaded=False: апдейты раскладывает по потокам chat_dispatcher, а не пул telebot
+    bot = telebot.TeleBot(API_TOKEN, parse_mode="HTML", threaded=False)
+    register_handlers(bot)
+    llm_pool = ThreadPoolExecutor(max_workers=LLM_POOL_SIZE, thread_name_prefix="llm")
+    chat_dispatcher = ChatDispatcher(
+        process_update,
+        workers=CHAT_WORKERS,
+        max_backlog=CHAT_MAX_BACKLOG,
+    )
+    chat_busy_checks.append(chat_dispatcher.busy)
+    process_update_inline = bot.process_new_updates
+    bot.process_new_updates = dispatch_updates
+
+
 if __name__ == "__main__":
+    start_sync_runtime()
     print("Bot started")
-    bot.infinity_polling()
\ No newline at end of file
+    start_answer_cache_seed()
+    start_faq_prewarm()
+    retention_sweeper.start()
+    cache_saver.start()
+    session_evictor.start()
+    try:
+        if BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            bot.infinity_polling()
+    finally:
+        faq_prewarmer.stop()
+        retention_sweeper.stop()
+        cache_saver.stop()
+        session_evictor.stop()
+        chat_dispatcher.close()
+        packet_writer.close()
+        packet_log.close()
\ No newline at end of file
@@ -0,0 +1,538 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import calendar
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, IO
+
+# === СЕГМЕНТИРОВАННЫЙ ЛОГ ПАКЕТОВ ===
+#
+# Пакеты дописываются компактными JSON-строками в файлы-сегменты
+# <root>/<YYYYMMDDHH>/<start_ms>-<pid>.jsonl — по часовым «корзинам» (UTC).
+# У каждого писателя (процесса, pid в имени) активный сегмент один, он
+# закрывается и заменяется новым по размеру, возрасту или при смене часа.
+# Закрытые сегменты больше не меняются, поэтому docker_worker может спокойно
+# читать их по смещению. В одну корзину могут писать несколько процессов
+# (sharding.py), так что сегмент закрыт, только когда у того же писателя
+# есть следующий, — читатель ведёт позицию отдельно по каждому писателю.
+# Ретеншн удаляет целые просроченные корзины, не открывая ни одного файла.
+
+SEGMENT_SUFFIX = ".jsonl"
+BUCKET_SECONDS = 3600
+BUCKET_FORMAT = "%Y%m%d%H"
+
+
+class SegmentPosition(NamedTuple):
+    """
+    Точка в логе: сегмент ("<корзина>/<файл>") и смещение в байтах внутри него.
+    """
+    segment: str = ""
+    offset: int = 0
+
+
+class LogPosition(NamedTuple):
+    """
+    Позиция читателя: по каждому писателю — (писатель, сегмент, смещение).
+    Пустая — «с самого начала лога». Писатель, которого нет в позиции, читается с начала.
+    """
+    writers: Tuple[Tuple[str, str, int], ...] = ()
+
+
+def segment_writer(segment: str) -> str:
+    """
+    "<корзина>/<start_ms>-<pid>.jsonl" -> "<pid>"; у сегментов старого формата без pid — "".
+    """
+    name = segment.rsplit("/", 1)[-1][: -len(SEGMENT_SUFFIX)]
+    return name.partition("-")[2]
+
+
+def bucket_name(ts: float) -> str:
+    return time.strftime(BUCKET_FORMAT, time.gmtime(ts))
+
+
+def bucket_start(name: str) -> Optional[float]:
+    try:
+        return float(calendar.timegm(time.strptime(name, BUCKET_FORMAT)))
+    except ValueError:
+        return None
+
+
+def list_buckets(root: str) -> List[str]:
+    try:
+        names = [n for n in os.listdir(root) if bucket_start(n) is not None]
+    except FileNotFoundError:
+        return []
+    return sorted(names)
+
+
+def list_segments(root: str) -> List[str]:
+    """
+    Сегменты в порядке записи: "<корзина>/<start_ms>.jsonl".
+    Сортировка строк совпадает с порядком по времени.
+    """
+    segments: List[str] = []
+    for bucket in list_buckets(root):
+        try:
+            names = os.listdir(os.path.join(root, bucket))
+        except FileNotFoundError:
+            continue
+        segments.extend(f"{bucket}/{n}" for n in sorted(names) if n.endswith(SEGMENT_SUFFIX))
+    return segments
+
+
+class PacketLog:
+    """
+    Писатель лога: одна буферизованная дозапись на пакет,
+    ротация сегментов по max_segment_bytes / max_segment_age.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        max_segment_age: float = 3600.0,
+        flush_each: bool = True,
+    ) -> None:
+        self.root = root
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.flush_each = flush_each
+
+        self._lock = threading.Lock()
+        self._file: Optional[IO[bytes]] = None
+        self._segment: Optional[str] = None
+        self._bucket: Optional[str] = None
+        self._segment_opened_at = 0.0
+        self._segment_size = 0
+
+        os.makedirs(self.root, exist_ok=True)
+
+    # --- запись ---
+
+    def _open_segment(self, now: float) -> None:
+        bucket = bucket_name(now)
+        bucket_dir = os.path.join(self.root, bucket)
+        os.makedirs(bucket_dir, exist_ok=True)
+
+        start_ms = int(now * 1000)
+        # pid в имени: по нему читатель отличает сегменты разных процессов (sharding.py);
+        # O_EXCL — на случай двух ротаций в одну миллисекунду
+        while True:
+            name = f"{start_ms:013d}-{os.getpid()}{SEGMENT_SUFFIX}"
+            try:
+                fd = os.open(os.path.join(bucket_dir, name), os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+                break
+            except FileExistsError:
+                start_ms += 1
+
+        self._file = os.fdopen(fd, "ab")
+        self._segment = f"{bucket}/{name}"
+        self._bucket = bucket
+        self._segment_opened_at = now
+        self._segment_size = 0
+
+    def _close_segment(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            self._file.close()
+        self._file = None
+        self._segment = None
+        self._bucket = None
+        self._segment_size = 0
+
+    def _need_rotation(self, now: float, incoming: int) -> bool:
+        if self._file is None:
+            return True
+        if self._segment_size and self._segment_size + incoming > self.max_segment_bytes:
+            return True
+        if bucket_name(now) != self._bucket:
+            return True
+        return now - self._segment_opened_at >= self.max_segment_age
+
+    @staticmethod
+    def encode(packet: Dict[str, Any]) -> bytes:
+        return (json.dumps(packet, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def _write_line(self, line: bytes, now: float) -> SegmentPosition:
+        if self._need_rotation(now, len(line)):
+            self._close_segment()
+            self._open_segment(now)
+
+        position = SegmentPosition(self._segment, self._segment_size)
+        self._file.write(line)
+        self._segment_size += len(line)
+        return position
+
+    def append(self, packet: Dict[str, Any]) -> SegmentPosition:
+        """
+        Дописывает пакет одной строкой и возвращает позицию,
+        с которой эта строка начинается.
+        """
+        line = self.encode(packet)
+        with self._lock:
+            position = self._write_line(line, time.time())
+            if self.flush_each:
+                self._file.flush()
+        return position
+
+    def append_many(self, lines: Iterable[bytes]) -> int:
+        """
+        Групповая запись уже закодированных строк (см. encode) под одной блокировкой
+        и с одним flush в конце. Возвращает число байт.
+        """
+        written = 0
+        with self._lock:
+            now = time.time()
+            for line in lines:
+                self._write_line(line, now)
+                written += len(line)
+            if self._file is not None:
+                self._file.flush()
+        return written
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def sync(self) -> None:
+        """
+        flush + fsync активного сегмента.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+    @property
+    def active_segment(self) -> Optional[str]:
+        return self._segment
+
+    # --- обслуживание ---
+
+    def drop_expired_buckets(self, cutoff: float) -> int:
+        """
+        Удаляет часовые корзины, которые целиком старше cutoff.
+        Смотрим только на имена каталогов — файлы не открываются.
+        """
+        removed = 0
+        for bucket in list_buckets(self.root):
+            start = bucket_start(bucket)
+            if start is None or start + BUCKET_SECONDS > cutoff:
+                # корзины отсортированы по времени — дальше только свежие
+                break
+            if bucket == self._bucket:
+                continue
+            shutil.rmtree(os.path.join(self.root, bucket), ignore_errors=True)
+            removed += 1
+        return removed
+
+
+# === ФОНОВЫЙ ПИСАТЕЛЬ ПАКЕТОВ ===
+
+FSYNC_POLICIES = ("none", "batch", "interval")
+OVERFLOW_POLICIES = ("block", "drop", "sync")
+
+
+class PacketWriter:
+    """
+    Асинхронный приёмник пакетов: submit() кладёт пакет в ограниченную очередь,
+    фоновый поток забирает их пачками и пишет в PacketLog одной групповой записью
+    (плюс, при echo_stdout, одной записью в stdout).
+
+    fsync_policy:
+      - "none"     — только flush в page cache;
+      - "batch"    — fsync после каждой пачки;
+      - "interval" — fsync не чаще раза в fsync_interval секунд.
+
+    overflow_policy (что делать, если очередь полна):
+      - "block" — ждать место в очереди (обратное давление на хендлер);
+      - "drop"  — выбросить пакет и посчитать его в stats["dropped"];
+      - "sync"  — записать пакет прямо в потоке вызывающего.
+
+    close() дожидается, пока очередь будет полностью записана.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        log: PacketLog,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        fsync_policy: str = "none",
+        fsync_interval: float = 1.0,
+        overflow_policy: str = "block",
+        echo_stdout: bool = True,
+    ) -> None:
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}")
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {OVERFLOW_POLICIES}")
+
+        self.log = log
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.overflow_policy = overflow_policy
+        self.echo_stdout = echo_stdout
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # проверка _closed и постановка в очередь — под одним замком с close():
+        # иначе пакет, поставленный сразу после _STOP, никто не запишет
+        self._submit_lock = threading.Lock()
+        self._last_fsync = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "submitted": 0,
+            "written": 0,
+            "dropped": 0,
+            "written_sync": 0,
+            "batches": 0,
+            "max_queue_depth": 0,
+        }
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += n
+
+    # --- сторона хендлеров ---
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="packet-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, packet: Dict[str, Any]) -> bool:
+        """
+        Ставит пакет в очередь. False — пакет выброшен (overflow_policy="drop").
+        """
+        with self._submit_lock:
+            if not self._closed and self._thread is not None:
+                return self._enqueue(packet)
+        # писатель ещё не запущен или уже остановлен — пишем сами
+        self._write_batch([packet])
+        self._count("written_sync")
+        return True
+
+    def _enqueue(self, packet: Dict[str, Any]) -> bool:
+        self._count("submitted")
+        try:
+            if self.overflow_policy == "block":
+                self._queue.put(packet)
+            else:
+                self._queue.put_nowait(packet)
+        except queue.Full:
+            if self.overflow_policy == "drop":
+                self._count("dropped")
+                return False
+            self._write_batch([packet])
+            self._count("written_sync")
+            return True
+
+        depth = self._queue.qsize()
+        if depth > self.stats["max_queue_depth"]:
+            with self._stats_lock:
+                self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], depth)
+        return True
+
+    def try_submit(self, packet: Dict[str, Any]) -> bool:
+        """
+        Неблокирующая постановка в очередь: False — очередь полна (или писатель
+        не запущен), решать, что делать, вызывающему. Нужна asyncio-рантайму,
+        где блокировать поток цикла событий нельзя.
+        """
+        with self._submit_lock:
+            if self._closed or self._thread is None:
+                return False
+            try:
+                self._queue.put_nowait(packet)
+            except queue.Full:
+                return False
+        self._count("submitted")
+        return True
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    # --- фоновый поток ---
+
+    def _write_batch(self, packets: List[Dict[str, Any]]) -> None:
+        lines = [self.log.encode(p) for p in packets]
+        self.log.append_many(lines)
+
+        if self.fsync_policy == "batch":
+            self.log.sync()
+        elif self.fsync_policy == "interval":
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                self.log.sync()
+                self._last_fsync = now
+
+        if self.echo_stdout:
+            try:
+                out = "".join(
+                    json.dumps({"log_type": "packet", **p}, ensure_ascii=False) + "\n"
+                    for p in packets
+                )
+                sys.stdout.write(out)
+                sys.stdout.flush()
+            except Exception:
+                pass
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self._write_batch(batch)
+                self._count("written", len(batch))
+                self._count("batches")
+            except Exception:
+                # писатель не должен умирать из-за одной пачки
+                self._count("dropped", len(batch))
+
+    def close(self) -> None:
+        """
+        Останавливает поток, предварительно записав всё, что уже в очереди.
+        """
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is not None:
+            # блокирующий put: стоп-маркер встаёт в конец очереди, после всех пакетов;
+            # новых пакетов после _closed в очереди уже не будет
+            self._queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+        if self.fsync_policy != "none":
+            self.log.sync()
+        else:
+            self.log.flush()
+
+
+# === ЧТЕНИЕ ЛОГА (API ДЛЯ docker_worker) ===
+
+class PacketLogReader:
+    """
+    Читатель лога по смещению. Отдаёт только целиком дописанные строки,
+    поэтому его можно запускать параллельно с писателем.
+
+        reader = PacketLogReader("data/packets")
+        pos = LogPosition()
+        while True:
+            packets, pos = reader.read(pos)
+            ...  # сохранить pos, чтобы продолжить после рестарта
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def segments(self) -> List[str]:
+        return list_segments(self.root)
+
+    def read(self, position: LogPosition = LogPosition(), limit: int = 1000) -> Tuple[List[Dict[str, Any]], LogPosition]:
+        """
+        Читает до limit пакетов начиная с position.
+        Возвращает пакеты и позицию для следующего вызова.
+        """
+        by_writer: Dict[str, List[str]] = {}
+        for segment in self.segments():
+            by_writer.setdefault(segment_writer(segment), []).append(segment)
+        # писатели, чьи сегменты целиком удалил ретеншн, из позиции выпадают
+        positions = {w: (seg, off) for w, seg, off in position.writers if w in by_writer}
+
+        packets: List[Dict[str, Any]] = []
+        for writer in sorted(by_writer):
+            if len(packets) >= limit:
+                break
+            segments = by_writer[writer]
+            segment, offset = positions.get(writer, ("", 0))
+            if segment not in segments:
+                # сегмент ещё не задан или уже удалён ретеншном — берём следующий по времени
+                later = [s for s in segments if s > segment]
+                if not later:
+                    continue
+                segment, offset = later[0], 0
+            positions[writer] = self._read_writer(segments, segment, offset, packets, limit)
+
+        return packets, LogPosition(tuple((w, seg, off) for w, (seg, off) in sorted(positions.items())))
+
+    def _read_writer(
+        self,
+        segments: List[str],
+        segment: str,
+        offset: int,
+        packets: List[Dict[str, Any]],
+        limit: int,
+    ) -> Tuple[str, int]:
+        """
+        Дочитывает сегменты одного писателя в packets, пока их не станет limit.
+        """
+        idx = segments.index(segment)
+        while len(packets) < limit:
+            path = os.path.join(self.root, segment)
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    for raw in f:
+                        if not raw.endswith(b"\n"):
+                            # строка ещё дописывается
+                            break
+                        offset += len(raw)
+                        try:
+                            packets.append(json.loads(raw))
+                        except ValueError:
+                            continue
+                        if len(packets) >= limit:
+                            break
+            except FileNotFoundError:
+                pass
+
+            if len(packets) >= limit or idx + 1 >= len(segments):
+                break
+            # у этого писателя есть следующий сегмент — значит, этот закрыт
+            idx += 1
+            segment, offset = segments[idx], 0
+        return segment, offset
+
+    def tail(self, position: LogPosition = LogPosition(), poll_interval: float = 1.0, limit: int = 1000):
+        """
+        Бесконечный генератор пачек (пакеты, позиция после них) — для фоновых воркеров.
+        Позицию стоит сохранять после обработки пачки.
+        """
+        while True:
+            packets, next_position = self.read(position, limit=limit)
+            if not packets:
+                time.sleep(poll_interval)
+                continue
+            yield packets, next_position
+            position = next_position
@@ -0,0 +1,38 @@
+import threading
+from typing import Callable, Optional
+
+
+class PeriodicTask:
+    """
+    Фоновый таймер: раз в interval секунд вызывает fn() в отдельном потоке.
+    Используется для обслуживания (ретеншн логов, сброс кэшей на диск),
+    чтобы оно не попадало на путь обработки запросов.
+    """
+
+    def __init__(self, fn: Callable[[], object], interval: float, name: str = "periodic-task") -> None:
+        self.fn = fn
+        self.interval = interval
+        self.name = name
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.fn()
+            except Exception:
+                pass
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
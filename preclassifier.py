@@ -0,0 +1,413 @@
+"""
+Локальный префильтр перед LLM-модерацией (classify_business / classify_question).
+
+Очевидные случаи решаются в процессе: правила (ключевые слова) + маленький
+наивный байесовский классификатор, обученный на уже записанных пакетах.
+Всё, в чём нет уверенности, возвращается как None и уходит в LLM.
+
+    python preclassifier.py train --data-dir data --model data/models/preclassifier.json
+    python preclassifier.py eval  --data-dir data --model data/models/preclassifier.json
+
+eval меряет модель так, как она работает в боте: с порогом, сохранённым при
+обучении, и только на текстах, впервые записанных после обучения.
+"""
+import os
+import re
+import sys
+import json
+import math
+import random
+import argparse
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from cache import normalize_key
+from packet_log import LogPosition, PacketLogReader
+from similarity import stem_ru
+
+LABELS = ("OK", "NOT_BUSINESS", "ILLEGAL")
+DEFAULT_THRESHOLD = 0.97
+
+# === ПРАВИЛА ===
+
+# Заведомо незаконное. Каждый шаблон начинается с границы слова и ловит словоформы
+# по основе; общие слова («отмывка», «закладка», «взлом») — только в незаконном
+# сочетании, иначе «химчистка и отмывка ковров» попадала в ILLEGAL.
+_ILLEGAL_RE = re.compile(
+    r"\b(наркот|героин|кокаин|мефедрон|амфетамин|спайс|гашиш|марихуан|закладчик|"
+    r"закладк\w* (наркот|веществ|сол|меф)|"
+    r"оружи[еяюй]|пистолет|автомат\w* калашников|боеприпас|взрывчат|"
+    r"взлом(а|ать|аю|ом|у|ы|щик\w*)?\b|ддос|ddos|фишинг|кардинг|краден|"
+    r"обнал|отмыв\w* (денег|деньги|средств|доход|капитал)|фальшив|подделк|подделыв|поддела|"
+    r"мошенн|обман\w* (клиент|покупател|людей|пенсионер|банк|государств|налогов)|развод на деньги|"
+    r"уйти от налогов|не платить налог|уклон\w* от налог|скрыть доход|обойти закон|обход\w* закон|"
+    r"сер\w* зарплат|зарплат\w* в конверт|однодневк|"
+    r"проституц|эскорт|интим услуг|контрабанд|торговл\w* людьми|киллер|"
+    r"подкуп|взятк|откат\w* чиновник)"
+)
+
+# Защитный контекст: «как защитить магазин от мошенников», «распознать фальшивые
+# купюры». Здесь ILLEGAL правилом не ставим — такие тексты решает модель или LLM.
+_PROTECTIVE_RE = re.compile(
+    r"\b(защит|защищ|обезопас|уберечь|безопасн|распозна|отлич|провер|выявл|"
+    r"предотвра|противодейств|борьб|борот|пострада|жертв|заявлени|полици|"
+    r"от (мошенн|обман|взлом|фишинг|подделк|фальшив|краж|воров|кардинг))"
+)
+
+
+def features(text: str) -> List[str]:
+    """
+    Основы слов + биграммы основ. Стоп-слова не выкидываем:
+    «не» и «без» для фильтра важны.
+    """
+    tokens = [stem_ru(t) for t in normalize_key(text).split()]
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+
+# === МОДЕЛЬ ===
+
+class NaiveBayes:
+    """
+    Мультиномиальный наивный Байес со сглаживанием Лапласа.
+    Линейная модель в лог-пространстве: учится за один проход, весит килобайты.
+    """
+
+    def __init__(self, alpha: float = 1.0) -> None:
+        self.alpha = alpha
+        self.class_counts: Counter = Counter()
+        self.token_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.token_totals: Counter = Counter()
+        self.vocab: set = set()
+
+    def fit(self, samples: List[Tuple[str, str]]) -> "NaiveBayes":
+        for text, label in samples:
+            feats = features(text)
+            self.class_counts[label] += 1
+            self.token_counts[label].update(feats)
+            self.token_totals[label] += len(feats)
+            self.vocab.update(feats)
+        return self
+
+    @property
+    def trained(self) -> bool:
+        # модель с одним классом «уверена» во всём подряд — такой не пользуемся
+        return len([c for c in self.class_counts.values() if c > 0]) >= 2
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        total_docs = sum(self.class_counts.values())
+        feats = [f for f in features(text) if f in self.vocab]
+        vocab_size = len(self.vocab) or 1
+
+        scores: Dict[str, float] = {}
+        for label, n_docs in self.class_counts.items():
+            score = math.log(n_docs / total_docs)
+            denom = self.token_totals[label] + self.alpha * vocab_size
+            counts = self.token_counts[label]
+            for f in feats:
+                score += math.log((counts.get(f, 0) + self.alpha) / denom)
+            scores[label] = score
+
+        top = max(scores.values())
+        exp = {label: math.exp(s - top) for label, s in scores.items()}
+        norm = sum(exp.values())
+        return {label: v / norm for label, v in exp.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "alpha": self.alpha,
+            "class_counts": dict(self.class_counts),
+            "token_counts": {label: dict(c) for label, c in self.token_counts.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "NaiveBayes":
+        model = cls(alpha=data.get("alpha", 1.0))
+        model.class_counts = Counter(data.get("class_counts", {}))
+        for label, counts in data.get("token_counts", {}).items():
+            model.token_counts[label] = Counter(counts)
+            model.token_totals[label] = sum(counts.values())
+            model.vocab.update(counts)
+        return model
+
+
+# === ПРЕФИЛЬТР ===
+
+class PreClassifier:
+    """
+    classify_business / classify_question возвращают "OK" | "NOT_BUSINESS" | "ILLEGAL",
+    если решение очевидно, и None — если нужно спросить LLM.
+
+    Порядок: правило ILLEGAL (кроме защитного контекста) -> модель (если
+    уверенность >= threshold и во входе есть знакомые модели слова).
+    Одних ключевых слов бизнеса для OK мало: «зарплата сотрудникам без
+    оформления» — тоже про бизнес, такие тексты решает LLM.
+    """
+
+    def __init__(
+        self,
+        business_model: Optional[NaiveBayes] = None,
+        question_model: Optional[NaiveBayes] = None,
+        threshold: float = DEFAULT_THRESHOLD,
+        trained_until: int = 0,
+    ) -> None:
+        self.business_model = business_model
+        self.question_model = question_model
+        self.threshold = threshold
+        # timestamp самого свежего пакета в обучающих данных
+        self.trained_until = trained_until
+
+        self._lock = threading.Lock()
+        self.stats_counts: Counter = Counter()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats_counts[key] += 1
+
+    def _decide(self, text: str, model: Optional[NaiveBayes], kind: str) -> Optional[str]:
+        norm = normalize_key(text)
+        if not norm:
+            return None
+
+        if _ILLEGAL_RE.search(norm):
+            if not _PROTECTIVE_RE.search(norm):
+                self._count(f"{kind}_rule_illegal")
+                return "ILLEGAL"
+            self._count(f"protective_{kind}")
+
+        if model is not None and model.trained:
+            known = sum(1 for f in features(text) if f in model.vocab)
+            if known:
+                proba = model.predict_proba(text)
+                model_top = max(proba, key=proba.get)
+                if proba[model_top] >= self.threshold:
+                    self._count(f"{kind}_model_{model_top.lower()}")
+                    return model_top
+
+        self._count(f"{kind}_escalated")
+        return None
+
+    def classify_business(self, business: str) -> Optional[str]:
+        return self._decide(business, self.business_model, "business")
+
+    def classify_question(self, question: str, business: Optional[str] = None) -> Optional[str]:
+        # контекст бизнеса для правил не нужен: незаконность видна по самому вопросу
+        return self._decide(question, self.question_model, "question")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.stats_counts)
+        result: Dict[str, Any] = dict(counts)
+        for kind in ("business", "question"):
+            total = sum(v for k, v in counts.items() if k.startswith(kind + "_"))
+            escalated = counts.get(f"{kind}_escalated", 0)
+            result[f"{kind}_llm_avoided_rate"] = round((total - escalated) / total, 4) if total else 0.0
+        return result
+
+    # --- диск ---
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            "threshold": self.threshold,
+            "trained_until": self.trained_until,
+            "business": self.business_model.to_dict() if self.business_model else None,
+            "question": self.question_model.to_dict() if self.question_model else None,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "PreClassifier":
+        """
+        Модель с диска; если файла нет — префильтр только на правилах.
+        threshold=None — порог, сохранённый с моделью.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        business = NaiveBayes.from_dict(data["business"]) if data.get("business") else None
+        question = NaiveBayes.from_dict(data["question"]) if data.get("question") else None
+        return cls(
+            business,
+            question,
+            threshold=threshold if threshold is not None else data.get("threshold", DEFAULT_THRESHOLD),
+            trained_until=data.get("trained_until", 0),
+        )
+
+
+# === ОБУЧАЮЩИЕ ДАННЫЕ ИЗ ПАКЕТОВ ===
+
+def iter_packets(data_dir: str) -> Iterator[Dict[str, Any]]:
+    """
+    Все пакеты: сегменты data/packets/ и старые одиночные data/*.json.
+    """
+    reader = PacketLogReader(os.path.join(data_dir, "packets"))
+    position = LogPosition()
+    while True:
+        packets, position = reader.read(position, limit=10000)
+        if not packets:
+            break
+        yield from packets
+
+    try:
+        names = sorted(os.listdir(data_dir))
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(data_dir, name), "r", encoding="utf-8") as f:
+                yield json.load(f)
+        except (OSError, ValueError):
+            continue
+
+
+def build_datasets(
+    data_dir: str,
+    newer_than: int = 0,
+) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]], int]:
+    """
+    (описания бизнеса, вопросы, timestamp самого свежего пакета) с метками:
+      business_profile  -> OK,  rejected_business -> reason;
+      user_question     -> OK,  rejected_question -> reason.
+    Дубликаты схлопываются: важно разнообразие, а не популярность.
+    newer_than — только тексты, впервые записанные позже этого timestamp
+    (модель, обученная до него, их не видела).
+    """
+    business: Dict[str, str] = {}
+    questions: Dict[str, str] = {}
+    first_seen: Dict[Tuple[str, str], int] = {}
+    latest = 0
+    for p in iter_packets(data_dir):
+        kind = p.get("type")
+        ts = int(p.get("timestamp") or 0)
+        if kind == "business_profile" and p.get("business"):
+            samples, text, label = business, p["business"], "OK"
+        elif kind == "rejected_business" and p.get("business_raw") and p.get("reason") in LABELS:
+            samples, text, label = business, p["business_raw"], p["reason"]
+        elif kind == "user_question" and p.get("question"):
+            samples, text, label = questions, p["question"], "OK"
+        elif kind == "rejected_question" and p.get("question") and p.get("reason") in LABELS:
+            samples, text, label = questions, p["question"], p["reason"]
+        else:
+            continue
+        samples[text] = label
+        key = ("business" if samples is business else "question", text)
+        first_seen[key] = min(first_seen.get(key, ts), ts)
+        latest = max(latest, ts)
+
+    def fresh(kind: str, samples: Dict[str, str]) -> List[Tuple[str, str]]:
+        return [(text, label) for text, label in samples.items() if first_seen[(kind, text)] > newer_than]
+
+    return fresh("business", business), fresh("question", questions), latest
+
+
+# === ОЦЕНКА ===
+
+def evaluate(decide, samples: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    precision / recall по меткам и доля решений без LLM.
+    Эскалированный пример считается «не найденным» для recall, но не ошибкой precision.
+    """
+    decided = 0
+    correct = 0
+    tp: Counter = Counter()
+    predicted: Counter = Counter()
+    actual: Counter = Counter()
+    for text, label in samples:
+        actual[label] += 1
+        verdict = decide(text)
+        if verdict is None:
+            continue
+        decided += 1
+        predicted[verdict] += 1
+        if verdict == label:
+            correct += 1
+            tp[label] += 1
+
+    per_label = {
+        label: {
+            "precision": round(tp[label] / predicted[label], 4) if predicted[label] else None,
+            "recall": round(tp[label] / actual[label], 4) if actual[label] else None,
+            "support": actual[label],
+        }
+        for label in LABELS
+    }
+    n = len(samples)
+    return {
+        "samples": n,
+        "llm_calls_avoided": round(decided / n, 4) if n else 0.0,
+        "local_accuracy": round(correct / decided, 4) if decided else None,
+        "labels": per_label,
+    }
+
+
+def _split(samples: List[Tuple[str, str]], holdout: float, seed: int) -> Tuple[List, List]:
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    cut = int(len(samples) * (1 - holdout))
+    return samples[:cut], samples[cut:]
+
+
+def _print_report(title: str, report: Dict[str, Any]) -> None:
+    print(f"== {title} ==")
+    print(f"samples={report['samples']} llm_calls_avoided={report['llm_calls_avoided']} "
+          f"local_accuracy={report['local_accuracy']}")
+    for label, m in report["labels"].items():
+        print(f"  {label:<13} precision={m['precision']} recall={m['recall']} support={m['support']}")
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ("train", "eval"):
+        p = sub.add_parser(name)
+        p.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data"))
+        p.add_argument("--model", default=os.path.join(os.getenv("DATA_DIR", "data"), "models", "preclassifier.json"))
+        # по умолчанию: train — DEFAULT_THRESHOLD, eval — порог, сохранённый с моделью
+        p.add_argument("--threshold", type=float, default=None)
+    sub.choices["train"].add_argument("--holdout", type=float, default=0.2)
+    sub.choices["train"].add_argument("--seed", type=int, default=13)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "train":
+        business, questions, latest = build_datasets(args.data_dir)
+        threshold = args.threshold if args.threshold is not None else DEFAULT_THRESHOLD
+        b_train, b_test = _split(business, args.holdout, args.seed)
+        q_train, q_test = _split(questions, args.holdout, args.seed)
+        pre = PreClassifier(
+            NaiveBayes().fit(b_train) if b_train else None,
+            NaiveBayes().fit(q_train) if q_train else None,
+            threshold=threshold,
+        )
+        _print_report("business (holdout)", evaluate(pre.classify_business, b_test))
+        _print_report("question (holdout)", evaluate(pre.classify_question, q_test))
+
+        # итоговая модель учится на всех данных
+        pre = PreClassifier(
+            NaiveBayes().fit(business) if business else None,
+            NaiveBayes().fit(questions) if questions else None,
+            threshold=threshold,
+            trained_until=latest,
+        )
+        pre.save(args.model)
+        print(f"saved {args.model}: {len(business)} business / {len(questions)} question samples")
+    else:
+        pre = PreClassifier.load(args.model, threshold=args.threshold)
+        # на текстах из обучения модель заведомо права — берём только новые
+        business, questions, _latest = build_datasets(args.data_dir, newer_than=pre.trained_until)
+        print(f"threshold={pre.threshold}, texts first seen after timestamp {pre.trained_until}")
+        _print_report("business (new)", evaluate(pre.classify_business, business))
+        _print_report("question (new)", evaluate(pre.classify_question, questions))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
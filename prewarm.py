@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache import normalize_key
+from llm_gateway import LlmUnavailable
+from packet_log import LogPosition, PacketLogReader
+from periodic import PeriodicTask
+from ratelimit import TokenBucket
+
+# === ПРОГРЕВ FAQ ДЛЯ ПОПУЛЯРНЫХ БИЗНЕСОВ ===
+#
+# Первый пользователь с новым бизнесом ждёт полный generate_faqs. Самые частые
+# бизнесы известны заранее — по business_profile пакетам, которые пишет
+# present_faqs_for_business. FaqPrewarmer в фоне:
+# - дочитывает лог пакетов с прошлой позиции и считает бизнесы по
+#   нормализованному описанию (счётчики затухают с периодом полураспада half_life);
+# - для top_n самых частых (не реже min_count) генерирует FAQ, если их нет в кэше
+#   или прогретый набор старше refresh_after, — не чаще per_minute генераций в минуту;
+# - складывает прогретые наборы в отдельный файл path и при старте ставит их
+#   в кэш FAQ: популярные бизнесы отдаются сразу и после деплоя.
+# Генерирует один процесс; остальные (follower) только перечитывают файл.
+
+Faqs = List[Dict[str, str]]
+
+
+class FaqPrewarmer:
+    """
+    generate(business) -> faqs — вызов LLM; install(business, faqs) -> bool —
+    положить набор в кэш FAQ (False — набор не годится, например запасной);
+    cached(key) -> faqs | None — что сейчас лежит в кэше по нормализованному ключу.
+    """
+
+    def __init__(
+        self,
+        packets_dir: str,
+        path: Optional[str],
+        generate: Callable[[str], Faqs],
+        install: Callable[[str, Faqs], bool],
+        cached: Callable[[str], Optional[Faqs]],
+        top_n: int = 200,
+        min_count: float = 3.0,
+        refresh_after: float = 86400.0,
+        per_minute: float = 20.0,
+        half_life: float = 3 * 86400.0,
+        interval: float = 3600.0,
+        max_tracked: int = 50000,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.reader = PacketLogReader(packets_dir)
+        self.path = path
+        self.generate = generate
+        self.install = install
+        self.cached = cached
+        self.top_n = top_n
+        self.min_count = min_count
+        self.refresh_after = refresh_after
+        self.per_minute = per_minute
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self.clock = clock
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._task: Optional[PeriodicTask] = None
+        self._position = LogPosition()
+        self._decayed_at = clock()
+        # ключ -> [счёт, последнее увиденное описание]
+        self._counts: Dict[str, List[Any]] = {}
+        # ключ -> {"business", "faqs", "generated_at"}
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self._loaded_mtime = 0.0
+        self.counters: Dict[str, int] = {
+            "rounds": 0,
+            "packets_read": 0,
+            "generated": 0,
+            "refreshed": 0,
+            "adopted": 0,
+            "rejected": 0,
+            "failed": 0,
+            "aborted": 0,
+            "loaded": 0,
+        }
+        self.last_round_sec = 0.0
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[key] += n
+
+    # --- популярность ---
+
+    def _decay(self, now: float) -> None:
+        if self.half_life <= 0:
+            return
+        factor = 0.5 ** ((now - self._decayed_at) / self.half_life)
+        self._decayed_at = now
+        for key in [k for k, entry in self._counts.items() if entry[0] * factor < 0.05]:
+            del self._counts[key]
+        for entry in self._counts.values():
+            entry[0] *= factor
+
+    def observe(self, business: str) -> None:
+        key = normalize_key(business)
+        if not key:
+            return
+        entry = self._counts.get(key)
+        if entry is None:
+            self._counts[key] = [1.0, business]
+        else:
+            entry[0] += 1.0
+            entry[1] = business
+
+    def scan(self) -> int:
+        """
+        Дочитывает business_profile пакеты с прошлой позиции. Возвращает число прочитанных пакетов.
+        """
+        self._decay(self.clock())
+        read = 0
+        packets, position = self.reader.read(self._position)
+        while packets:
+            read += len(packets)
+            for packet in packets:
+                if packet.get("type") == "business_profile" and packet.get("business"):
+                    self.observe(str(packet["business"]))
+            self._position = position
+            packets, position = self.reader.read(position)
+        if len(self._counts) > self.max_tracked:
+            keep = sorted(self._counts.items(), key=lambda kv: kv[1][0], reverse=True)[: self.max_tracked]
+            self._counts = dict(keep)
+        self._count("packets_read", read)
+        return read
+
+    def popular(self) -> List[Tuple[str, str, float]]:
+        """
+        [(ключ, описание, счёт)] — top_n самых частых бизнесов со счётом не ниже min_count.
+        """
+        ranked = sorted(self._counts.items(), key=lambda kv: kv[1][0], reverse=True)
+        return [(key, entry[1], entry[0]) for key, entry in ranked[: self.top_n] if entry[0] >= self.min_count]
+
+    # --- генерация ---
+
+    def _due(self, key: str, now: float) -> Optional[str]:
+        """
+        Что делать с популярным бизнесом: "generate", "refresh", "adopt" или None.
+        """
+        item = self.items.get(key)
+        if self.cached(key) is None:
+            return "generate" if item is None else "refresh"
+        if item is None:
+            # набор уже в кэше (его сгенерировал пользователь) — берём в прогретые как свежий
+            return "adopt"
+        if now - item["generated_at"] >= self.refresh_after:
+            return "refresh"
+        return None
+
+    def run_once(self) -> int:
+        """
+        Один проход: scan + генерация недостающих и устаревших наборов. Возвращает число генераций.
+        """
+        started = time.monotonic()
+        self.scan()
+        bucket = TokenBucket(rate=max(self.per_minute, 1e-6) / 60.0, burst=1.0, now=time.monotonic())
+        done = 0
+        changed = False
+        for key, business, _score in self.popular():
+            if self._stop.is_set():
+                break
+            action = self._due(key, self.clock())
+            if action is None:
+                continue
+            if action == "adopt":
+                self.items[key] = {"business": business, "faqs": self.cached(key), "generated_at": self.clock()}
+                self._count("adopted")
+                changed = True
+                continue
+            if self._stop.wait(bucket.reserve(time.monotonic())):
+                break
+            try:
+                faqs = self.generate(business)
+            except LlmUnavailable:
+                # LLM лежит — не добиваем её прогревом, следующий проход по расписанию
+                self._count("aborted")
+                break
+            except Exception:
+                self._count("failed")
+                continue
+            if not self.install(business, faqs):
+                self._count("rejected")
+                continue
+            self.items[key] = {"business": business, "faqs": faqs, "generated_at": self.clock()}
+            self._count("generated" if action == "generate" else "refreshed")
+            done += 1
+            changed = True
+
+        popular_keys = {key for key, _business, _score in self.popular()}
+        for key in [k for k in self.items if k not in popular_keys]:
+            del self.items[key]
+            changed = True
+        if changed:
+            self.save()
+        with self._lock:
+            self.counters["rounds"] += 1
+            self.last_round_sec = time.monotonic() - started
+        return done
+
+    # --- диск ---
+
+    def save(self) -> bool:
+        if not self.path:
+            return False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        items = [[key, item["business"], item["generated_at"], item["faqs"]] for key, item in self.items.items()]
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"items": items}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return True
+
+    def load(self) -> int:
+        """
+        Читает прогретые наборы из path (если файл изменился) и ставит в кэш те,
+        которых там нет. Возвращает число поставленных наборов.
+        """
+        if not self.path:
+            return 0
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._loaded_mtime:
+                return 0
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        self._loaded_mtime = mtime
+
+        items: Dict[str, Dict[str, Any]] = {}
+        installed = 0
+        for item in data.get("items", []):
+            try:
+                key, business, generated_at, faqs = item
+            except (TypeError, ValueError):
+                continue
+            items[key] = {"business": business, "faqs": faqs, "generated_at": generated_at}
+            current = self.cached(key)
+            if current != faqs and self.install(business, faqs):
+                installed += 1
+        self.items = items
+        self._count("loaded", installed)
+        return installed
+
+    # --- фон ---
+
+    def _tick(self, generate: bool) -> None:
+        if generate:
+            self.run_once()
+        else:
+            self.load()
+
+    def start(self, generate: bool = True) -> None:
+        """
+        generate=False — процесс-последователь: только перечитывает файл прогретых наборов.
+        """
+        if self._task is not None:
+            return
+        self._stop.clear()
+        interval = self.interval if generate else min(self.interval, 60.0)
+        self._task = PeriodicTask(lambda: self._tick(generate), interval=interval, name="faq-prewarm")
+        self._task.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.stop()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            stats["last_round_sec"] = round(self.last_round_sec, 3)
+        stats["tracked"] = len(self._counts)
+        stats["warm"] = len(self.items)
+        return stats
@@ -0,0 +1,210 @@
+import re
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+# === БЮДЖЕТ ТОКЕНОВ ДЛЯ ПРОМПТА ===
+#
+# Ответ модели — до 1024 токенов, и три таких ответа целиком в каждом
+# следующем промпте раздували его до нескольких тысяч токенов. Теперь:
+# - свежие пары (вопрос, ответ) идут дословно, но ответ обрезается до turn_max_tokens;
+# - пара, вытесненная из кольца истории, сворачивается в одну строку
+#   «скользящего конспекта» (fold_into_summary) — строка дописывается,
+#   конспект не пересобирается; сверх summary_max_tokens выпадают самые старые строки;
+# - PromptBuilder собирает промпт в пределах budget токенов.
+#
+# Токены считаются оценкой (count_tokens), без токенизатора модели:
+# слово кириллицей ~ 1 токен на 3 символа, латиницей ~ на 4, знак препинания — 1.
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+_MARKDOWN_RE = re.compile(r"[#*_`>|]+")
+
+# служебные токены на каждое сообщение чата (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    total = 0
+    for piece in _TOKEN_RE.findall(text or ""):
+        if piece.isascii():
+            total += (len(piece) + 3) // 4
+        else:
+            total += (len(piece) + 2) // 3
+    return total
+
+
+def message_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def clip_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Начало text не длиннее max_tokens: по целым предложениям, если влезает
+    хоть одно, иначе по словам. Обрезанный текст заканчивается «…».
+    """
+    text = (text or "").strip()
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, max_tokens - 1)
+    kept: List[str] = []
+    used = 0
+    for sentence in _SENTENCE_RE.split(text):
+        cost = count_tokens(sentence)
+        if used + cost > limit:
+            break
+        kept.append(sentence)
+        used += cost
+    if not kept:
+        for word in text.split():
+            cost = count_tokens(word)
+            if used + cost > limit:
+                break
+            kept.append(word)
+            used += cost
+    return " ".join(kept).rstrip(" ,;:.") + "…"
+
+
+def gist(answer: str, max_tokens: int) -> str:
+    """
+    Суть ответа для конспекта: без разметки, первые предложения в пределах max_tokens.
+    """
+    plain = _MARKDOWN_RE.sub("", answer or "")
+    plain = " ".join(plain.split())
+    return clip_to_tokens(plain, max_tokens)
+
+
+def fold_into_summary(summary: str, question: str, answer: str, max_tokens: int, line_tokens: int = 60) -> str:
+    """
+    Дописывает в конспект строку про одну пару (вопрос, ответ).
+    Если конспект стал длиннее max_tokens — отбрасывает самые старые строки.
+    """
+    if max_tokens <= 0:
+        return ""
+    line = f"— {clip_to_tokens(question, line_tokens // 3)} → {gist(answer, line_tokens)}"
+    lines = (summary.split("\n") if summary else []) + [line]
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _percentile(values: List[int], p: float) -> int:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+class PromptBuilder:
+    """
+    build(head, turns, summary, tail) -> messages
+
+    head (системный промпт, описание бизнеса) и tail (новый вопрос) входят всегда.
+    Из остального бюджета: сначала самые свежие пары из turns (ответ обрезан до
+    turn_max_tokens, если пара целиком не влезает — её краткая версия),
+    затем конспект summary (с конца, сколько влезет), затем более старые пары.
+    Не поместившееся отбрасывается. Размеры собранных промптов — в stats().
+    """
+
+    def __init__(self, budget: int, turn_max_tokens: int = 350, gist_tokens: int = 60, samples: int = 1000) -> None:
+        self.budget = budget
+        self.turn_max_tokens = turn_max_tokens
+        self.gist_tokens = gist_tokens
+        self._lock = threading.Lock()
+        self._samples: Deque[int] = deque(maxlen=samples)
+        self.counters: Dict[str, int] = {
+            "built": 0,
+            "over_budget": 0,
+            "turns_verbatim": 0,
+            "turns_gist": 0,
+            "turns_dropped": 0,
+            "summary_used": 0,
+            "summary_clipped": 0,
+        }
+
+    @staticmethod
+    def turn_messages(question: str, answer: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "user", "content": f"Раньше владелец спрашивал: {question}"},
+            {"role": "assistant", "content": f"Ты отвечал так: {answer}"},
+        ]
+
+    @staticmethod
+    def summary_message(summary: str) -> Dict[str, str]:
+        return {"role": "user", "content": f"Кратко о прошлых вопросах владельца:\n{summary}"}
+
+    def _fit_summary(self, summary: str, room: int) -> Tuple[Optional[Dict[str, str]], bool]:
+        lines = summary.split("\n")
+        clipped = False
+        while lines:
+            message = self.summary_message("\n".join(lines))
+            if message_tokens([message]) <= room:
+                return message, clipped
+            lines.pop(0)
+            clipped = True
+        return None, clipped
+
+    def build(
+        self,
+        head: List[Dict[str, str]],
+        turns: Sequence[Tuple[str, str]],
+        summary: str,
+        tail: List[Dict[str, str]],
+    ) -> List[Dict[str, str]]:
+        room = self.budget - message_tokens(head) - message_tokens(tail)
+        counts = {"turns_verbatim": 0, "turns_gist": 0, "turns_dropped": 0, "summary_used": 0, "summary_clipped": 0}
+
+        # свежие пары — от последней к первой
+        picked: List[List[Dict[str, str]]] = []
+        summary_msg: Optional[Dict[str, str]] = None
+        summary_placed = not summary
+        for i, (question, answer) in enumerate(reversed(list(turns))):
+            if i == 1 and not summary_placed:
+                summary_msg, clipped = self._fit_summary(summary, room)
+                summary_placed = True
+                counts["summary_clipped"] += clipped
+                if summary_msg is not None:
+                    room -= message_tokens([summary_msg])
+            pair = self.turn_messages(question, clip_to_tokens(answer, self.turn_max_tokens))
+            cost = message_tokens(pair)
+            kind = "turns_verbatim"
+            if cost > room:
+                pair = self.turn_messages(clip_to_tokens(question, self.gist_tokens), gist(answer, self.gist_tokens))
+                cost = message_tokens(pair)
+                kind = "turns_gist"
+            if cost > room:
+                counts["turns_dropped"] += len(turns) - i
+                break
+            picked.append(pair)
+            room -= cost
+            counts[kind] += 1
+        if not summary_placed:
+            summary_msg, clipped = self._fit_summary(summary, room)
+            counts["summary_clipped"] += clipped
+
+        messages = list(head)
+        if summary_msg is not None:
+            messages.append(summary_msg)
+            counts["summary_used"] = 1
+        for pair in reversed(picked):
+            messages.extend(pair)
+        messages.extend(tail)
+
+        total = message_tokens(messages)
+        with self._lock:
+            self._samples.append(total)
+            self.counters["built"] += 1
+            self.counters["over_budget"] += total > self.budget
+            for key, value in counts.items():
+                self.counters[key] += value
+        return messages
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            samples = list(self._samples)
+        stats["budget"] = self.budget
+        stats["prompt_tokens_p50"] = _percentile(samples, 50)
+        stats["prompt_tokens_p99"] = _percentile(samples, 99)
+        stats["prompt_tokens_max"] = max(samples) if samples else 0
+        return stats
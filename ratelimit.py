@@ -0,0 +1,225 @@
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Collection, Dict, Hashable, Optional
+
+# === ОГРАНИЧЕНИЕ ИСХОДЯЩИХ ЗАПРОСОВ К TELEGRAM ===
+#
+# Telegram пускает примерно 30 запросов в секунду на бота и около одного
+# нового сообщения в секунду в один чат; сверх этого отвечает 429 с
+# parameters.retry_after. Правки, удаления и ответы на кнопки в лимит чата
+# не входят — экран из пяти таких вызовов не должен ждать секунду.
+# Лимитер не блокирует сам: reserve() резервирует слот и говорит, сколько
+# подождать, — sync-код спит time.sleep, async-код — asyncio.sleep.
+
+
+class TokenBucket:
+    """
+    Ведро токенов с «долгом»: reserve() всегда забирает токен и возвращает
+    задержку до момента, когда этот токен на самом деле появится.
+    Так ожидающие обслуживаются по порядку резервирования.
+    """
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+def retry_after_of(exc: BaseException) -> Optional[float]:
+    """
+    Для ответа 429 от Telegram — сколько секунд просят подождать, иначе None.
+    Работает и с telebot.apihelper, и с telebot.asyncio_helper исключениями.
+    """
+    if getattr(exc, "error_code", None) != 429:
+        return None
+    result = getattr(exc, "result_json", None) or {}
+    try:
+        return float(result.get("parameters", {}).get("retry_after", 1))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+
+class OutboundLimiter:
+    """
+    Общий планировщик исходящих запросов: глобальное ведро global_rate/с
+    плюс ведро chat_rate/с на каждый личный чат — только для методов из
+    chat_methods (новые сообщения; None — для всех вызовов). После 429 чат
+    (или весь бот, если чат неизвестен) ставится на паузу на retry_after секунд
+    для любых вызовов.
+
+    call() — синхронная обёртка: ждёт слот, вызывает fn, на 429 ждёт
+    retry_after и повторяет до max_retries раз, потом пробрасывает исключение.
+    acall() — то же для корутин (AsyncTeleBot).
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        global_burst: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+        chat_methods: Optional[Collection[str]] = ("send_message", "send_photo"),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.chat_methods = chat_methods
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._chats: Dict[Hashable, TokenBucket] = {}
+        self._paused_until: Dict[Hashable, float] = {}
+        self._global_paused_until = 0.0
+
+        self.stats: Dict[str, float] = {
+            "calls": 0,
+            "delayed": 0,
+            "delay_ms_total": 0.0,
+            "rate_limited": 0,
+            "retries": 0,
+            "gave_up": 0,
+        }
+
+    def set_global_rate(self, rate: float) -> None:
+        """
+        Новый общий темп (например, когда бот делит лимит между процессами).
+        """
+        with self._lock:
+            self._global.rate = rate
+            self._global.burst = rate
+            self._global.tokens = min(self._global.tokens, rate)
+
+    def _sweep_locked(self, now: float) -> None:
+        # полные ведра ничего не помнят — их можно выбросить
+        for key in [k for k, b in self._chats.items() if b.idle(now)]:
+            del self._chats[key]
+        for key in [k for k, t in self._paused_until.items() if t <= now]:
+            del self._paused_until[key]
+
+    def paces_chat(self, chat_id: Optional[Hashable], fn: Callable[..., Any]) -> bool:
+        """
+        Идёт ли вызов fn в ведро чата: новое сообщение в личный чат.
+        В группах (отрицательный chat_id) бот не работает — там только 429.
+        """
+        if chat_id is None or (isinstance(chat_id, int) and chat_id < 0):
+            return False
+        return self.chat_methods is None or getattr(fn, "__name__", "") in self.chat_methods
+
+    def reserve(self, chat_id: Optional[Hashable] = None, paced: bool = True) -> float:
+        """
+        Резервирует слот на один запрос; возвращает, сколько секунд подождать перед ним.
+        paced=False — мимо ведра чата (но пауза чата после 429 всё равно действует).
+        """
+        now = self.clock()
+        with self._lock:
+            delay = self._global.reserve(now)
+            if chat_id is not None:
+                if paced:
+                    bucket = self._chats.get(chat_id)
+                    if bucket is None:
+                        if len(self._chats) >= self.max_chats:
+                            self._sweep_locked(now)
+                        bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+                    delay = max(delay, bucket.reserve(now))
+                delay = max(delay, self._paused_until.get(chat_id, 0.0) - now)
+            delay = max(delay, self._global_paused_until - now)
+
+            self.stats["calls"] += 1
+            if delay > 0:
+                self.stats["delayed"] += 1
+                self.stats["delay_ms_total"] += delay * 1000
+        return max(0.0, delay)
+
+    def penalize(self, chat_id: Optional[Hashable], retry_after: float) -> None:
+        """
+        Telegram ответил 429: не трогаем этот чат (или весь бот) retry_after секунд.
+        """
+        until = self.clock() + retry_after
+        with self._lock:
+            self.stats["rate_limited"] += 1
+            if chat_id is None:
+                self._global_paused_until = max(self._global_paused_until, until)
+            else:
+                self._paused_until[chat_id] = max(self._paused_until.get(chat_id, 0.0), until)
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def call(self, chat_id: Optional[Hashable], fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        paced = self.paces_chat(chat_id, fn)
+        attempt = 0
+        while True:
+            delay = self.reserve(chat_id, paced)
+            if delay:
+                time.sleep(delay)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                retry_after = retry_after_of(e)
+                if retry_after is None:
+                    raise
+                self.penalize(chat_id, retry_after)
+                if attempt >= self.max_retries:
+                    self.count("gave_up")
+                    raise
+                attempt += 1
+                self.count("retries")
+
+    async def acall(self, chat_id: Optional[Hashable], fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        paced = self.paces_chat(chat_id, fn)
+        attempt = 0
+        while True:
+            delay = self.reserve(chat_id, paced)
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                retry_after = retry_after_of(e)
+                if retry_after is None:
+                    raise
+                self.penalize(chat_id, retry_after)
+                if attempt >= self.max_retries:
+                    self.count("gave_up")
+                    raise
+                attempt += 1
+                self.count("retries")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["tracked_chats"] = len(self._chats)
+        stats["delay_ms_total"] = round(stats["delay_ms_total"], 1)
+        return stats
+
+
+def telegram_error_kind(exc: BaseException) -> str:
+    """
+    "rate_limited" — 429; "not_modified" — правка ничего не меняет (экран уже такой);
+    "cannot_edit" — сообщение нельзя/некого редактировать; "other" — всё остальное.
+    """
+    if retry_after_of(exc) is not None:
+        return "rate_limited"
+    description = str(getattr(exc, "description", "") or exc).lower()
+    if "message is not modified" in description:
+        return "not_modified"
+    if "can't be edited" in description or "message to edit not found" in description:
+        return "cannot_edit"
+    return "other"
@@ -0,0 +1,170 @@
+import sys
+import json
+import time
+import hashlib
+import threading
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from prompt_budget import fold_into_summary
+
+# === КОМПАКТНАЯ СЕССИЯ ===
+#
+# Session — объект со __slots__ вместо dict на чат. Снаружи ведёт себя как
+# прежний словарь (session["stage"], session.get("faqs"), session["x"] = ...),
+# так что хендлеры не меняются. Внутри:
+# - FAQ хранятся общим FaqSet на все чаты с одинаковым набором вопросов;
+# - история — кольцевой буфер из history_size пар (вопрос, ответ);
+#   вытесненная из него пара дописывается строкой в summary (скользящий конспект);
+# - строки бизнеса интернируются.
+
+
+class FaqSet:
+    """
+    Неизменяемый общий набор FAQ. Один объект на одинаковое содержимое,
+    живёт, пока на него ссылается хоть одна сессия.
+    """
+
+    __slots__ = ("key", "items", "__weakref__")
+
+    def __init__(self, key: str, items: List[Dict[str, str]]) -> None:
+        self.key = key
+        self.items = items
+
+
+_faq_sets: "weakref.WeakValueDictionary[str, FaqSet]" = weakref.WeakValueDictionary()
+_faq_sets_lock = threading.Lock()
+
+
+def intern_faqs(items: List[Dict[str, str]]) -> FaqSet:
+    key = hashlib.blake2b(
+        json.dumps(items, ensure_ascii=False, sort_keys=True).encode("utf-8"),
+        digest_size=12,
+    ).hexdigest()
+    with _faq_sets_lock:
+        faq_set = _faq_sets.get(key)
+        if faq_set is None:
+            faq_set = FaqSet(key, [{"q": sys.intern(i["q"]), "a": i["a"]} for i in items])
+            _faq_sets[key] = faq_set
+        return faq_set
+
+
+def faq_sets_count() -> int:
+    return len(_faq_sets)
+
+
+def _intern_text(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Session:
+    """
+    Состояние одного чата. Ключи те же, что у прежнего словаря (см. get_session),
+    плюс last_seen — когда чат последний раз обращался к сессии.
+    """
+
+    history_size = 3
+    summary_max_tokens = 300
+
+    __slots__ = (
+        "stage",
+        "business",
+        "saved_business",
+        "faq_set",
+        "faq_page",
+        "faq_page_size",
+        "history",
+        "summary",
+        "last_message_id",
+        "last_banner_id",
+        "last_text_hash",
+        "last_markup_hash",
+        "first_start_seen",
+        "last_seen",
+    )
+
+    KEYS = (
+        "stage",
+        "business",
+        "saved_business",
+        "faqs",
+        "faq_page",
+        "faq_page_size",
+        "history",
+        "summary",
+        "last_message_id",
+        "last_banner_id",
+        "last_text_hash",
+        "last_markup_hash",
+        "first_start_seen",
+    )
+
+    def __init__(self) -> None:
+        self.stage: Optional[str] = None
+        self.business: Optional[str] = None
+        self.saved_business: Optional[str] = None
+        self.faq_set: Optional[FaqSet] = None
+        self.faq_page = 0
+        self.faq_page_size = 3
+        self.history: Deque[Tuple[str, str]] = deque(maxlen=self.history_size)
+        self.summary = ""
+        self.last_message_id: Optional[int] = None
+        self.last_banner_id: Optional[str] = None
+        self.last_text_hash: Optional[str] = None
+        self.last_markup_hash: Optional[str] = None
+        self.first_start_seen = False
+        self.last_seen = time.time()
+
+    # --- доступ как к словарю ---
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "faqs":
+            return self.faq_set.items if self.faq_set is not None else []
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == "faqs":
+            self.faq_set = intern_faqs(value) if value else None
+        elif key == "history":
+            self.history = deque(
+                ((p["q"], p["a"]) if isinstance(p, dict) else tuple(p) for p in value or ()),
+                maxlen=self.history_size,
+            )
+        elif key == "summary":
+            self.summary = value or ""
+        elif key in ("business", "saved_business"):
+            setattr(self, key, _intern_text(value))
+        elif key in self.KEYS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.KEYS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self.KEYS:
+            return default
+        return self[key]
+
+    def update(self, data: Dict[str, Any]) -> None:
+        for key, value in data.items():
+            if key in self.KEYS:
+                self[key] = value
+
+    def add_history(self, question: str, answer: str) -> None:
+        if len(self.history) == self.history.maxlen:
+            old_question, old_answer = self.history[0] if self.history else (question, answer)
+            self.summary = fold_into_summary(self.summary, old_question, old_answer, self.summary_max_tokens)
+            if not self.history.maxlen:
+                return
+        self.history.append((question, answer))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {key: self[key] for key in self.KEYS}
+        data["history"] = [{"q": q, "a": a} for q, a in self.history]
+        return data
+
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+# === ХРАНИЛИЩЕ СЕССИЙ ===
+#
+# get_session в main.py держит горячие сессии в памяти и ходит сюда только
+# за сессией, которой в памяти нет (лениво, при первом обращении чата).
+# save() вызывается после каждого апдейта и только снимает JSON-снимок —
+# в базу их пачками пишет фоновый поток (write-behind).
+
+
+class SessionStore:
+    """
+    Интерфейс хранилища: load(chat_id) -> dict | None, save(chat_id, session),
+    flush(), close(), stats().
+    persistent — переживают ли сессии процесс (можно ли выгружать их из памяти).
+    """
+
+    persistent = False
+
+    def load(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save(self, chat_id: int, session: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def start(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Без диска: сессии живут только в словаре sessions процесса (как раньше).
+    """
+
+    def load(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        return None
+
+    def save(self, chat_id: int, session: Dict[str, Any]) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory"}
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Встроенная SQLite в режиме WAL: таблица sessions(chat_id, data JSON, updated_at).
+
+    save() кладёт JSON-снимок сессии в словарь pending (последний снимок чата
+    побеждает), фоновый поток раз в flush_interval секунд — или раньше, если
+    накопилось batch_size чатов — пишет их одной транзакцией.
+    load() сначала смотрит в pending, потом в базу.
+    """
+
+    persistent = True
+
+    def __init__(self, path: str, flush_interval: float = 0.5, batch_size: int = 500) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = self._connect()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " chat_id INTEGER PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._db_lock = threading.Lock()
+
+        self._pending: Dict[int, str] = {}
+        # пачка, которая прямо сейчас пишется в базу (для load() до COMMIT)
+        self._inflight: Dict[int, str] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self.counters: Dict[str, float] = {
+            "saves": 0,
+            "loads": 0,
+            "loaded": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "flush_ms_total": 0.0,
+            "save_ms_total": 0.0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        # базу могут делить несколько процессов (sharding.py)
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def load(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            data = self._pending.get(chat_id) or self._inflight.get(chat_id)
+        if data is None:
+            with self._db_lock:
+                row = self._db.execute("SELECT data FROM sessions WHERE chat_id = ?", (chat_id,)).fetchone()
+            data = row[0] if row else None
+        with self._cond:
+            self.counters["loads"] += 1
+            self.counters["loaded"] += data is not None
+        return json.loads(data) if data is not None else None
+
+    def save(self, chat_id: int, session: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
+        data = json.dumps(session, ensure_ascii=False, separators=(",", ":"))
+        with self._cond:
+            self._pending[chat_id] = data
+            self.counters["saves"] += 1
+            self.counters["save_ms_total"] += (time.perf_counter() - t0) * 1000
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self) -> None:
+        with self._cond:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+        t0 = time.perf_counter()
+        now = time.time()
+        rows = [(chat_id, data, now) for chat_id, data in batch.items()]
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT INTO sessions (chat_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    rows,
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                # вернуть непосохранённое, не затирая более свежие снимки
+                with self._cond:
+                    for chat_id, data in batch.items():
+                        self._pending.setdefault(chat_id, data)
+                    self._inflight = {}
+                raise
+        with self._cond:
+            self._inflight = {}
+            self.counters["flushes"] += 1
+            self.counters["rows_written"] += len(rows)
+            self.counters["flush_ms_total"] += (time.perf_counter() - t0) * 1000
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception:
+                pass
+            if closed:
+                return
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            c = dict(self.counters)
+            pending = len(self._pending)
+        saves = c["saves"] or 1
+        return {
+            "backend": "sqlite",
+            "pending": pending,
+            "saves": int(c["saves"]),
+            "loads": int(c["loads"]),
+            "loaded": int(c["loaded"]),
+            "flushes": int(c["flushes"]),
+            "rows_written": int(c["rows_written"]),
+            "save_ms_avg": round(c["save_ms_total"] / saves, 4),
+            "flush_ms_avg": round(c["flush_ms_total"] / (c["flushes"] or 1), 2),
+        }
+
+
+def open_session_store(backend: str, path: str, flush_interval: float = 0.5) -> SessionStore:
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SqliteSessionStore(path, flush_interval=flush_interval)
+    raise ValueError(f"unknown session store backend: {backend!r}")
@@ -0,0 +1,400 @@
+"""
+Несколько процессов-воркеров с шардированием по chat_id.
+
+Фронт (этот процесс) забирает апдейты long polling'ом или вебхуком и отдаёт
+каждый воркеру, которому chat_id достаётся по консистентному хешированию.
+Воркер — обычный main.py (свои сессии, кэши, клиент Groq, пул хендлеров),
+так что состояние чата живёт в одном процессе, а ядер используется N.
+
+    python sharding.py run --workers 4
+    python sharding.py loadtest --workers 1 2 4
+
+При смене N (resize) переезжает ~1/N чатов: старые владельцы дообрабатывают
+их апдейты, сбрасывают сессии в общий session_store, новые поднимают их лениво.
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# === КОНСИСТЕНТНОЕ ХЕШИРОВАНИЕ ===
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Кольцо с vnodes виртуальными точками на узел: при добавлении/удалении
+    узла переезжает около 1/N ключей, остальные остаются на месте.
+    """
+
+    def __init__(self, nodes: List[str], vnodes: int = 128) -> None:
+        self.nodes = list(nodes)
+        points = sorted((_hash64(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: Any) -> str:
+        idx = bisect.bisect(self._hashes, _hash64(str(key))) % len(self._hashes)
+        return self._owners[idx]
+
+
+def worker_names(n: int) -> List[str]:
+    return [f"w{i}" for i in range(n)]
+
+
+def chat_id_of(raw_update: Dict[str, Any]) -> Optional[int]:
+    for field in ("message", "edited_message"):
+        message = raw_update.get(field)
+        if message:
+            return message["chat"]["id"]
+    query = raw_update.get("callback_query")
+    if query and query.get("message"):
+        return query["message"]["chat"]["id"]
+    return None
+
+
+# === ВОРКЕР ===
+
+def _install_fake_network(main: Any, cpu_ms: float) -> None:
+    """
+    Для loadtest: Telegram и Groq отвечают мгновенно, «ответ» LLM стоит cpu_ms
+    чистого CPU — как разбор, токенизация и прочая работа на нашей стороне.
+    """
+    from types import SimpleNamespace
+
+    def burn() -> None:
+        end = time.thread_time() + cpu_ms / 1000
+        x = 0
+        while time.thread_time() < end:
+            x += 1
+
+    def create(messages: List[Dict[str, str]], max_tokens: int = 0, **_: Any) -> Any:
+        burn()
+        if max_tokens <= 8:
+            content = "OK"
+        elif '"faqs"' in messages[0]["content"]:
+            content = json.dumps({"faqs": [{"q": f"Вопрос {i}?", "a": f"Ответ {i}."} for i in range(9)]})
+        else:
+            content = "1. Посчитай расходы.\n2. Поставь цену.\n3. Проверь спрос."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    main.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    counter = iter(range(1, 1 << 62))
+
+    def sent(*_: Any, **__: Any) -> Any:
+        return SimpleNamespace(message_id=next(counter))
+
+    for name in ("send_photo", "send_message", "edit_message_caption", "edit_message_text",
+                 "edit_message_media", "edit_message_reply_markup", "delete_message", "answer_callback_query"):
+        setattr(main.bot, name, sent)
+
+
+def worker_main(
+    node: str,
+    nodes: List[str],
+    inbox: "multiprocessing.Queue[Any]",
+    outbox: "multiprocessing.Queue[Any]",
+    env: Dict[str, str],
+) -> None:
+    os.environ.update(env)
+    import main
+
+    main.start_sync_runtime()
+    if env.get("SHARD_FAKE_CPU_MS"):
+        _install_fake_network(main, float(env["SHARD_FAKE_CPU_MS"]))
+    ring = HashRing(nodes)
+    # чистку логов делает один процесс
+    if node == nodes[0]:
+        main.retention_sweeper.start()
+    # чаты, а не бизнесы, разложены по воркерам — кэш ответов нужен каждому целиком
+    main.start_answer_cache_seed()
+    # FAQ прогревает (и тратит на это LLM) один процесс, остальные подхватывают его файл
+    main.start_faq_prewarm(generate=node == nodes[0])
+    main.cache_saver.start()
+    main.session_evictor.start()
+    outbox.put(("ready", node, 0))
+
+    while True:
+        kind, payload = inbox.get()
+        if kind == "updates":
+            raw_updates, received_at = payload
+            main.handle_raw_updates(raw_updates, received_at)
+        elif kind == "rebalance":
+            new_nodes, global_rate = payload
+            ring = HashRing(new_nodes)
+            main.chat_dispatcher.wait_idle()
+            released = main.release_sessions(lambda chat_id: ring.node_for(chat_id) == node)
+            main.telegram_limiter.set_global_rate(global_rate)
+            outbox.put(("rebalanced", node, released))
+        elif kind == "drain":
+            main.chat_dispatcher.wait_idle()
+            outbox.put(("drained", node, main.chat_dispatcher.stats()["processed"]))
+        elif kind == "stop":
+            break
+
+    # дочерний процесс multiprocessing выходит через os._exit — atexit не сработает
+    main.faq_prewarmer.stop()
+    main.retention_sweeper.stop()
+    main.cache_saver.stop()
+    main.session_evictor.stop()
+    main.chat_dispatcher.close()
+    main.save_caches_to_disk()
+    main.session_store.close()
+    main.packet_writer.close()
+    main.packet_log.close()
+    outbox.put(("stopped", node, 0))
+
+
+# === ФРОНТ ===
+
+class ShardedFront:
+    """
+    Держит N воркеров и кольцо. route() раскладывает пачку апдейтов по воркерам
+    (порядок внутри чата сохраняется: один чат — один воркер — одна очередь).
+    """
+
+    def __init__(self, n_workers: int, env: Optional[Dict[str, str]] = None, global_rate: float = 30.0) -> None:
+        self.env = dict(env or {})
+        self.global_rate = global_rate
+        self._ctx = multiprocessing.get_context("spawn")
+        self._outbox = self._ctx.Queue()
+        self._inboxes: Dict[str, Any] = {}
+        self._procs: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.nodes = worker_names(n_workers)
+        self.ring = HashRing(self.nodes)
+        self.routed: Dict[str, int] = {node: 0 for node in self.nodes}
+
+    def _worker_env(self, n: int) -> Dict[str, str]:
+        # лимит Telegram общий на бота — делим его между процессами
+        return {**self.env, "TG_GLOBAL_RATE": str(self.global_rate / n)}
+
+    def _spawn(self, node: str, nodes: List[str]) -> None:
+        inbox = self._ctx.Queue()
+        proc = self._ctx.Process(
+            target=worker_main,
+            args=(node, nodes, inbox, self._outbox, self._worker_env(len(nodes))),
+            name=f"shard-{node}",
+            daemon=True,
+        )
+        proc.start()
+        self._inboxes[node] = inbox
+        self._procs[node] = proc
+
+    def _wait(self, kind: str, nodes: List[str]) -> Dict[str, int]:
+        pending = set(nodes)
+        results: Dict[str, int] = {}
+        while pending:
+            got, node, value = self._outbox.get()
+            if got == kind and node in pending:
+                pending.discard(node)
+                results[node] = value
+        return results
+
+    def start(self) -> None:
+        for node in self.nodes:
+            self._spawn(node, self.nodes)
+        self._wait("ready", self.nodes)
+
+    def route(self, raw_updates: List[Dict[str, Any]], received_at: Optional[float] = None) -> None:
+        received_at = time.monotonic() if received_at is None else received_at
+        with self._lock:
+            batches: Dict[str, List[Dict[str, Any]]] = {}
+            for raw in raw_updates:
+                chat_id = chat_id_of(raw)
+                key = chat_id if chat_id is not None else raw.get("update_id")
+                batches.setdefault(self.ring.node_for(key), []).append(raw)
+            for node, batch in batches.items():
+                self._inboxes[node].put(("updates", (batch, received_at)))
+                self.routed[node] += len(batch)
+
+    def resize(self, n_workers: int) -> Dict[str, int]:
+        """
+        Меняет число воркеров на ходу. Пока идёт переезд, route() ждёт: старые воркеры
+        дообрабатывают очередь, выгружают чужие теперь сессии в session_store, и только
+        потом апдейты идут по новому кольцу. Возвращает, сколько сессий выгрузил каждый.
+        """
+        with self._lock:
+            old_nodes = self.nodes
+            new_nodes = worker_names(n_workers)
+            rate = self.global_rate / n_workers
+            for node in old_nodes:
+                self._inboxes[node].put(("rebalance", (new_nodes, rate)))
+            released = self._wait("rebalanced", old_nodes)
+
+            for node in old_nodes:
+                if node not in new_nodes:
+                    self._inboxes.pop(node).put(("stop", None))
+            self._wait("stopped", [n for n in old_nodes if n not in new_nodes])
+            for node in [n for n in old_nodes if n not in new_nodes]:
+                self._procs.pop(node).join()
+
+            added = [n for n in new_nodes if n not in old_nodes]
+            for node in added:
+                self._spawn(node, new_nodes)
+            self._wait("ready", added)
+
+            self.nodes = new_nodes
+            self.ring = HashRing(new_nodes)
+            for node in added:
+                self.routed[node] = 0
+            return released
+
+    def drain(self) -> Dict[str, int]:
+        with self._lock:
+            for node in self.nodes:
+                self._inboxes[node].put(("drain", None))
+            return self._wait("drained", self.nodes)
+
+    def stop(self) -> None:
+        with self._lock:
+            for node in self.nodes:
+                self._inboxes[node].put(("stop", None))
+            self._wait("stopped", self.nodes)
+            for proc in self._procs.values():
+                proc.join()
+
+
+# === run: фронт на long polling или вебхуке ===
+
+def poll_forever(front: ShardedFront, token: str, timeout: int = 20) -> None:
+    import telebot.apihelper as apihelper
+
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(token, offset=offset, timeout=timeout, long_polling_timeout=timeout)
+        except Exception:
+            time.sleep(3)
+            continue
+        if updates:
+            offset = max(u["update_id"] for u in updates) + 1
+            front.route(updates)
+
+
+def run(args: argparse.Namespace) -> None:
+    from webhook import WebhookServer
+
+    front = ShardedFront(args.workers, global_rate=float(os.getenv("TG_GLOBAL_RATE", "30")))
+    front.start()
+    print(f"Sharded bot started: {args.workers} workers")
+    try:
+        if os.getenv("BOT_MODE", "polling") == "webhook":
+            server = WebhookServer(
+                front.route,
+                host=os.getenv("WEBHOOK_HOST", "127.0.0.1"),
+                port=int(os.getenv("WEBHOOK_PORT", "8080")),
+                path=os.getenv("WEBHOOK_PATH", "/telegram/webhook"),
+                secret_token=os.getenv("WEBHOOK_SECRET", ""),
+            )
+            server.serve_forever()
+        else:
+            poll_forever(front, os.getenv("TELEGRAM_BOT_TOKEN", ""))
+    finally:
+        front.stop()
+
+
+# === loadtest: пропускная способность от числа воркеров ===
+
+def _chat_script(chat_id: int, first_update_id: int) -> List[Dict[str, Any]]:
+    """
+    Типичный путь пользователя: старт, описание бизнеса, «свой вопрос», вопрос.
+    """
+    user = {"id": chat_id, "is_bot": False, "first_name": "load"}
+    chat = {"id": chat_id, "type": "private"}
+
+    def text(uid: int, value: str) -> Dict[str, Any]:
+        return {"update_id": uid, "message": {"message_id": uid, "date": 0, "text": value, "chat": chat, "from": user}}
+
+    uid = first_update_id
+    return [
+        text(uid, "старт"),
+        text(uid + 1, f"кофейня у дома номер {chat_id}"),
+        {"update_id": uid + 2, "callback_query": {
+            "id": str(uid + 2), "from": user, "chat_instance": "1", "data": "faq_other",
+            "message": {"message_id": 1, "date": 0, "chat": chat, "from": user},
+        }},
+        text(uid + 3, f"как посчитать себестоимость чашки {chat_id}"),
+    ]
+
+
+def _loadtest_shards(n_workers: int, args: argparse.Namespace, data_dir: str) -> Tuple[float, int]:
+    env = {
+        "TELEGRAM_BOT_TOKEN": os.getenv("TELEGRAM_BOT_TOKEN", "1:loadtest"),
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "loadtest"),
+        "DATA_DIR": data_dir,
+        "SHARD_FAKE_CPU_MS": str(args.cpu_ms),
+        "TG_CHAT_RATE": "100000",
+        "TG_CHAT_BURST": "100000",
+        "PRECLASSIFIER_ENABLED": "0",
+        "SPECULATIVE_LLM": "0",
+        "PACKET_ECHO_STDOUT": "0",
+    }
+    front = ShardedFront(n_workers, env=env, global_rate=100000.0)
+    front.start()
+
+    scripts = [_chat_script(chat_id, 1 + chat_id * 10) for chat_id in range(1, args.chats + 1)]
+    total = sum(len(s) for s in scripts)
+    t0 = time.perf_counter()
+    # шаг пользователя за шагом: все чаты шлют первое сообщение, потом второе, ...
+    for step in range(len(scripts[0])):
+        front.route([s[step] for s in scripts])
+    processed = sum(front.drain().values())
+    elapsed = time.perf_counter() - t0
+    front.stop()
+    return elapsed, processed if processed else total
+
+
+def loadtest(args: argparse.Namespace) -> None:
+    import shutil
+    import tempfile
+
+    print(f"{args.chats} chats x 4 updates, fake LLM {args.cpu_ms:g} ms CPU per call, {os.cpu_count()} CPUs")
+    base = None
+    for n in args.workers:
+        data_dir = tempfile.mkdtemp(prefix="shard_load_")
+        try:
+            elapsed, processed = _loadtest_shards(n, args, data_dir)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        rate = processed / elapsed
+        base = base or rate
+        print(f"workers={n:<3} updates={processed:<6} elapsed={elapsed:6.2f}s updates/s={rate:8.1f} speedup={rate / base:5.2f}x")
+
+    # сколько чатов переезжает при смене N
+    keys = range(100_000)
+    for n in args.workers[1:]:
+        before, after = HashRing(worker_names(n - 1)), HashRing(worker_names(n))
+        moved = sum(before.node_for(k) != after.node_for(k) for k in keys) / len(keys)
+        print(f"resize {n - 1}->{n}: {moved:.1%} of chats move (ideal {1 / n:.1%})")
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("run", help="фронт + N воркеров")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.set_defaults(func=run)
+
+    p = sub.add_parser("loadtest", help="локальный прогон: пропускная способность от числа воркеров")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--chats", type=int, default=300)
+    p.add_argument("--cpu-ms", type=float, default=5.0)
+    p.set_defaults(func=loadtest)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,295 @@
+import zlib
+import random
+import threading
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Set, Tuple
+
+from cache import normalize_key
+
+# === ПОИСК ПОХОЖИХ ОПИСАНИЙ (MinHash + LSH) ===
+#
+# Текст -> нормализованные основы слов -> символьные 3-граммы -> MinHash-подпись.
+# Подпись режется на полосы (bands), по каждой полосе — корзина в словаре.
+# Кандидаты из общих корзин проверяются точной мерой Жаккара по 3-граммам,
+# так что поиск сублинейный, а ложные совпадения LSH отсекаются.
+#
+# Одной меры Жаккара мало: у «доставка пиццы» и «доставка суши» половина
+# 3-грамм общая. Поэтому совпадением считается только пара, у которой ещё и
+# значимые слова попарно совпадают (same_words): «магазин обуви» не берёт
+# FAQ «магазина одежды», а «детская одежда» — «женской одежды».
+# Одно лишнее определение с одной стороны допустимо: «маленькая кофейня у дома»
+# берёт FAQ «кофейни у дома». Поэтому Жаккар считается по словам без
+# определений, а отрицательное («неофициальная», «безлицензионный») лишним
+# определением не считается.
+
+# служебные слова; «не» сюда не входит — «законно» и «не законно» разные тексты
+FUNCTION_WORDS = frozenset({
+    "у", "в", "во", "на", "возле", "около", "рядом", "с", "со", "и", "или", "для",
+    "по", "из", "от", "до", "к", "ко", "при", "под", "над", "за", "о", "об",
+    "а", "но", "это", "я", "мы",
+})
+
+# для описаний бизнеса ещё и «хочу открыть мою …»
+STOPWORDS = FUNCTION_WORDS | frozenset({
+    "мой", "моя", "мое", "мои", "свой", "своя", "свое", "свои",
+    "хочу", "хотим", "открыть", "открываю",
+})
+
+# окончания от длинных к коротким; отрезаем одно, если остаётся основа >= 3 букв
+_ENDINGS = sorted({
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ость",
+    "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий", "ой", "ом", "ем", "ам", "ям",
+    "ах", "ях", "ов", "ев", "ей", "ую", "юю", "ия", "ья", "ью", "ию",
+    "ы", "и", "а", "я", "о", "е", "у", "ю", "ь", "й",
+}, key=len, reverse=True)
+
+# окончания прилагательных (и причастий) — по ним слово считается определением
+_MODIFIER_ENDINGS = (
+    "ый", "ий", "ой", "ая", "яя", "ое", "ее", "ые", "ие", "ого", "его", "ому", "ему",
+    "ым", "им", "ыми", "ими", "ую", "юю", "ых", "их",
+)
+# существительные с такими же окончаниями: «обучение», «развитие»
+_NOUN_ENDINGS = ("ние", "тие")
+_NEGATIONS = ("не", "без")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def stem_ru(token: str) -> str:
+    for ending in _ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= 3:
+            return token[: -len(ending)]
+    return token
+
+
+def normalize_tokens(text: str, stopwords: FrozenSet[str] = STOPWORDS) -> List[str]:
+    """
+    «Маленькая кофейня возле дома» -> ["маленьк", "кофейн", "дом"].
+    """
+    return [stem_ru(t) for t in normalize_key(text).split() if t not in stopwords]
+
+
+def content_words(text: str, stopwords: FrozenSet[str] = STOPWORDS) -> FrozenSet[str]:
+    return frozenset(normalize_tokens(text, stopwords))
+
+
+def is_modifier(token: str) -> bool:
+    return len(token) > 4 and token.endswith(_MODIFIER_ENDINGS) and not token.endswith(_NOUN_ENDINGS)
+
+
+def modifier_words(text: str, stopwords: FrozenSet[str] = STOPWORDS) -> FrozenSet[str]:
+    """
+    Основы определений: «маленькая кофейня у дома» -> {"маленьк"}.
+    """
+    return frozenset(stem_ru(t) for t in normalize_key(text).split() if t not in stopwords and is_modifier(t))
+
+
+def _negated(word: str) -> bool:
+    return word.startswith(_NEGATIONS)
+
+
+def _word_shingles(word: str, k: int = 3) -> FrozenSet[str]:
+    padded = f"#{word}#"
+    return frozenset(padded[i:i + k] for i in range(max(1, len(padded) - k + 1)))
+
+
+def same_words(
+    a: FrozenSet[str],
+    b: FrozenSet[str],
+    word_threshold: float = 0.75,
+    modifiers: FrozenSet[str] = frozenset(),
+) -> bool:
+    """
+    Наборы основ совпадают поштучно: каждому слову короткого текста нашлась пара
+    в длинном — та же основа или очень похожая (3-граммы слова, word_threshold;
+    1.0 — только та же основа). «законн» и «незаконн» парой не бывают.
+    В длинном может остаться одно лишнее слово, если это определение (modifiers)
+    без отрицания; любое другое лишнее слово — уже не совпадение.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > 1:
+        return False
+    rest = set(a - b)
+    for word in b - a:
+        if word_threshold >= 1.0:
+            return False
+        sh = _word_shingles(word)
+        best = None
+        best_score = word_threshold
+        for other in rest:
+            if _negated(word) != _negated(other):
+                continue
+            other_sh = _word_shingles(other)
+            score = len(sh & other_sh) / len(sh | other_sh)
+            if score >= best_score:
+                best, best_score = other, score
+        if best is None:
+            return False
+        rest.discard(best)
+    return all(word in modifiers and not _negated(word) for word in rest)
+
+
+def shingles(text: str, k: int = 3, skip: FrozenSet[str] = frozenset()) -> FrozenSet[int]:
+    """
+    Символьные k-граммы по каждой основе с маркерами границ слова, в виде crc32.
+    Основы из skip пропускаются, если после этого что-то остаётся.
+    """
+    tokens = normalize_tokens(text)
+    core = [t for t in tokens if t not in skip]
+    result: Set[int] = set()
+    for token in core or tokens:
+        padded = f"#{token}#"
+        if len(padded) <= k:
+            result.add(zlib.crc32(padded.encode("utf-8")))
+            continue
+        for i in range(len(padded) - k + 1):
+            result.add(zlib.crc32(padded[i:i + k].encode("utf-8")))
+    return frozenset(result)
+
+
+def jaccard(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class SimilarityIndex:
+    """
+    Индекс похожих текстов. add(key, text) — запомнить, query(text) — найти
+    самый похожий сохранённый ключ с мерой Жаккара >= threshold и теми же
+    значимыми словами (same_words с word_threshold). Жаккар и полосы LSH
+    считаются по словам без определений (modifier_words).
+
+    bands * rows = число хешей в подписи. Порог срабатывания LSH примерно
+    (1 / bands) ** (1 / rows); по умолчанию (24, 3) это ~0.35, т.е. ниже
+    рабочего threshold — кандидаты почти не теряются.
+
+    Ради памяти на сотнях тысяч записей полоса хранится одним int (hash кортежа),
+    а в корзине лежит сам ключ или, при коллизиях, список ключей. Корзина
+    ограничена max_bucket ключами: если в ней уже столько почти одинаковых
+    текстов, ещё один ничего не добавит к поиску, а проверку замедлит.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        word_threshold: float = 0.75,
+        bands: int = 24,
+        rows: int = 3,
+        max_bucket: int = 32,
+        seed: int = 1,
+    ) -> None:
+        self.threshold = threshold
+        self.word_threshold = word_threshold
+        self.bands = bands
+        self.rows = rows
+        self.max_bucket = max_bucket
+
+        rnd = random.Random(seed)
+        n = bands * rows
+        self._perm_a = [rnd.randrange(1, _MERSENNE_PRIME) for _ in range(n)]
+        self._perm_b = [rnd.randrange(0, _MERSENNE_PRIME) for _ in range(n)]
+
+        self._lock = threading.Lock()
+        # key -> (3-граммы, хеши полос, основы слов, основы определений)
+        self._items: Dict[Hashable, Tuple[FrozenSet[int], Tuple[int, ...], FrozenSet[str], FrozenSet[str]]] = {}
+        # по словарю на полосу: хеш полосы -> ключ | [ключи]
+        self._buckets: List[Dict[int, Any]] = [{} for _ in range(bands)]
+
+        self.queries = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _signature(self, sh: FrozenSet[int]) -> List[int]:
+        sig: List[int] = []
+        for a, b in zip(self._perm_a, self._perm_b):
+            sig.append(min((a * x + b) % _MERSENNE_PRIME for x in sh))
+        return sig
+
+    def _bands(self, sh: FrozenSet[int]) -> Tuple[int, ...]:
+        sig = self._signature(sh)
+        r = self.rows
+        return tuple(hash(tuple(sig[i * r:(i + 1) * r])) for i in range(self.bands))
+
+    def add(self, key: Hashable, text: str) -> None:
+        modifiers = modifier_words(text)
+        sh = shingles(text, skip=modifiers)
+        if not sh:
+            return
+        bands = self._bands(sh)
+        words = content_words(text)
+        with self._lock:
+            self._remove_locked(key)
+            self._items[key] = (sh, bands, words, modifiers)
+            for i, band in enumerate(bands):
+                table = self._buckets[i]
+                bucket = table.get(band)
+                if bucket is None:
+                    table[band] = key
+                elif isinstance(bucket, list):
+                    if len(bucket) < self.max_bucket:
+                        bucket.append(key)
+                else:
+                    table[band] = [bucket, key]
+
+    def _remove_locked(self, key: Hashable) -> None:
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        for i, band in enumerate(item[1]):
+            table = self._buckets[i]
+            bucket = table.get(band)
+            if isinstance(bucket, list):
+                if key in bucket:
+                    bucket.remove(key)
+                if len(bucket) == 1:
+                    table[band] = bucket[0]
+            elif bucket == key:
+                del table[band]
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            self._remove_locked(key)
+
+    def query(self, text: str, threshold: Optional[float] = None) -> Optional[Tuple[Hashable, float]]:
+        """
+        (ключ, сходство) самого похожего текста или None.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        modifiers = modifier_words(text)
+        sh = shingles(text, skip=modifiers)
+        bands = self._bands(sh) if sh else []
+        words = content_words(text)
+
+        best: Optional[Tuple[Hashable, float]] = None
+        with self._lock:
+            self.queries += 1
+            candidates: Set[Hashable] = set()
+            for i, band in enumerate(bands):
+                bucket = self._buckets[i].get(band)
+                if bucket is None:
+                    continue
+                if isinstance(bucket, list):
+                    candidates.update(bucket)
+                else:
+                    candidates.add(bucket)
+            for key in candidates:
+                item_sh, _bands, item_words, item_modifiers = self._items[key]
+                score = jaccard(sh, item_sh)
+                if score < threshold or (best is not None and score <= best[1]):
+                    continue
+                if same_words(words, item_words, self.word_threshold, modifiers | item_modifiers):
+                    best = (key, score)
+            if best is not None:
+                self.hits += 1
+        return best
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self._items),
+            "queries": self.queries,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.queries, 4) if self.queries else 0.0,
+        }
@@ -0,0 +1,141 @@
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# === SINGLE-FLIGHT: ОДИН ЗАПРОС НА ОДИНАКОВЫЕ ВЫЗОВЫ ===
+#
+# Если несколько чатов одновременно вводят один и тот же бизнес, каждый
+# запускал бы свой generate_faqs / classify_business. SingleFlight держит
+# таблицу вызовов «в полёте»: первый с данным ключом (лидер) идёт в LLM,
+# остальные ждут его результат (или его исключение). После завершения ключ
+# удаляется — это не кэш, повторный вызов позже снова пойдёт в LLM.
+
+
+def _normalize_content(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def flight_key(model: str, messages: List[Dict[str, str]], **params: Any) -> str:
+    """
+    Ключ вызова: модель, промпт (пробелы схлопнуты) и параметры генерации.
+    """
+    payload = json.dumps(
+        [model, [(m["role"], _normalize_content(m["content"])) for m in messages], params],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class _AsyncFlight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]") -> None:
+        self.task = task
+        self.waiters = 1
+
+
+class SingleFlight:
+    """
+    do(key, fn, *args) — для потоков, ado(key, coro_fn, *args) — для asyncio.
+    Счётчики в stats(): calls — всего вызовов, executed — реально ушло в LLM,
+    coalesced — вызовов, получивших чужой результат.
+
+    В ado() сам запрос идёт отдельной задачей: если ждущий отменён (например,
+    отброшенная спекуляция), остальные продолжают ждать, а задача отменяется,
+    только когда ждать её больше некому.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, _AsyncFlight] = {}
+        self.counters: Dict[str, int] = {
+            "calls": 0,
+            "executed": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "max_waiters": 0,
+        }
+
+    def _joined(self, waiters: int) -> None:
+        self.counters["coalesced"] += 1
+        self.counters["max_waiters"] = max(self.counters["max_waiters"], waiters)
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self.counters["calls"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.counters["executed"] += 1
+            else:
+                flight.waiters += 1
+                self._joined(flight.waiters)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def ado(self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        with self._lock:
+            self.counters["calls"] += 1
+            flight = self._async_flights.get(key)
+            if flight is None:
+                flight = self._async_flights[key] = _AsyncFlight(asyncio.ensure_future(fn(*args)))
+                flight.task.add_done_callback(lambda task: self._finish_async(key, task))
+                self.counters["executed"] += 1
+            else:
+                flight.waiters += 1
+                self._joined(flight.waiters)
+
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            with self._lock:
+                flight.waiters -= 1
+                orphaned = flight.waiters == 0
+            if orphaned:
+                flight.task.cancel()
+            raise
+
+    def _finish_async(self, key: str, task: "asyncio.Task[Any]") -> None:
+        with self._lock:
+            if self._async_flights.get(key) is not None and self._async_flights[key].task is task:
+                del self._async_flights[key]
+            if not task.cancelled() and task.exception() is not None:
+                self.counters["errors"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self._flights) + len(self._async_flights)
+        return stats
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py читает настройки при импорте: бот и Groq — фиктивные, данные — во временной папке
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="logiq-tests-"))
+os.environ.setdefault("PACKET_ECHO_STDOUT", "0")
+os.environ.setdefault("FAQ_PREWARM_ENABLED", "0")
+os.environ.setdefault("ANSWER_CACHE_SEED_FROM_PACKETS", "0")
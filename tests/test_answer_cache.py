@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import async_bot
+import main
+from answer_cache import AnswerCache
+from cache import LruTtlCache
+
+BUSINESS = "кофейня у дома"
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("как снизить налоги законно", "как снизить налоги незаконно"),
+    ("как работать официально", "как работать неофициально"),
+    ("как открыть кофейню", "как закрыть кофейню"),
+    ("как посчитать себестоимость", "как посчитать себестоимость кофе"),
+])
+def test_different_questions_do_not_share_answers(stored, asked):
+    cache = AnswerCache(max_size=100, ttl=0)
+    cache.store(BUSINESS, stored, "ответ")
+    assert cache.lookup(BUSINESS, asked) is None
+    assert cache.lookup(BUSINESS, stored) == "ответ"
+
+
+def test_reworded_question_and_similar_business_hit():
+    cache = AnswerCache(max_size=100, ttl=0)
+    cache.store(BUSINESS, "как посчитать себестоимость", "ответ")
+    assert cache.lookup("кофейня возле дома", "Себестоимость как посчитать?") == "ответ"
+    assert cache.lookup("цветочный магазин у дома", "как посчитать себестоимость") is None
+
+
+@pytest.fixture
+def moderated(monkeypatch):
+    """Кэш с готовым ответом на «законно» и LLM-модератор, который запрещает «незаконно»."""
+    cache = AnswerCache(max_size=100, ttl=0)
+    cache.store(BUSINESS, "как снизить налоги законно", "ответ из кэша")
+    verdicts = LruTtlCache(max_size=100, ttl=0)
+    asked = []
+
+    def classify(question, business):
+        asked.append(question)
+        return "ILLEGAL" if "незаконно" in question else "OK"
+
+    async def classify_async(question, business):
+        return classify(question, business)
+
+    screens, packets = [], []
+    monkeypatch.setattr(main, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(main, "STREAM_ANSWERS", False)
+    monkeypatch.setattr(main, "PRECLASSIFIER_ENABLED", False)
+    monkeypatch.setattr(main, "answer_cache", cache)
+    monkeypatch.setattr(main, "question_verdicts", verdicts)
+    monkeypatch.setattr(main, "classify_question", classify)
+    monkeypatch.setattr(main, "save_packet", packets.append)
+    monkeypatch.setattr(main, "send_screen", lambda chat_id, session, text, **kw: screens.append(text))
+    monkeypatch.setattr(main, "render_custom_answer", lambda *a: screens.append(a[3]))
+    monkeypatch.setattr(main, "ask_llm", lambda *a: pytest.fail("LLM не должен вызываться"))
+
+    async def send_async(chat_id, session, text, **kw):
+        screens.append(text)
+
+    async def render_async(*a):
+        screens.append(a[3])
+
+    async def save_async(packet):
+        packets.append(packet)
+
+    monkeypatch.setattr(async_bot, "STREAM_ANSWERS", False)
+    monkeypatch.setattr(async_bot, "question_verdicts", verdicts)
+    monkeypatch.setattr(async_bot, "classify_question_async", classify_async)
+    monkeypatch.setattr(async_bot, "save_packet_async", save_async)
+    monkeypatch.setattr(async_bot, "send_screen_async", send_async)
+    monkeypatch.setattr(async_bot, "render_custom_answer", render_async)
+    return SimpleNamespace(asked=asked, screens=screens, packets=packets)
+
+
+def ask(bot, question):
+    message = SimpleNamespace(chat=SimpleNamespace(id=5), text=question)
+    session = {"business": BUSINESS}
+    if bot is main:
+        main.handle_custom_question(message, session)
+    else:
+        asyncio.run(async_bot.handle_custom_question(message, session))
+
+
+@pytest.mark.parametrize("bot", [main, async_bot])
+def test_cached_answer_is_served_after_moderation(moderated, bot):
+    ask(bot, "как снизить налоги законно")
+    assert moderated.screens == ["ответ из кэша"]
+
+
+@pytest.mark.parametrize("bot", [main, async_bot])
+def test_rejected_question_gets_no_cached_answer(moderated, bot):
+    # даже если бы кэш счёл вопросы одинаковыми, вердикт идёт раньше
+    main.answer_cache.store(BUSINESS, "как снизить налоги незаконно", "ответ из кэша")
+    ask(bot, "как снизить налоги незаконно")
+    assert "ответ из кэша" not in moderated.screens
+    assert [p["type"] for p in moderated.packets] == ["rejected_question"]
+    assert [p["reason"] for p in moderated.packets] == ["ILLEGAL"]
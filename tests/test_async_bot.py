@@ -0,0 +1,34 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import async_bot
+
+
+def test_chat_lock_serializes_and_is_dropped():
+    order = []
+
+    async def handler(n):
+        order.append(("start", n))
+        await asyncio.sleep(0.01)
+        order.append(("end", n))
+
+    async def go():
+        await asyncio.gather(*(async_bot._run_locked(42, handler, n) for n in range(3)))
+
+    asyncio.run(go())
+    assert order == [(kind, n) for n in range(3) for kind in ("start", "end")]
+    assert not async_bot.chat_busy(42)
+    assert async_bot._chat_locks == {}
+
+
+def test_import_does_not_start_the_sync_runtime():
+    # в отдельном процессе: в этом тесты уже могли что-то запустить
+    code = (
+        "import threading, async_bot, main; "
+        "print(threading.active_count(), main.bot, main.client, main.llm_pool, main.chat_dispatcher)"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, env=os.environ, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["1", "None", "None", "None", "None"]
@@ -0,0 +1,58 @@
+import multiprocessing
+
+from cache import LruTtlCache
+
+
+def _worker(path, worker, rounds):
+    cache = LruTtlCache(max_size=10000, ttl=3600, path=path)
+    for i in range(rounds):
+        cache.set(f"w{worker}-{i}", i)
+        cache.save()
+
+
+def test_concurrent_processes_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "faq.json")
+    procs = [multiprocessing.Process(target=_worker, args=(path, w, 50)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+
+    cache = LruTtlCache(max_size=10000, path=path)
+    assert cache.load() == 200
+
+
+def test_save_merges_and_respects_deletes(tmp_path):
+    path = str(tmp_path / "verdicts.json")
+    a = LruTtlCache(ttl=3600, path=path)
+    b = LruTtlCache(ttl=3600, path=path)
+    a.set("shared", "old")
+    a.set("gone", 1)
+    a.save()
+    b.set("shared", "new")
+    b.set("mine", 2)
+    b.save()
+    a.delete("gone")
+    a.save()
+
+    merged = LruTtlCache(path=path)
+    merged.load()
+    assert sorted(merged.keys()) == ["mine", "shared"]
+    # b записал общий ключ позже — его версия не затирается старой из a
+    assert merged.get("shared") == "new"
+
+
+def test_save_keeps_max_size_most_recent(tmp_path):
+    path = str(tmp_path / "answers.json")
+    a = LruTtlCache(max_size=3, path=path)
+    b = LruTtlCache(max_size=3, path=path)
+    for key in ("a1", "a2", "a3"):
+        a.set(key, 1)
+    a.save()
+    b.set("b1", 1)
+    b.save()
+
+    merged = LruTtlCache(max_size=3, path=path)
+    merged.load()
+    assert merged.keys() == ["a2", "a3", "b1"]
@@ -0,0 +1,65 @@
+import random
+import threading
+import time
+
+from dispatcher import ChatDispatcher
+
+
+def test_updates_of_one_chat_run_in_order_and_one_at_a_time():
+    seen = {chat: [] for chat in range(8)}
+    running = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def handler(item):
+        chat, n = item
+        with lock:
+            if chat in running:
+                overlaps.append(item)
+            running.add(chat)
+        time.sleep(random.random() / 1000)
+        with lock:
+            running.discard(chat)
+            seen[chat].append(n)
+
+    dispatcher = ChatDispatcher(handler, workers=4, max_backlog=1000)
+    for n in range(50):
+        for chat in seen:
+            assert dispatcher.submit(chat, (chat, n))
+    dispatcher.close()
+    assert overlaps == []
+    assert all(order == list(range(50)) for order in seen.values())
+    assert dispatcher.stats()["processed"] == 400
+
+
+def test_different_chats_run_in_parallel():
+    barrier = threading.Barrier(3, timeout=5)
+    dispatcher = ChatDispatcher(lambda item: barrier.wait(), workers=3)
+    for chat in range(3):
+        dispatcher.submit(chat, "update")
+    dispatcher.close()
+    assert dispatcher.stats()["errors"] == 0
+
+
+def test_full_chat_backlog_drops_and_failures_do_not_stop_the_queue():
+    started, release = threading.Event(), threading.Event()
+    done = []
+
+    def handler(item):
+        started.set()
+        release.wait(5)
+        if item == 1:
+            raise RuntimeError("boom")
+        done.append(item)
+
+    dispatcher = ChatDispatcher(handler, workers=1, max_backlog=3)
+    assert dispatcher.submit(7, 0)
+    started.wait(5)
+    # первый апдейт уже в работе, в очереди чата место для трёх
+    results = [dispatcher.submit(7, n) for n in range(1, 6)]
+    release.set()
+    dispatcher.close()
+    assert results == [True, True, True, False, False]
+    assert done == [0, 2, 3]
+    stats = dispatcher.stats()
+    assert (stats["dropped"], stats["errors"], stats["active_chats"]) == (2, 1, 0)
@@ -0,0 +1,61 @@
+import json
+
+import main
+from faq_stream import FaqStreamParser
+
+FAQS = [
+    {"q": "Как открыть \"кофейню\"?", "a": "Начни с {плана} и [сметы]."},
+    {"q": "Где взять деньги?", "a": "Кредит, грант или свои\\накопления."},
+    {"q": "Сколько стоит аренда?", "a": "Зависит от района."},
+]
+TEXT = "```json\n" + json.dumps({"faqs": FAQS, "note": {"q": "не пункт", "a": "-"}}, ensure_ascii=False) + "\n```"
+
+
+def feed_by(parser, text, size):
+    fresh = []
+    for i in range(0, len(text), size):
+        fresh.append(parser.feed(text[i:i + size]))
+    return fresh
+
+
+def test_items_are_emitted_as_soon_as_their_object_closes():
+    for size in (1, 2, 7, len(TEXT)):
+        parser = FaqStreamParser(9)
+        fresh = feed_by(parser, TEXT, size)
+        assert parser.items == FAQS and parser.text == TEXT
+        # каждый пункт отдаётся ровно один раз и по порядку
+        assert [item for batch in fresh for item in batch] == FAQS
+
+    parser = FaqStreamParser(9)
+    cut = TEXT.index("}", TEXT.index("Где взять"))
+    assert parser.feed(TEXT[:cut]) == [FAQS[0]]
+    assert parser.feed(TEXT[cut:cut + 1]) == [FAQS[1]]
+
+
+def test_n_limits_items_and_marks_done():
+    parser = FaqStreamParser(2)
+    feed_by(parser, TEXT, 5)
+    assert parser.items == FAQS[:2] and parser.done
+
+
+def test_complete_stream_is_parsed_again_as_a_whole():
+    parser = FaqStreamParser(9)
+    text = json.dumps({"faqs": FAQS}, ensure_ascii=False)
+    feed_by(parser, text, 3)
+    assert main.finish_faq_stream(parser, 9) == (FAQS, True)
+
+
+def test_cut_stream_keeps_parsed_items_and_is_incomplete():
+    parser = FaqStreamParser(9)
+    # оборвано по max_tokens посреди третьего пункта
+    text = json.dumps({"faqs": FAQS}, ensure_ascii=False)
+    feed_by(parser, text[:text.index("Зависит")], 4)
+    assert main.finish_faq_stream(parser, 9) == (FAQS[:2], False)
+
+
+def test_broken_stream_without_items_falls_back_to_raw_text():
+    parser = FaqStreamParser(9)
+    feed_by(parser, "Извини, не могу составить список.", 4)
+    assert parser.items == []
+    faqs, complete = main.finish_faq_stream(parser, 9)
+    assert complete and faqs == [{"q": main.FAQ_FALLBACK_QUESTION, "a": "Извини, не могу составить список."}]
@@ -0,0 +1,157 @@
+import httpx
+import groq
+import pytest
+
+from llm_gateway import CallPolicy, CircuitBreaker, LlmGateway, LlmRejected, LlmUnavailable, is_retryable
+from llm_router import ModelRouter, Route
+
+REQUEST = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+
+
+def status_error(status: int) -> groq.APIStatusError:
+    return groq.APIStatusError("error", response=httpx.Response(status, request=REQUEST), body=None)
+
+
+@pytest.mark.parametrize("exc", [
+    groq.APITimeoutError(request=REQUEST),
+    groq.APIConnectionError(request=REQUEST),
+    httpx.ReadTimeout("read timeout"),
+    httpx.RemoteProtocolError("peer closed connection"),
+    TimeoutError(),
+    status_error(429),
+    status_error(503),
+])
+def test_transient_errors_are_retryable(exc):
+    assert is_retryable(exc)
+
+
+@pytest.mark.parametrize("exc", [
+    status_error(400),
+    status_error(401),
+    AttributeError("'NoneType' object has no attribute 'usage'"),
+    KeyError("content"),
+    TypeError("unsupported operand"),
+    LlmUnavailable(),
+])
+def test_bugs_and_bad_requests_are_not_retryable(exc):
+    assert not is_retryable(exc)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def gateway(clock: Clock, retries: int = 2) -> LlmGateway:
+    return LlmGateway(
+        {"answer": CallPolicy(timeout=1.0, retries=retries)},
+        breaker_factory=lambda: CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock),
+        backoff_base=0.0,
+    )
+
+
+def test_bug_is_raised_once_and_does_not_trip_breaker():
+    gw = gateway(Clock())
+    calls = []
+
+    def buggy(timeout):
+        calls.append(timeout)
+        raise AttributeError("usage")
+
+    for _ in range(5):
+        with pytest.raises(AttributeError):
+            gw.call("answer", buggy)
+    assert len(calls) == 5
+    assert gw.breaker().snapshot()["state"] == "closed"
+    assert gw.stats()["answer"]["retries"] == 0
+
+
+def test_transient_errors_retry_then_open_breaker():
+    clock = Clock()
+    gw = gateway(clock)
+    calls = []
+
+    def down(timeout):
+        calls.append(timeout)
+        raise groq.APIConnectionError(request=REQUEST)
+
+    with pytest.raises(LlmUnavailable):
+        gw.call("answer", down)
+    assert len(calls) == 3
+    assert gw.breaker().snapshot()["state"] == "open"
+    with pytest.raises(LlmUnavailable):
+        gw.call("answer", down)
+    assert len(calls) == 3
+
+
+def test_bug_in_half_open_probe_does_not_wedge_breaker():
+    clock = Clock()
+    gw = gateway(clock, retries=0)
+    for _ in range(3):
+        with pytest.raises(LlmUnavailable):
+            gw.call("answer", lambda timeout: (_ for _ in ()).throw(TimeoutError()))
+    clock.now = 11
+    with pytest.raises(KeyError):
+        gw.call("answer", lambda timeout: {}["content"])
+    assert gw.call("answer", lambda timeout: "ok") == "ok"
+    assert gw.breaker().snapshot()["state"] == "closed"
+
+
+def test_open_primary_breaker_does_not_block_fallback_model():
+    gw = gateway(Clock(), retries=0)
+    router = ModelRouter({"answer": Route(model="big", max_tokens=100, fallback_model="small")})
+    calls = []
+
+    def create(model, timeout):
+        calls.append(model)
+        if model == "big":
+            raise groq.APIConnectionError(request=REQUEST)
+        return f"ok from {model}"
+
+    def completion(model):
+        return gw.call("answer", create, model, breaker_key=model)
+
+    for _ in range(5):
+        assert router.call("answer", completion) == "ok from small"
+    # после трёх неудач основная модель отбивается предохранителем без запроса
+    assert calls.count("big") == 3 and calls.count("small") == 5
+    assert gw.breaker("big").snapshot()["state"] == "open"
+    assert gw.breaker("small").snapshot()["state"] == "closed"
+    assert set(gw.stats()["breakers"]) == {"big", "small"}
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 413])
+def test_rejected_request_becomes_llm_unavailable_without_retry_or_trip(status):
+    gw = gateway(Clock())
+    calls = []
+
+    def rejected(timeout):
+        calls.append(timeout)
+        raise status_error(status)
+
+    for _ in range(5):
+        with pytest.raises(LlmRejected) as info:
+            gw.call("answer", rejected)
+        assert isinstance(info.value, LlmUnavailable) and info.value.status_code == status
+    assert len(calls) == 5
+    assert gw.breaker().snapshot()["state"] == "closed"
+    assert gw.stats()["answer"]["rejected"] == 5
+
+
+def test_rejected_request_shows_unavailable_screen(monkeypatch):
+    import main
+
+    shown = []
+
+    def fail(updates):
+        raise LlmRejected("answer call rejected with status 401", 401)
+
+    monkeypatch.setattr(main, "process_update_inline", fail)
+    monkeypatch.setattr(main, "update_chat_id", lambda update: 5)
+    monkeypatch.setattr(main, "show_llm_unavailable", shown.append)
+    monkeypatch.setattr(main, "save_session", lambda chat_id: None)
+    main.process_update(object())
+    assert shown == [5]
@@ -0,0 +1,86 @@
+import multiprocessing
+import threading
+import time
+
+from packet_log import LogPosition, PacketLog, PacketLogReader, PacketWriter
+
+
+def read_all(reader, position=LogPosition()):
+    packets = []
+    while True:
+        batch, position = reader.read(position, limit=7)
+        if not batch:
+            return packets, position
+        packets.extend(batch)
+
+
+def test_reader_keeps_reading_segments_other_writers_left_open(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    monkeypatch.setattr("packet_log.os.getpid", lambda: 111)
+    first = PacketLog(root)
+    first.append({"n": 1})
+    monkeypatch.setattr("packet_log.os.getpid", lambda: 222)
+    second = PacketLog(root)
+    second.append({"n": 2})
+
+    reader = PacketLogReader(root)
+    packets, position = read_all(reader)
+    assert sorted(p["n"] for p in packets) == [1, 2]
+
+    # первый писатель всё ещё дописывает свой сегмент, хотя в корзине есть более поздний
+    first.append({"n": 3})
+    second.append({"n": 4})
+    packets, position = read_all(reader, position)
+    assert sorted(p["n"] for p in packets) == [3, 4]
+    assert read_all(reader, position)[0] == []
+
+
+def _write(root, worker, count):
+    log = PacketLog(root, max_segment_bytes=2048)
+    for i in range(count):
+        log.append({"worker": worker, "i": i})
+        time.sleep(0.001)
+    log.close()
+
+
+def test_concurrent_writer_processes(tmp_path):
+    root = str(tmp_path)
+    procs = [multiprocessing.Process(target=_write, args=(root, w, 200)) for w in range(3)]
+    for p in procs:
+        p.start()
+
+    reader = PacketLogReader(root)
+    seen = []
+    position = LogPosition()
+    while any(p.is_alive() for p in procs):
+        batch, position = reader.read(position, limit=50)
+        seen.extend(batch)
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+    seen.extend(read_all(reader, position)[0])
+
+    assert len(seen) == 600
+    assert len({(p["worker"], p["i"]) for p in seen}) == 600
+
+
+def test_writer_close_loses_no_concurrent_submits(tmp_path):
+    log = PacketLog(str(tmp_path))
+    writer = PacketWriter(log, max_queue=50, batch_size=10, flush_interval=0.01, echo_stdout=False)
+    writer.start()
+
+    def submit(t):
+        for n in range(200):
+            writer.submit({"t": t, "n": n})
+
+    threads = [threading.Thread(target=submit, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.005)
+    writer.close()
+    for thread in threads:
+        thread.join()
+    log.flush()
+
+    packets, _ = read_all(PacketLogReader(str(tmp_path)))
+    assert len(packets) == len({(p["t"], p["n"]) for p in packets}) == 800
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import preclassifier
+from packet_log import PacketLog
+from preclassifier import PreClassifier, build_datasets
+
+
+@pytest.mark.parametrize("text", [
+    "как защитить магазин от мошенников",
+    "как распознать фальшивые купюры на кассе",
+    "химчистка и отмывка ковров",
+    "установка взломостойких дверей",
+    "закладки для книг ручной работы",
+])
+def test_legal_texts_are_not_ruled_illegal(text):
+    assert PreClassifier().classify_business(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    "как платить зарплату сотрудникам без оформления",
+    "как продавать аккаунты соцсетей клиентам",
+    "кофейня у дома",
+])
+def test_business_keywords_alone_go_to_llm(text):
+    pre = PreClassifier()
+    assert pre.classify_question(text) is None
+    assert pre.classify_business(text) is None
+
+
+@pytest.mark.parametrize("text", [
+    "продажа наркотиков",
+    "взлом аккаунтов на заказ",
+    "отмывание денег через кофейню",
+    "как уменьшить налоги через фирму-однодневку",
+    "зарплата в конверте",
+])
+def test_illegal_rule(text):
+    assert PreClassifier().classify_question(text) == "ILLEGAL"
+
+
+def write_packets(data_dir, packets):
+    log = PacketLog(os.path.join(data_dir, "packets"))
+    for packet in packets:
+        log.append(packet)
+    log.flush()
+
+
+def test_eval_uses_saved_threshold_and_only_texts_newer_than_training(tmp_path, capsys):
+    data_dir, model = str(tmp_path), str(tmp_path / "model.json")
+    write_packets(data_dir, [
+        {"type": "business_profile", "business": "кофейня у дома", "timestamp": 100},
+        {"type": "rejected_business", "business_raw": "продаю наркотики", "reason": "ILLEGAL", "timestamp": 110},
+        {"type": "user_question", "question": "как посчитать себестоимость", "timestamp": 120},
+    ])
+    preclassifier.main(["train", "--data-dir", data_dir, "--model", model, "--threshold", "0.9"])
+    saved = PreClassifier.load(model)
+    assert (saved.threshold, saved.trained_until) == (0.9, 120)
+
+    write_packets(data_dir, [
+        {"type": "business_profile", "business": "кофейня у дома", "timestamp": 200},
+        {"type": "business_profile", "business": "пекарня в центре", "timestamp": 210},
+    ])
+    business, questions, latest = build_datasets(data_dir, newer_than=saved.trained_until)
+    assert (business, questions, latest) == ([("пекарня в центре", "OK")], [], 210)
+
+    capsys.readouterr()
+    preclassifier.main(["eval", "--data-dir", data_dir, "--model", model])
+    out = capsys.readouterr().out
+    assert "threshold=0.9" in out and "samples=1 " in out
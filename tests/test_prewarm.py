@@ -0,0 +1,95 @@
+from llm_gateway import LlmUnavailable
+from packet_log import PacketLog
+from prewarm import FaqPrewarmer
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def faqs_for(business):
+    return [{"q": f"Вопрос про {business}?", "a": "Ответ."}]
+
+
+def make(tmp_path, clock, generate=None, cache=None, **kwargs):
+    cache = {} if cache is None else cache
+    generated = []
+
+    def default_generate(business):
+        generated.append(business)
+        return faqs_for(business)
+
+    def install(business, faqs):
+        cache[business.lower()] = faqs
+        return True
+
+    prewarmer = FaqPrewarmer(
+        str(tmp_path / "packets"),
+        str(tmp_path / "prewarm.json"),
+        generate=generate or default_generate,
+        install=install,
+        cached=cache.get,
+        min_count=3,
+        per_minute=60000,
+        clock=clock,
+        **kwargs,
+    )
+    return prewarmer, cache, generated
+
+
+def observe(tmp_path, counts):
+    log = PacketLog(str(tmp_path / "packets"))
+    for business, n in counts.items():
+        for _ in range(n):
+            log.append({"type": "business_profile", "business": business})
+    log.close()
+
+
+def test_generates_popular_businesses_and_refreshes_stale_ones(tmp_path):
+    clock = Clock()
+    observe(tmp_path, {"Кофейня у дома": 5, "пекарня": 3, "шиномонтаж": 1})
+    prewarmer, cache, generated = make(tmp_path, clock, refresh_after=3600, half_life=0)
+
+    assert prewarmer.run_once() == 2
+    assert sorted(generated) == ["Кофейня у дома", "пекарня"]
+    assert cache["кофейня у дома"] == faqs_for("Кофейня у дома")
+    # второй проход: всё свежее — ничего не генерируем
+    assert prewarmer.run_once() == 0
+
+    clock.now += 3600
+    assert prewarmer.run_once() == 2
+    assert prewarmer.stats()["refreshed"] == 2
+
+
+def test_adopts_sets_already_in_cache_and_stops_when_llm_is_down(tmp_path):
+    clock = Clock()
+    observe(tmp_path, {"кофейня": 5, "пекарня": 4})
+    calls = []
+
+    def down(business):
+        calls.append(business)
+        raise LlmUnavailable()
+
+    prewarmer, cache, _ = make(tmp_path, clock, generate=down, cache={"кофейня": faqs_for("кофейня")})
+    assert prewarmer.run_once() == 0
+    stats = prewarmer.stats()
+    assert (stats["adopted"], stats["aborted"]) == (1, 1)
+    assert calls == ["пекарня"]
+
+
+def test_follower_installs_sets_from_the_leader_file(tmp_path):
+    clock = Clock()
+    observe(tmp_path, {"кофейня": 5})
+    leader, _, _ = make(tmp_path, clock)
+    leader.run_once()
+
+    follower, follower_cache, generated = make(tmp_path, clock)
+    assert follower.load() == 1
+    assert follower_cache["кофейня"] == faqs_for("кофейня")
+    # файл не менялся — повторно не читаем
+    assert follower.load() == 0
+    assert generated == []
@@ -0,0 +1,54 @@
+from prompt_budget import PromptBuilder, clip_to_tokens, count_tokens, fold_into_summary, message_tokens
+from session import Session
+
+HEAD = [{"role": "system", "content": "Ты помощник владельца микробизнеса."}]
+TAIL = [{"role": "user", "content": "Как поднять средний чек?"}]
+LONG_ANSWER = "1. **Посчитай** расходы на аренду и зарплаты. " + "Следующий шаг подробно описан здесь. " * 120
+
+
+def test_clip_keeps_whole_sentences_within_limit():
+    clipped = clip_to_tokens(LONG_ANSWER, 40)
+    assert count_tokens(clipped) <= 40
+    assert clipped.endswith("…") and clipped.startswith("1. **Посчитай**")
+    assert clip_to_tokens("Коротко.", 40) == "Коротко."
+
+
+def test_build_stays_within_budget_and_prefers_fresh_turns():
+    turns = [(f"вопрос {i}", LONG_ANSWER) for i in range(3)]
+    builder = PromptBuilder(budget=700, turn_max_tokens=300)
+    messages = builder.build(HEAD, turns, "— старый вопрос → старый ответ", TAIL)
+
+    assert message_tokens(messages) <= 700
+    assert messages[0] == HEAD[0] and messages[-1] == TAIL[0]
+    # самая свежая пара — последней перед вопросом, дословно (с обрезанным ответом)
+    assert messages[-3]["content"] == "Раньше владелец спрашивал: вопрос 2"
+    stats = builder.stats()
+    assert stats["over_budget"] == 0 and stats["summary_used"] == 1
+    assert stats["turns_verbatim"] >= 1 and stats["turns_verbatim"] + stats["turns_gist"] + stats["turns_dropped"] == 3
+
+
+def test_tight_budget_gists_then_drops_old_turns():
+    turns = [(f"вопрос {i}", LONG_ANSWER) for i in range(3)]
+    builder = PromptBuilder(budget=message_tokens(HEAD + TAIL) + 150, turn_max_tokens=300)
+    messages = builder.build(HEAD, turns, "", TAIL)
+    assert message_tokens(messages) <= builder.budget
+    stats = builder.stats()
+    assert stats["turns_verbatim"] == 0 and stats["turns_gist"] >= 1 and stats["turns_dropped"] >= 1
+
+
+def test_summary_folds_one_line_per_evicted_turn_and_drops_oldest():
+    summary = ""
+    for i in range(20):
+        summary = fold_into_summary(summary, f"вопрос номер {i}", LONG_ANSWER, max_tokens=200)
+    lines = summary.split("\n")
+    assert count_tokens(summary) <= 200
+    assert lines[-1].startswith("— вопрос номер 19 → 1. Посчитай")
+    assert "вопрос номер 0 " not in summary
+
+
+def test_session_folds_turns_pushed_out_of_history():
+    session = Session()
+    for i in range(session.history_size + 2):
+        session.add_history(f"вопрос {i}", f"ответ {i}.")
+    assert [q for q, _ in session.history] == [f"вопрос {i}" for i in range(2, session.history_size + 2)]
+    assert session.summary.split("\n") == ["— вопрос 0 → ответ 0.", "— вопрос 1 → ответ 1."]
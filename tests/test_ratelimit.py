@@ -0,0 +1,96 @@
+import pytest
+
+from ratelimit import OutboundLimiter
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Api:
+    def send_message(self, chat_id, text):
+        return text
+
+    def edit_message_caption(self, chat_id, caption):
+        return caption
+
+    def delete_message(self, chat_id, message_id):
+        return message_id
+
+
+def test_only_new_messages_in_private_chats_use_the_chat_bucket():
+    limiter = OutboundLimiter(global_rate=1000, global_burst=1000, chat_rate=1, chat_burst=1, clock=Clock())
+    api = Api()
+    assert limiter.paces_chat(5, api.send_message)
+    assert not limiter.paces_chat(5, api.edit_message_caption)
+    assert not limiter.paces_chat(5, api.delete_message)
+    assert not limiter.paces_chat(-100500, api.send_message)
+
+    # правки и удаления не тратят ведро чата: первое сообщение уходит без ожидания
+    for _ in range(5):
+        assert limiter.reserve(5, limiter.paces_chat(5, api.edit_message_caption)) == 0.0
+    assert limiter.reserve(5, limiter.paces_chat(5, api.send_message)) == 0.0
+    assert limiter.reserve(5, limiter.paces_chat(5, api.send_message)) == 1.0
+
+
+def test_chat_methods_none_paces_every_call():
+    limiter = OutboundLimiter(chat_methods=None, clock=Clock())
+    assert limiter.paces_chat(5, Api().delete_message)
+
+
+class TooManyRequests(Exception):
+    error_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Too Many Requests")
+        self.result_json = {"parameters": {"retry_after": retry_after}}
+
+
+def test_retry_after_pauses_the_chat_and_the_call_is_retried(monkeypatch):
+    clock = Clock()
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr("ratelimit.time.sleep", sleep)
+    limiter = OutboundLimiter(global_rate=1000, global_burst=1000, clock=clock)
+    answers = [TooManyRequests(7), "ok"]
+
+    def send_message(chat_id, text):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert limiter.call(5, send_message, 5, "hi") == "ok"
+    assert sleeps == [7.0]
+    assert limiter.snapshot()["rate_limited"] == 1 and limiter.snapshot()["retries"] == 1
+
+    # пауза после 429 касается только этого чата и любых вызовов в него
+    limiter.penalize(5, 3)
+    assert limiter.reserve(5, paced=False) == 3.0
+    assert limiter.reserve(6) == 0.0
+    # неизвестный чат — пауза всего бота
+    limiter.penalize(None, 2)
+    assert limiter.reserve(6) == 2.0
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("ratelimit.time.sleep", lambda seconds: setattr(clock, "now", clock.now + seconds))
+    limiter = OutboundLimiter(max_retries=2, clock=clock)
+    calls = []
+
+    def send_message(chat_id, text):
+        calls.append(text)
+        raise TooManyRequests(1)
+
+    with pytest.raises(TooManyRequests):
+        limiter.call(5, send_message, 5, "hi")
+    assert len(calls) == 3 and limiter.snapshot()["gave_up"] == 1
@@ -0,0 +1,36 @@
+import time
+
+import main
+
+
+def test_eviction_skips_busy_chats(monkeypatch):
+    monkeypatch.setattr(main, "SESSION_MAX_IN_MEMORY", 1)
+    monkeypatch.setattr(main, "chat_busy_checks", [lambda chat_id: chat_id == 1])
+    main.sessions.clear()
+    for chat_id in (1, 2, 3):
+        session = main.get_session(chat_id)
+        session["stage"] = f"stage-{chat_id}"
+        session.last_seen = time.time() - (120 if chat_id < 3 else 0)
+
+    main.evict_idle_sessions()
+
+    # 1 занят обработчиком, 2 выгружен по переполнению, 3 моложе SESSION_MIN_IDLE_SEC
+    assert list(main.sessions) == [1, 3]
+    assert main.session_store.load(2)["stage"] == "stage-2"
+    main.sessions.clear()
+
+
+def test_dispatcher_reports_busy_chats():
+    started, release = main.threading.Event(), main.threading.Event()
+
+    def handler(item):
+        started.set()
+        release.wait(5)
+
+    dispatcher = main.ChatDispatcher(handler, workers=1)
+    dispatcher.submit(7, "update")
+    started.wait(5)
+    assert dispatcher.busy(7) and not dispatcher.busy(8)
+    release.set()
+    dispatcher.close()
+    assert not dispatcher.busy(7)
@@ -0,0 +1,51 @@
+import queue
+from collections import Counter
+
+from sharding import HashRing, ShardedFront, chat_id_of, worker_names
+
+
+def test_resize_moves_about_one_nth_and_only_to_the_new_worker():
+    keys = range(20000)
+    for n in (2, 3, 4, 8):
+        before, after = HashRing(worker_names(n - 1)), HashRing(worker_names(n))
+        moved = [k for k in keys if before.node_for(k) != after.node_for(k)]
+        assert abs(len(moved) / len(keys) - 1 / n) < 0.05
+        # при добавлении воркера чаты переезжают только на него, не между старыми
+        assert {after.node_for(k) for k in moved} == {f"w{n - 1}"}
+
+
+def test_ring_spreads_chats_evenly():
+    ring = HashRing(worker_names(4))
+    counts = Counter(ring.node_for(k) for k in range(20000))
+    assert set(counts) == set(worker_names(4))
+    assert max(counts.values()) / min(counts.values()) < 1.5
+
+
+def message(update_id, chat_id):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": str(update_id)}}
+
+
+def test_chat_id_of_message_and_callback():
+    assert chat_id_of(message(1, 42)) == 42
+    assert chat_id_of({"update_id": 2, "callback_query": {"message": {"chat": {"id": 7}}}}) == 7
+    assert chat_id_of({"update_id": 3, "inline_query": {}}) is None
+
+
+def test_route_keeps_each_chat_on_one_worker_in_order():
+    front = ShardedFront(3)
+    front._inboxes = {node: queue.Queue() for node in front.nodes}
+    updates = [message(uid, chat_id) for uid in range(10) for chat_id in (101, 202, 303, 404)]
+    front.route(updates[:20], received_at=1.0)
+    front.route(updates[20:], received_at=2.0)
+
+    by_chat = {}
+    for node, inbox in front._inboxes.items():
+        while not inbox.empty():
+            kind, (batch, _received_at) = inbox.get()
+            assert kind == "updates"
+            for raw in batch:
+                by_chat.setdefault(chat_id_of(raw), []).append((node, raw["update_id"]))
+    for chat_id, routed in by_chat.items():
+        assert {node for node, _ in routed} == {front.ring.node_for(chat_id)}
+        assert [uid for _, uid in routed] == sorted(uid for _, uid in routed)
+    assert sum(front.routed.values()) == 40
@@ -0,0 +1,36 @@
+import pytest
+
+from similarity import SimilarityIndex
+
+
+@pytest.mark.parametrize("stored, query", [
+    ("магазин одежды в ТЦ", "магазин обуви в ТЦ"),
+    ("доставка пиццы", "доставка суши"),
+    ("продажа одежды на маркетплейсе", "продажа косметики на маркетплейсе"),
+    ("детская одежда на маркетплейсе", "женская одежда на маркетплейсе"),
+    ("магазин одежды", "магазин"),
+    ("доставка пиццы", "доставка пиццы и суши"),
+    ("кофейня у дома", "хочу закрыть кофейню у дома"),
+    ("кофейня у дома", "неофициальная кофейня у дома"),
+    ("законный магазин", "незаконный магазин"),
+    ("маленькая кофейня у дома", "уютная кофейня у дома"),
+    ("кофейня у дома", "маленькая уютная кофейня у дома"),
+])
+def test_different_businesses_do_not_match(stored, query):
+    index = SimilarityIndex()
+    index.add("k", stored)
+    assert index.query(query) is None
+
+
+@pytest.mark.parametrize("stored, query", [
+    ("кофейня у дома", "кофейня возле дома"),
+    ("кофейня у дома", "Кофейни у дома"),
+    ("кофейня у дома", "хочу открыть кофейню у дома"),
+    ("продажа на маркетплейсе", "продажи на маркетплейсах"),
+    ("кофейня у дома", "маленькая кофейня у дома"),
+    ("маленькая кофейня у дома", "кофейня возле дома"),
+])
+def test_rewordings_match(stored, query):
+    index = SimilarityIndex()
+    index.add("k", stored)
+    assert index.query(query) == ("k", 1.0)
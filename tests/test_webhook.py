@@ -0,0 +1,77 @@
+import json
+import time
+import socket
+
+import pytest
+
+from webhook import SECRET_HEADER, WebhookServer, post_update
+
+
+@pytest.fixture
+def server():
+    received = []
+    srv = WebhookServer(lambda updates, received_at: received.extend(updates), port=0, secret_token="s3cr3t")
+    srv.received = received
+    srv.start()
+    yield srv
+    srv.stop()
+
+
+def raw_post(port, secret_header: bytes) -> bytes:
+    body = json.dumps({"update_id": 1}).encode()
+    request = (
+        b"POST /telegram/webhook HTTP/1.1\r\nHost: x\r\nConnection: close\r\n"
+        + SECRET_HEADER.encode() + b": " + secret_header + b"\r\n"
+        + b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+    )
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(request)
+        return sock.recv(1024)
+
+
+def test_requires_secret():
+    with pytest.raises(ValueError):
+        WebhookServer(lambda updates, received_at: None, port=0)
+
+
+def test_binds_loopback_by_default(server):
+    assert server.httpd.server_address[0] == "127.0.0.1"
+
+
+def test_secret_check(server):
+    url = f"http://127.0.0.1:{server.port}/telegram/webhook"
+    assert post_update(url, {"update_id": 1}, "wrong") == 403
+    assert raw_post(server.port, "секрет".encode("utf-8")).startswith(b"HTTP/1.1 403")
+    assert post_update(url, {"update_id": 2}, "s3cr3t") == 200
+    # апдейты уходят в on_updates уже после ответа 200
+    deadline = time.monotonic() + 5
+    while not server.received and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [u["update_id"] for u in server.received] == [2]
+    assert server.stats["rejected_secret"] == 2
+
+
+def test_rejected_body_is_not_parsed_as_next_request(server):
+    # тело отвергнутого запроса само похоже на запрос с верным секретом
+    smuggled = (
+        b"POST /telegram/webhook HTTP/1.1\r\nHost: x\r\n"
+        + SECRET_HEADER.encode() + b": s3cr3t\r\n"
+        + b'Content-Length: 15\r\n\r\n{"update_id":9}'
+    )
+    request = (
+        b"POST /telegram/webhook HTTP/1.1\r\nHost: x\r\n"
+        + SECRET_HEADER.encode() + b": wrong\r\n"
+        + b"Content-Length: " + str(len(smuggled)).encode() + b"\r\n\r\n" + smuggled
+    )
+    response = b""
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as sock:
+        sock.sendall(request)
+        while True:
+            chunk = sock.recv(1024)
+            if not chunk:
+                break
+            response += chunk
+    assert response.count(b"HTTP/1.1") == 1 and response.startswith(b"HTTP/1.1 403")
+    assert b"Connection: close" in response
+    time.sleep(0.1)
+    assert server.received == [] and server.stats["requests"] == 1
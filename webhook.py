@@ -0,0 +1,197 @@
+"""
+Приём апдейтов Telegram вебхуком: локальный HTTP-сервер на stdlib.
+
+Сервер проверяет X-Telegram-Bot-Api-Secret-Token, сразу отвечает 200
+и отдаёт разобранные апдейты в on_updates (в main.py — dispatch_updates,
+которая только раскладывает их по очередям чатов). Без секрета сервер не
+стартует: иначе любой, кто достучится до порта, пришлёт апдейт от имени
+любого чата. По умолчанию слушает только 127.0.0.1 (снаружи — через прокси).
+
+Проверить локально — отправить записанные апдейты (JSON на строку):
+
+    python webhook.py replay updates.jsonl --url http://127.0.0.1:8080/telegram/webhook --secret s3cr3t
+"""
+import sys
+import hmac
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Bot API шлёт апдейты по одному; с запасом на пачку при ручном replay
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class WebhookServer:
+    """
+    ThreadingHTTPServer, принимающий POST на path.
+
+    on_updates(list_of_json_dicts, received_at) вызывается после ответа 200,
+    received_at — time.monotonic() момента приёма запроса.
+    """
+
+    def __init__(
+        self,
+        on_updates: Callable[[List[Dict[str, Any]], float], None],
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        path: str = "/telegram/webhook",
+        secret_token: str = "",
+    ) -> None:
+        if not secret_token:
+            raise ValueError("webhook: нужен secret_token (WEBHOOK_SECRET), без него апдейты можно подделать")
+        self.on_updates = on_updates
+        self.path = path
+        self.secret_token = secret_token.encode("utf-8")
+
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "updates": 0,
+            "rejected_secret": 0,
+            "bad_requests": 0,
+            "not_found": 0,
+            "handoff_errors": 0,
+        }
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, code: int) -> None:
+                self.send_response(code)
+                self.send_header("Content-Length", "0")
+                if code != 200:
+                    # тело запроса могло остаться непрочитанным — иначе его остаток
+                    # разобрали бы как следующий запрос на этом же соединении
+                    self.send_header("Connection", "close")
+                    self.close_connection = True
+                self.end_headers()
+
+            def do_POST(self) -> None:
+                received_at = time.monotonic()
+                server._count("requests")
+                if self.path.split("?", 1)[0] != server.path:
+                    server._count("not_found")
+                    return self._reply(404)
+                # сравниваем байты: str с не-ASCII символами compare_digest не принимает
+                given = self.headers.get(SECRET_HEADER, "").encode("utf-8", "replace")
+                if not hmac.compare_digest(given, server.secret_token):
+                    server._count("rejected_secret")
+                    return self._reply(403)
+
+                try:
+                    length = int(self.headers.get("Content-Length", "0"))
+                except ValueError:
+                    length = -1
+                if length <= 0 or length > MAX_BODY_BYTES:
+                    server._count("bad_requests")
+                    return self._reply(400)
+                try:
+                    data = json.loads(self.rfile.read(length))
+                except ValueError:
+                    server._count("bad_requests")
+                    return self._reply(400)
+                updates = data if isinstance(data, list) else [data]
+                if not all(isinstance(u, dict) and "update_id" in u for u in updates):
+                    server._count("bad_requests")
+                    return self._reply(400)
+
+                # сначала отвечаем Telegram, потом отдаём апдейты дальше
+                self._reply(200)
+                server._count("updates", len(updates))
+                try:
+                    server.on_updates(updates, received_at)
+                except Exception:
+                    server._count("handoff_errors")
+
+            def do_GET(self) -> None:
+                server._count("not_found")
+                self._reply(404)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.serve_forever, name="webhook-server", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# === replay: отправить записанные апдейты на локальный вебхук ===
+
+def post_update(url: str, update: Dict[str, Any], secret: str, timeout: float = 10.0) -> int:
+    body = json.dumps(update, ensure_ascii=False).encode("utf-8")
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        SECRET_HEADER: secret,
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def replay(args: argparse.Namespace) -> None:
+    with open(args.file, "r", encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    codes: Dict[int, int] = {}
+    samples: List[float] = []
+    for update in updates:
+        t0 = time.perf_counter()
+        code = post_update(args.url, update, args.secret)
+        samples.append((time.perf_counter() - t0) * 1000)
+        codes[code] = codes.get(code, 0) + 1
+    samples.sort()
+    p50 = samples[len(samples) // 2] if samples else 0.0
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] if samples else 0.0
+    print(f"posted {len(updates)} updates, status codes {codes}, ack p50={p50:.2f}ms p99={p99:.2f}ms")
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("replay", help="отправить апдейты из JSONL-файла на вебхук")
+    p.add_argument("file")
+    p.add_argument("--url", default="http://127.0.0.1:8080/telegram/webhook")
+    p.add_argument("--secret", default="")
+    p.set_defaults(func=replay)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])